@@ -0,0 +1,187 @@
+"""
+Calibrate and evaluate the blendshape emotion classifier.
+
+    extract   run the face landmarker over a labelled image folder
+              (DATASET/<label>/*.jpg) and save blendshapes, labels and the
+              landmark-heuristic baseline to an .npz
+    fit       fit softmax-regression weights on an .npz, report held-out
+              metrics, and write a weights file (emotion_weights.json format)
+    evaluate  score a weights file and the landmark heuristics on an .npz
+
+Usage (from backend/):
+    python -m benchmarks.emotion_calibration extract ~/data/classroom faces.npz
+    python -m benchmarks.emotion_calibration extract ~/data/fer2013/train fer.npz --label-map fer
+    python -m benchmarks.emotion_calibration fit faces.npz --out core/emotion_weights.json
+    python -m benchmarks.emotion_calibration evaluate faces.npz --weights core/emotion_weights.json
+"""
+import argparse
+import os
+
+import numpy as np
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+# Dataset folder name -> classifier label (folders not listed are skipped)
+LABEL_MAPS = {
+    'identity': None,
+    # FER-2013 has no engaged/bored/confused classes; these are the closest proxies
+    'fer': {'happy': 'happy', 'surprise': 'surprised', 'neutral': 'neutral',
+            'sad': 'bored', 'angry': 'confused', 'disgust': 'confused'},
+}
+MIN_SIDE = 256  # the landmarker misses faces in tiny crops such as FER's 48x48
+
+def extract(args):
+    import cv2
+    import mediapipe as mp
+    from core.emotion_detector_v2 import MediaPipeEmotionDetector
+
+    detector = MediaPipeEmotionDetector()
+    if detector.detector is None:
+        raise SystemExit("MediaPipe model unavailable")
+    label_map = LABEL_MAPS[args.label_map]
+    X, y, heuristic, paths = [], [], [], []
+    missed = 0
+    for folder in sorted(os.listdir(args.dataset)):
+        label = folder if label_map is None else label_map.get(folder)
+        folder_path = os.path.join(args.dataset, folder)
+        if label is None or not os.path.isdir(folder_path):
+            continue
+        files = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(IMAGE_EXTS))
+        if args.per_class:
+            files = files[:args.per_class]
+        for name in files:
+            image = cv2.imread(os.path.join(folder_path, name))
+            if image is None:
+                continue
+            scale = MIN_SIDE / min(image.shape[:2])
+            if scale > 1:
+                image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            result = detector.detector.detect(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb))
+            if not result.face_blendshapes:
+                missed += 1
+                continue
+            h, w = image.shape[:2]
+            points = np.array([(lm.x * w, lm.y * h) for lm in result.face_landmarks[0]])
+            X.append([b.score for b in result.face_blendshapes[0]])
+            y.append(label)
+            heuristic.append(detector._extract_emotion_from_points(points)['emotion'])
+            paths.append(os.path.join(folder, name))
+        print(f"{folder:>12} -> {label:<10} {sum(1 for l in y if l == label)} faces")
+    np.savez_compressed(args.output, X=np.array(X, dtype=np.float32), y=np.array(y),
+                        heuristic=np.array(heuristic), paths=np.array(paths))
+    print(f"Saved {len(y)} samples to {args.output} ({missed} images without a detected face)")
+
+def fit_softmax(X, y_idx, n_classes, l2=1e-3, epochs=3000, lr=0.5, init=None):
+    """Class-balanced L2-regularized softmax regression by full-batch gradient descent."""
+    n, d = X.shape
+    W = np.zeros((n_classes, d)) if init is None else init[0].astype(np.float64).copy()
+    b = np.zeros(n_classes) if init is None else init[1].astype(np.float64).copy()
+    counts = np.bincount(y_idx, minlength=n_classes)
+    sample_w = (n / (n_classes * np.maximum(counts, 1)))[y_idx]
+    onehot = np.eye(n_classes)[y_idx]
+    for _ in range(epochs):
+        logits = X @ W.T + b
+        logits -= logits.max(axis=1, keepdims=True)
+        p = np.exp(logits)
+        p /= p.sum(axis=1, keepdims=True)
+        g = (p - onehot) * sample_w[:, None] / n
+        W -= lr * (g.T @ X + l2 * W)
+        b -= lr * g.sum(axis=0)
+    return W, b
+
+def report(name, y_true, y_pred, labels):
+    """Print accuracy, macro F1, per-class P/R and the confusion matrix."""
+    index = {l: i for i, l in enumerate(labels)}
+    cm = np.zeros((len(labels), len(labels)), dtype=int)
+    for t, p in zip(y_true, y_pred):
+        if t in index and p in index:
+            cm[index[t], index[p]] += 1
+    support = np.array([(np.asarray(y_true) == l).sum() for l in labels])
+    tp = np.diag(cm)
+    precision = tp / np.maximum(cm.sum(axis=0), 1)
+    recall = tp / np.maximum(support, 1)
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-9)
+    accuracy = float(np.mean(np.asarray(y_true) == np.asarray(y_pred)))
+    present = support > 0
+    print(f"\n{name}: accuracy {accuracy:.3f}   macro F1 {f1[present].mean():.3f}")
+    print(f"{'':>12} {'prec':>6} {'recall':>6} {'n':>6}   confusion (rows = truth)")
+    for i, l in enumerate(labels):
+        print(f"{l:>12} {precision[i]:6.2f} {recall[i]:6.2f} {support[i]:6d}   " + " ".join(f"{c:5d}" for c in cm[i]))
+    return {'accuracy': accuracy, 'macro_f1': float(f1[present].mean())}
+
+def _split(y, holdout, seed=0):
+    rng = np.random.default_rng(seed)
+    test = np.zeros(len(y), dtype=bool)
+    for label in np.unique(y):
+        idx = np.flatnonzero(y == label)
+        rng.shuffle(idx)
+        test[idx[:int(round(len(idx) * holdout))]] = True
+    return ~test, test
+
+def fit(args):
+    from core.blendshape_emotion import BlendshapeEmotionClassifier, save_weights, DEFAULT_WEIGHTS
+
+    data = np.load(args.data)
+    X, y = data['X'].astype(np.float64), data['y']
+    prior = BlendshapeEmotionClassifier(DEFAULT_WEIGHTS)
+    labels = list(prior.labels) + sorted(set(y) - set(prior.labels))
+    y_idx = np.array([labels.index(l) for l in y])
+    init = None
+    if labels == list(prior.labels) and not args.from_scratch:
+        init = (prior.weights, prior.bias)
+
+    if args.holdout > 0:
+        train, test = _split(y, args.holdout)
+        W, b = fit_softmax(X[train], y_idx[train], len(labels), args.l2, args.epochs, init=init)
+        pred = np.array(labels)[(X[test] @ W.T + b).argmax(axis=1)]
+        report("fitted (held out)", y[test], pred, labels)
+        report("current weights (held out)", y[test], np.array(prior.labels)[prior.predict_proba(X[test]).argmax(axis=1)], labels)
+        report("landmark heuristics (held out)", y[test], data['heuristic'][test], labels)
+
+    # Final weights use every sample
+    W, b = fit_softmax(X, y_idx, len(labels), args.l2, args.epochs, init=init)
+    save_weights(args.out, labels, W, b, source=f"fit on {os.path.basename(args.data)} ({len(y)} samples, l2={args.l2})")
+    print(f"\nWrote {args.out}")
+
+def evaluate(args):
+    from core.blendshape_emotion import BlendshapeEmotionClassifier
+
+    data = np.load(args.data)
+    classifier = BlendshapeEmotionClassifier(args.weights)
+    labels = list(classifier.labels)
+    pred = np.array(labels)[classifier.predict_proba(data['X']).argmax(axis=1)]
+    report(f"blendshapes ({os.path.basename(args.weights)})", data['y'], pred, labels)
+    report("landmark heuristics", data['y'], data['heuristic'], labels)
+
+def main():
+    from core.blendshape_emotion import DEFAULT_WEIGHTS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ex = sub.add_parser("extract")
+    ex.add_argument("dataset")
+    ex.add_argument("output")
+    ex.add_argument("--label-map", choices=sorted(LABEL_MAPS), default="identity")
+    ex.add_argument("--per-class", type=int, help="cap images per folder")
+    ex.set_defaults(func=extract)
+
+    ft = sub.add_parser("fit")
+    ft.add_argument("data")
+    ft.add_argument("--out", default="emotion_weights.json")
+    ft.add_argument("--l2", type=float, default=1e-3)
+    ft.add_argument("--epochs", type=int, default=3000)
+    ft.add_argument("--holdout", type=float, default=0.2, help="fraction held out for the report (0 to skip)")
+    ft.add_argument("--from-scratch", action="store_true", help="don't start from the current weights")
+    ft.set_defaults(func=fit)
+
+    ev = sub.add_parser("evaluate")
+    ev.add_argument("data")
+    ev.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    ev.set_defaults(func=evaluate)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Deterministic inputs for the benchmarks: classroom frames rendered from the
+face fixture, synthetic detections built from a landmark template (no model
+needed), and a seeded metrics database.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FRAME_SIZE = (640, 480)
+EMOTIONS = ['engaged', 'neutral', 'happy', 'bored', 'surprised', 'confused']
+
+def load_face():
+    # Head-and-shoulders crop of NASA's public-domain astronaut portrait
+    return cv2.imread(os.path.join(FIXTURES_DIR, "face.jpg"))
+
+def load_landmark_template():
+    """478 FaceLandmarker points normalized to the face's bounding box (0-1)."""
+    return np.load(os.path.join(FIXTURES_DIR, "face_landmarks.npy")).astype(np.float32)
+
+def _face_slots(n_faces, size, face_size):
+    # Evenly spread faces over a grid that fits the frame
+    w, h = size
+    fw, fh = face_size
+    cols = max(1, int(np.ceil(np.sqrt(n_faces * w / h))))
+    rows = int(np.ceil(n_faces / cols))
+    xs = np.linspace(0, max(0, w - fw), cols)
+    ys = np.linspace(0, max(0, h - fh), max(rows, 1))
+    return [(int(xs[i % cols]), int(ys[i // cols])) for i in range(n_faces)]
+
+def classroom_frames(n_frames, n_faces=4, size=FRAME_SIZE, face_scale=0.8, seed=0):
+    """
+    Frames with n_faces copies of the fixture face drifting slowly, as a
+    seated class would. Returns (frames, ground_truth_boxes_per_frame).
+    """
+    rng = np.random.default_rng(seed)
+    face = load_face()
+    fh, fw = int(face.shape[0] * face_scale), int(face.shape[1] * face_scale)
+    face = cv2.resize(face, (fw, fh))
+    w, h = size
+    slots = _face_slots(n_faces, size, (fw, fh))
+    phases = rng.uniform(0, 2 * np.pi, size=n_faces)
+
+    frames, truth = [], []
+    background = np.full((h, w, 3), (90, 110, 130), np.uint8)
+    for f in range(n_frames):
+        frame = background.copy()
+        boxes = []
+        for (x, y), phase in zip(slots, phases):
+            dx = int(6 * np.sin(f / 15.0 + phase))
+            dy = int(3 * np.cos(f / 20.0 + phase))
+            x0 = min(max(0, x + dx), w - fw)
+            y0 = min(max(0, y + dy), h - fh)
+            frame[y0:y0 + fh, x0:x0 + fw] = face
+            boxes.append((x0, y0, fw, fh))
+        frames.append(frame)
+        truth.append(boxes)
+    return frames, truth
+
+def lecture_hall_frame(rows=5, seats=10, size=(1920, 1080), front_scale=0.8, back_scale=0.3, seed=0):
+    """
+    One wide frame of a tiered hall: rows of fixture faces, smaller towards
+    the back (top of the frame). Returns (frame, ground-truth [x, y, w, h] boxes).
+    """
+    rng = np.random.default_rng(seed)
+    source = load_face()
+    w, h = size
+    frame = np.full((h, w, 3), (90, 110, 130), np.uint8)
+    scales = np.linspace(back_scale, front_scale, rows)
+    heights = (source.shape[0] * scales).astype(int)
+    # Rows spread over the whole height, front row at the bottom edge
+    gap = (h - heights.sum()) / max(rows - 1, 1)
+    boxes = []
+    y = 0.0
+    for scale, fh in zip(scales, heights):
+        fw = int(source.shape[1] * scale)
+        face = cv2.resize(source, (fw, fh), interpolation=cv2.INTER_AREA)
+        xs = np.linspace(0, w - fw, seats) + rng.uniform(-0.15, 0.15, seats) * (w / seats - fw)
+        top = min(int(y), h - fh)
+        for x in np.clip(xs, 0, w - fw).astype(int):
+            frame[top:top + fh, x:x + fw] = face
+            boxes.append((int(x), top, fw, fh))
+        y += fh + gap
+    return frame, boxes
+
+def recorded_frames(path, limit=300, size=FRAME_SIZE):
+    """Frames from a video file, resized to the pipeline's working size."""
+    cap = cv2.VideoCapture(path)
+    frames = []
+    try:
+        while len(frames) < limit:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(cv2.resize(frame, size))
+    finally:
+        cap.release()
+    return frames
+
+def synthetic_landmarks(n_faces, size=FRAME_SIZE, seed=0, jitter=0.01):
+    """(n_faces, 478, 2) pixel landmarks placed on a grid, with per-face noise."""
+    rng = np.random.default_rng(seed)
+    template = load_landmark_template()
+    w, h = size
+    face_w, face_h = w / 6, h / 4
+    out = np.empty((n_faces, template.shape[0], 2), dtype=np.float32)
+    for i, (x, y) in enumerate(_face_slots(n_faces, size, (face_w, face_h))):
+        noise = rng.normal(0, jitter, size=template.shape)
+        out[i] = (template + noise) * (face_w, face_h) + (x, y)
+    return out
+
+def synthetic_detections(n_frames, n_faces=8, size=FRAME_SIZE, seed=0, occlusion=0.0):
+    """
+    Per-frame detection lists in MediaPipeEmotionDetector.detect() format.
+    Faces sway independently; with occlusion > 0 each face is hidden for
+    bursts of frames (someone leaning in front, head down), roughly that
+    fraction of the time.
+    """
+    from core.emotion_detector_v2 import EmotionResult
+
+    rng = random.Random(seed)
+    base = synthetic_landmarks(n_faces, size, seed)
+    phases = [rng.uniform(0, 2 * np.pi) for _ in range(n_faces)]
+    hidden_until = [-1] * n_faces
+    mean_burst = 15
+    frames = []
+    for f in range(n_frames):
+        dets = []
+        for i in range(n_faces):
+            if f < hidden_until[i]:
+                continue
+            if occlusion and rng.random() < occlusion / mean_burst:
+                hidden_until[i] = f + int(rng.expovariate(1 / mean_burst)) + 1
+                continue
+            drift = np.array([3 * np.sin(f / 15.0 + phases[i]), 2 * np.cos(f / 20.0 + phases[i])], dtype=np.float32)
+            points = base[i] + drift
+            x0, y0 = points.min(axis=0)
+            x1, y1 = points.max(axis=0)
+            label = rng.choice(EMOTIONS)
+            dets.append({
+                'bbox': [int(x0), int(y0), int(x1 - x0), int(y1 - y0)],
+                'emotion': EmotionResult(emotion=label, confidence=0.85, explanation='synthetic'),
+                'landmarks': points
+            })
+        frames.append(dets)
+    return frames
+
+class SyntheticDetector:
+    """Drop-in for MediaPipeEmotionDetector that replays precomputed detections."""
+    def __init__(self, detections):
+        self.detections = detections
+        self._i = 0
+
+    def detect(self, frame):
+        dets = self.detections[self._i % len(self.detections)]
+        self._i += 1
+        return dets
+
+class FakeTrack:
+    """Minimal stand-in for a deep-sort-realtime Track."""
+    def __init__(self, track_id, ltrb):
+        self.track_id = track_id
+        self._ltrb = ltrb
+        self.time_since_update = 0
+
+    def is_confirmed(self):
+        return True
+
+    def to_ltrb(self):
+        return self._ltrb
+
+def seed_database(sessions=20, people=30, samples_per_person=200, seed=0):
+    """
+    Fill the configured database (ATTENDANCE_DB_URL) with completed sessions
+    and person_metrics rows. Returns the list of session ids.
+    """
+    from core.database import engine, init_db, Session as SessionModel, SessionPerson, PersonMetric
+
+    init_db()
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 5, 9, 0, 0)
+    session_ids = []
+    with engine.begin() as conn:
+        for s in range(sessions):
+            t0 = start + timedelta(days=s)
+            result = conn.execute(SessionModel.__table__.insert().values(
+                teacher_id=f"T{s % 3}", class_id=f"C{s % 5}", start_time=t0,
+                end_time=t0 + timedelta(seconds=2 * samples_per_person),
+                people_count=people, total_attention_avg=0.0, status="completed"
+            ))
+            sid = result.inserted_primary_key[0]
+            session_ids.append(sid)
+            rows = []
+            for i in range(samples_per_person):
+                ts = t0 + timedelta(seconds=2 * i)
+                for p in range(people):
+                    emotion = rng.choice(EMOTIONS)
+                    rows.append({
+                        'session_id': sid, 'person_id': str(p + 1), 'timestamp': ts,
+                        'emotion': emotion, 'emotion_confidence': 0.85,
+                        'attention_score': 30.0 if emotion == 'bored' else rng.uniform(50, 100)
+                    })
+            conn.execute(PersonMetric.__table__.insert(), rows)
+            conn.execute(SessionPerson.__table__.insert(), [{
+                'session_id': sid, 'person_id': str(p + 1),
+                'total_time_present': 2.0 * samples_per_person,
+                'avg_attention': rng.uniform(50, 95), 'dominant_emotion': rng.choice(EMOTIONS)
+            } for p in range(people)])
+    return session_ids
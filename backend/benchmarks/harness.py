@@ -0,0 +1,57 @@
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+
+def measure(fn, iterations, warmup=3, memory_iterations=3):
+    """
+    Time fn(i) for i in range(iterations) after a short warm-up.
+    Peak memory is measured on a separate, shorter pass so tracemalloc's
+    overhead doesn't skew the latency numbers. It covers Python-level
+    allocations (including NumPy buffers), not native model memory.
+    """
+    for i in range(warmup):
+        fn(i)
+
+    gc.collect()
+    latencies = np.empty(iterations)
+    start = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies[i] = time.perf_counter() - t0
+    total = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    for i in range(min(memory_iterations, iterations)):
+        fn(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'throughput_per_s': round(iterations / total, 2) if total > 0 else None,
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+        'mean_ms': round(float(latencies.mean()) * 1000, 3),
+        'peak_mem_kb': round(peak / 1024, 1),
+    }
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Flag cases whose p50 latency grew, or throughput shrank, by more than
+    tolerance relative to the baseline. Returns [(case, message)].
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base or 'error' in current or 'error' in base:
+            continue
+        if base['p50_ms'] and current['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+            regressions.append((name, f"p50 {base['p50_ms']:.3f} -> {current['p50_ms']:.3f} ms"))
+        if base.get('throughput_per_s') and current.get('throughput_per_s') is not None \
+                and current['throughput_per_s'] < base['throughput_per_s'] / (1 + tolerance):
+            regressions.append((name, f"throughput {base['throughput_per_s']} -> {current['throughput_per_s']} /s"))
+    return regressions
@@ -0,0 +1,288 @@
+"""
+Synthetic classroom load generator for capacity planning.
+
+Drives a running backend with N simulated cameras x M students over
+/ws/ingest/{room_id} plus N audio streams over /ws/audio (each bound to a
+room's session by room_id), ramping the room
+count step by step. Each step reports end-to-end frame latency, dropped
+frames, DB write throughput and CPU per room (scraped from /metrics), and
+the run ends with the saturation point: the last room count that stayed
+within the latency budget, drop rate and frame rate targets.
+
+Camera modes:
+    detections  synthetic faces with per-student motion and occlusion bursts,
+                sent as boxes (exercises tracking, scoring and DB writes)
+    jpeg        rendered classroom frames or a recorded video, sent as JPEG
+                (adds decode and the face/emotion model)
+
+Usage (server running, from backend/):
+    python -m benchmarks.loadgen --rooms 1,2,4,8 --students 25
+    python -m benchmarks.loadgen --mode jpeg --video lecture.mp4 --rooms 1,2,3
+    python -m benchmarks.loadgen --rooms 1,4,16 --duration 30 --json load.json
+
+Point the server at a throwaway database (ATTENDANCE_DB_URL) when running
+this, every room records a real session. To compare in-process inference
+with worker processes, run jpeg mode against servers started with and
+without INFERENCE_WORKERS; CPU per room then only covers the API process.
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+import urllib.request
+
+import numpy as np
+import websockets
+
+AUDIO_RATE = 16000
+AUDIO_CHUNK = 4096  # what the dashboard's ScriptProcessor sends
+
+_METRIC_LINE = re.compile(r'^([a-zA-Z_:][\w:]*)(\{[^}]*\})?\s+(\S+)$')
+
+def scrape(base_url):
+    """Sum each metric family across labels: {name: value}."""
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as resp:
+        text = resp.read().decode()
+    totals = {}
+    for line in text.splitlines():
+        m = _METRIC_LINE.match(line)
+        if m:
+            totals[m.group(1)] = totals.get(m.group(1), 0.0) + float(m.group(3))
+    return totals
+
+def detection_messages(n_frames, students, seed, occlusion, size):
+    """Pre-serialized detections-mode payloads, '{seq}' is filled in at send time."""
+    from .fixtures import synthetic_detections
+
+    frames = synthetic_detections(n_frames, n_faces=students, size=size, seed=seed, occlusion=occlusion)
+    payloads = []
+    for dets in frames:
+        body = json.dumps([{'bbox': d['bbox'], 'emotion': d['emotion'].emotion,
+                            'confidence': d['emotion'].confidence} for d in dets])
+        payloads.append('{"seq": %d, "detections": ' + body + '}')
+    return payloads
+
+def jpeg_frames(n_frames, students, seed, video, size):
+    import cv2
+    from .fixtures import classroom_frames, recorded_frames
+
+    if video:
+        frames = recorded_frames(video, limit=n_frames, size=size)
+    else:
+        frames, _ = classroom_frames(n_frames, n_faces=students, size=size, seed=seed)
+    return [cv2.imencode(".jpg", f, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes() for f in frames]
+
+class RoomStats:
+    def __init__(self):
+        self.sent = 0
+        self.replied = 0
+        self.server_dropped = 0
+        self.latencies = []
+        self.errors = 0
+        self.ready = asyncio.Event()  # set once the room is open on the server
+
+async def run_room(ws_url, room_id, args, inputs, stats):
+    from core.ingest import SEQ_HEADER
+
+    sent_at = {}
+    config = {'mode': args.mode, 'width': args.width, 'height': args.height,
+              'session': True, 'teacher_id': 'loadgen', 'class_id': room_id}
+    interval = 1.0 / args.fps
+    try:
+        async with websockets.connect(f"{ws_url}/ws/ingest/{room_id}", max_size=None) as ws:
+            await ws.send(json.dumps(config))
+            # Untimed first frame: absorbs session creation and model warm-up
+            await ws.send(SEQ_HEADER.pack(0) + inputs[0] if args.mode == "jpeg" else inputs[0] % 0)
+            await ws.recv()
+            stats.ready.set()
+            stop_at = time.perf_counter() + args.duration
+
+            async def receive():
+                async for message in ws:
+                    reply = json.loads(message)
+                    t0 = sent_at.pop(reply.get('seq'), None)
+                    if t0 is not None:
+                        stats.latencies.append((time.perf_counter() - t0) * 1000)
+                    stats.replied += 1
+                    stats.server_dropped = reply.get('dropped', stats.server_dropped)
+
+            receiver = asyncio.create_task(receive())
+            next_send = time.perf_counter()
+            seq = 1
+            while time.perf_counter() < stop_at:
+                item = inputs[seq % len(inputs)]
+                sent_at[seq] = time.perf_counter()
+                if args.mode == "jpeg":
+                    await ws.send(SEQ_HEADER.pack(seq) + item)
+                else:
+                    await ws.send(item % seq)
+                stats.sent += 1
+                seq += 1
+                next_send += interval
+                await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+            # Let in-flight frames come back before closing
+            drain_until = time.perf_counter() + args.drain
+            while sent_at and time.perf_counter() < drain_until and stats.replied + stats.server_dropped < stats.sent:
+                await asyncio.sleep(0.05)
+            receiver.cancel()
+    except Exception as e:
+        stats.errors += 1
+        print(f"  room {room_id}: {e}")
+
+async def run_audio(ws_url, stop_at, counts, room_id, ready):
+    rng = np.random.default_rng()
+    period = AUDIO_CHUNK / AUDIO_RATE
+    try:
+        await asyncio.wait_for(ready.wait(), timeout=max(0.0, stop_at - time.perf_counter()))
+        async with websockets.connect(f"{ws_url}/ws/audio") as ws:
+            await ws.send(json.dumps({'encoding': 'f32le', 'sample_rate': AUDIO_RATE,
+                                      'channels': 1, 'room_id': room_id}))
+            async def receive():
+                async for message in ws:
+                    if json.loads(message).get('type') != 'format':
+                        counts['audio_replies'] += 1
+            receiver = asyncio.create_task(receive())
+            next_send = time.perf_counter()
+            t = 0
+            while time.perf_counter() < stop_at:
+                # Speech-like burst every few seconds over room noise
+                amp = 0.2 if (t // 12) % 3 == 0 else 0.01
+                await ws.send(rng.normal(0, amp, AUDIO_CHUNK).astype(np.float32).tobytes())
+                counts['audio_sent'] += 1
+                t += 1
+                next_send += period
+                await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+            receiver.cancel()
+    except Exception as e:
+        counts['audio_errors'] += 1
+        print(f"  audio stream ({room_id}): {e!r}")
+
+async def run_step(args, rooms, inputs, step):
+    ws_url = args.url.replace("http", "ws", 1)
+    before = await asyncio.to_thread(scrape, args.url)
+    start = time.perf_counter()
+    stop_at = start + args.duration
+    stats = [RoomStats() for _ in range(rooms)]
+    counts = {'audio_sent': 0, 'audio_replies': 0, 'audio_errors': 0}
+    n_audio = rooms if args.audio is None else args.audio
+
+    room_ids = [f"load{step}-{i}" for i in range(rooms)]
+    await asyncio.gather(
+        *(run_room(ws_url, room_ids[i], args, inputs[i % len(inputs)], stats[i])
+          for i in range(rooms)),
+        *(run_audio(ws_url, stop_at, counts, room_ids[i % rooms], stats[i % rooms].ready)
+          for i in range(n_audio))
+    )
+    wall = time.perf_counter() - start
+    after = await asyncio.to_thread(scrape, args.url)
+
+    def delta(name):
+        return after.get(name, 0.0) - before.get(name, 0.0)
+
+    sent = sum(s.sent for s in stats)
+    replied = sum(s.replied for s in stats)
+    latencies = np.array([l for s in stats for l in s.latencies]) if replied else np.zeros(1)
+    return {
+        'rooms': rooms,
+        'students_per_room': args.students,
+        'audio_streams': n_audio,
+        'wall_s': round(wall, 2),
+        'frames_sent': sent,
+        'frames_processed': replied,
+        'drop_rate': round(1 - replied / sent, 4) if sent else 0.0,
+        'server_stale_drops': sum(s.server_dropped for s in stats),
+        'fps_per_room': round(replied / rooms / args.duration, 2),
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 1),
+        'latency_p99_ms': round(float(np.percentile(latencies, 99)), 1),
+        'db_rows_per_s': round(delta('db_flush_rows_sum') / wall, 1),
+        'cpu_cores_total': round(delta('process_cpu_seconds_total') / wall, 3),
+        'cpu_cores_per_room': round(delta('process_cpu_seconds_total') / wall / rooms, 3),
+        'audio_chunks_sent': counts['audio_sent'],
+        'audio_replies': counts['audio_replies'],
+        'errors': sum(s.errors for s in stats) + counts['audio_errors'],
+    }
+
+def within_budget(result, args):
+    reasons = []
+    if result['errors']:
+        reasons.append(f"{result['errors']} connection error(s)")
+    if result['latency_p99_ms'] > args.latency_budget_ms:
+        reasons.append(f"p99 {result['latency_p99_ms']} ms > {args.latency_budget_ms} ms")
+    if result['drop_rate'] > args.max_drop_rate:
+        reasons.append(f"drop rate {result['drop_rate']:.1%} > {args.max_drop_rate:.1%}")
+    if result['fps_per_room'] < args.fps * args.min_fps_ratio:
+        reasons.append(f"{result['fps_per_room']} fps/room < {args.fps * args.min_fps_ratio:.1f}")
+    return reasons
+
+async def main_async(args):
+    room_steps = sorted({int(r) for r in args.rooms.split(",")})
+    size = (args.width, args.height)
+    n_frames = max(30, int(args.fps * 10))
+    # One input stream per distinct room so students move independently across rooms
+    if args.mode == "jpeg":
+        inputs = [jpeg_frames(n_frames, args.students, i, args.video, size) for i in range(min(4, room_steps[-1]))]
+    else:
+        inputs = [detection_messages(n_frames, args.students, i, args.occlusion, size) for i in range(room_steps[-1])]
+
+    results, saturation = [], None
+    for step, rooms in enumerate(room_steps):
+        print(f"Step {step + 1}/{len(room_steps)}: {rooms} room(s) x {args.students} students, "
+              f"{args.fps} fps, {args.duration}s ...")
+        result = await run_step(args, rooms, inputs, step)
+        result['violations'] = within_budget(result, args)
+        results.append(result)
+        print(f"  p50 {result['latency_p50_ms']} ms  p99 {result['latency_p99_ms']} ms  "
+              f"drop {result['drop_rate']:.1%}  {result['fps_per_room']} fps/room  "
+              f"{result['db_rows_per_s']} rows/s  {result['cpu_cores_per_room']} cores/room")
+        if result['violations']:
+            saturation = rooms
+            print(f"  saturated: {'; '.join(result['violations'])}")
+            if not args.keep_going:
+                break
+        await asyncio.sleep(args.pause)
+
+    sustained = [r['rooms'] for r in results if not r['violations']]
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k != 'json'},
+        'steps': results,
+        'max_sustained_rooms': max(sustained) if sustained else 0,
+        'saturated_at_rooms': saturation,
+    }
+    print()
+    if saturation is None:
+        print(f"No saturation up to {room_steps[-1]} room(s); extend --rooms to find the limit.")
+    else:
+        print(f"Saturation at {saturation} room(s); max sustained: {report['max_sustained_rooms']} "
+              f"room(s) x {args.students} students.")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000", help="backend base URL")
+    parser.add_argument("--rooms", default="1,2,4,8", help="comma-separated room counts to ramp through")
+    parser.add_argument("--students", type=int, default=20, help="students per room")
+    parser.add_argument("--mode", choices=("detections", "jpeg"), default="detections")
+    parser.add_argument("--video", help="recorded video to replay in jpeg mode")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=float, default=10.0, help="frames per second per room")
+    parser.add_argument("--occlusion", type=float, default=0.1, help="fraction of time each student is hidden")
+    parser.add_argument("--audio", type=int, help="audio streams per step (default: one per room)")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per step")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for in-flight frames")
+    parser.add_argument("--pause", type=float, default=2.0, help="seconds between steps")
+    parser.add_argument("--latency-budget-ms", type=float, default=250.0, help="p99 end-to-end budget")
+    parser.add_argument("--max-drop-rate", type=float, default=0.05)
+    parser.add_argument("--min-fps-ratio", type=float, default=0.9, help="required fraction of --fps per room")
+    parser.add_argument("--keep-going", action="store_true", help="run every step even after saturating")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Record detector output once, then replay it through the downstream pipeline
+as often as needed (tracking, attention, gamification, recommendations).
+
+Live sessions are recorded when the server runs with SESSION_RECORD_DIR set
+(one file per session). Recordings can also be made offline from a video.
+
+Usage (from backend/):
+    python -m benchmarks.replay record lecture.mp4 lecture.rec [--landmarks all|key|none]
+    python -m benchmarks.replay replay lecture.rec                 # as fast as possible
+    python -m benchmarks.replay replay lecture.rec --speed 1       # real time
+    python -m benchmarks.replay replay lecture.rec --weights new_weights.json --json out.json
+"""
+import argparse
+import json
+import time
+
+def record(args):
+    import cv2
+    from core.emotion_detector_v2 import MediaPipeEmotionDetector
+    from core.session_recorder import SessionRecorder
+
+    detector = MediaPipeEmotionDetector()
+    if detector.detector is None:
+        raise SystemExit("MediaPipe model unavailable")
+    cap = cv2.VideoCapture(args.video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(1, round(fps / args.fps)) if args.fps else 1
+    recorder = None
+    n, t0 = 0, time.perf_counter()
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            n += 1
+            if (n - 1) % step:
+                continue
+            if recorder is None:
+                h, w = frame.shape[:2]
+                recorder = SessionRecorder(args.output, w, h, landmarks=args.landmarks, blendshapes=args.blendshapes)
+            # Timestamps follow the video's clock, not the wall clock
+            recorder.write((n - 1) / fps, detector.detect(frame))
+    finally:
+        cap.release()
+        if recorder:
+            recorder.close()
+    frames = recorder.frames if recorder else 0
+    print(f"Recorded {frames} frames ({n / fps:.1f}s of video) in {time.perf_counter() - t0:.1f}s -> {args.output}")
+
+def replay(args):
+    from core.session_recorder import replay as run_replay
+
+    timeline = []
+
+    def add_to_timeline(ts, metrics):
+        people = metrics['people']
+        avg = sum(p['attention'] for p in people) / len(people) if people else 0.0
+        timeline.append({'ts': ts, 'people': len(people), 'avg_attention': round(avg, 1)})
+
+    summary = run_replay(args.recording, speed=args.speed, reclassify=args.reclassify,
+                         weights=args.weights, on_frame=add_to_timeline if args.timeline else None)
+    if timeline:
+        summary['timeline'] = timeline
+
+    print(f"{summary['frames']} frames / {summary['faces']} faces, {summary['footage_seconds']}s of footage "
+          f"replayed in {summary['wall_seconds']}s ({summary['speedup']}x real time)")
+    print(f"{len(summary['people'])} tracks")
+    for p in sorted(summary['people'], key=lambda p: -p['time_present'])[:10]:
+        print(f"  {p['person_id']:>6}  present {p['time_present']:8.1f}s  "
+              f"attention {p['avg_attention']:5.1f}  {p['dominant_emotion']:<10} {p['status']}"
+              + (f"  (tracks {', '.join(p['tracks'])})" if len(p['tracks']) > 1 else ""))
+    print("Leaderboard:", ", ".join(f"{e['id']}={e['points']}" for e in summary['leaderboard']))
+    print("Alerts raised:", ", ".join(f"{rule}={count}" for rule, count in summary['recommendations'].items()) or "none")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="run the detector over a video and record its output")
+    rec.add_argument("video")
+    rec.add_argument("output")
+    rec.add_argument("--landmarks", choices=("all", "key", "none"), default="key")
+    rec.add_argument("--no-blendshapes", dest="blendshapes", action="store_false")
+    rec.add_argument("--fps", type=float, help="sample the video at this rate (default: every frame)")
+    rec.set_defaults(func=record)
+
+    rep = sub.add_parser("replay", help="feed a recording through tracking and scoring")
+    rep.add_argument("recording")
+    rep.add_argument("--speed", type=float, help="pace at this multiple of real time (default: unpaced)")
+    rep.add_argument("--reclassify", action=argparse.BooleanOptionalAction, default=None,
+                     help="re-label faces (default: on when blendshapes were recorded)")
+    rep.add_argument("--weights", help="blendshape classifier weights to re-label with")
+    rep.add_argument("--timeline", action="store_true", help="include per-frame attention in --json output")
+    rep.add_argument("--json", help="write the summary to this file")
+    rep.set_defaults(func=replay)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+Offline CPU benchmark suite for the vision, tracking and storage hot paths.
+
+Every case reports throughput, p50/p99 latency and peak (Python) memory.
+Inputs are deterministic: frames rendered from benchmarks/fixtures, synthetic
+landmark arrays that bypass the model, and a seeded throwaway SQLite DB (the
+real student_db is never touched).
+
+Usage (from backend/):
+    python -m benchmarks.run                      # full suite
+    python -m benchmarks.run --quick              # smaller inputs
+    python -m benchmarks.run --only association,export_csv
+    python -m benchmarks.run --video lecture.mp4  # recorded frames for the detector case
+    python -m benchmarks.run --compare            # fail on regressions vs baseline.json
+    python -m benchmarks.run --update-baseline
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+SIZES = {
+    # name: (frames, faces, db sessions, people, samples per person, iterations)
+    'quick': dict(frames=60, faces=8, sessions=4, people=30, samples=100, iterations=30),
+    'full': dict(frames=200, faces=8, sessions=20, people=30, samples=600, iterations=100),
+}
+
+CASES = {}
+
+def case(name):
+    def register(fn):
+        CASES[name] = fn
+        return fn
+    return register
+
+@case("detector_mediapipe")
+def bench_detector(ctx):
+    from core.emotion_detector_v2 import MediaPipeEmotionDetector
+    from .fixtures import classroom_frames, recorded_frames
+
+    detector = MediaPipeEmotionDetector()
+    if detector.detector is None:
+        raise RuntimeError("MediaPipe model unavailable")
+    if ctx['video']:
+        frames = recorded_frames(ctx['video'], limit=ctx['frames'])
+    else:
+        frames, _ = classroom_frames(ctx['frames'], n_faces=4)
+    return ctx['measure'](lambda i: detector.detect(frames[i % len(frames)]), min(ctx['iterations'], len(frames)))
+
+def _backend_case(name):
+    @case(f"detector_batch_{name}")
+    def bench(ctx):
+        from core.detectors import create_backend
+        from .fixtures import classroom_frames
+
+        # Batches of 4 frames through one backend of core/detectors.py
+        backend = create_backend(name)
+        if not backend.available:
+            raise RuntimeError(f"{name} backend unavailable")
+        frames, _ = classroom_frames(ctx['frames'], n_faces=4)
+        batches = [frames[i:i + 4] for i in range(0, len(frames) - 3, 4)]
+        return ctx['measure'](lambda i: backend.detect_batch(batches[i % len(batches)]),
+                              min(ctx['iterations'], len(batches)))
+    return bench
+
+for _name in ('mediapipe', 'fer', 'haar'):
+    _backend_case(_name)
+
+# Tile grids for the lecture-hall case: (grid, denser back grid); 1x1 is a single full-frame pass
+TILE_CONFIGS = {
+    'detector_tiles_1x1': ((1, 1), None),
+    'detector_tiles_3x4': ((3, 4), None),
+    'detector_tiles_3x4_b2x8': ((3, 4), (2, 8)),
+    'detector_tiles_4x8': ((4, 8), None),
+}
+
+def _face_recall(detections, truth):
+    """Share of ground-truth faces whose center lies in some detected box."""
+    boxes = [d['bbox'] for d in detections]
+    hits = sum(any(bx <= x + w / 2 <= bx + bw and by <= y + h / 2 <= by + bh for bx, by, bw, bh in boxes)
+               for x, y, w, h in truth)
+    return round(hits / len(truth), 3) if truth else None
+
+def _tiled_case(name, grid, back_grid):
+    @case(name)
+    def bench(ctx):
+        from core.tiled_detection import TiledDetector
+        from .fixtures import lecture_hall_frame
+
+        # 50 students in a 1080p hall, faces shrinking towards the back rows
+        frame, truth = lecture_hall_frame()
+        detector = TiledDetector(grid, back_grid)
+        if detector.detector is None:
+            raise RuntimeError("MediaPipe model unavailable")
+        try:
+            result = ctx['measure'](lambda i: detector.detect(frame), max(3, ctx['iterations'] // 10),
+                                    warmup=1, memory_iterations=1)
+            result['tiles'] = len(detector.tiles_for(frame.shape[1], frame.shape[0]))
+            result['recall'] = _face_recall(detector.detect(frame), truth)
+            return result
+        finally:
+            detector.close()
+    return bench
+
+for _name, (_grid, _back) in TILE_CONFIGS.items():
+    _tiled_case(_name, _grid, _back)
+
+@case("emotion_from_landmarks")
+def bench_emotion_from_landmarks(ctx):
+    from core.emotion_detector_v2 import MediaPipeEmotionDetector
+    from .fixtures import synthetic_landmarks
+
+    # Model-less instance: only the landmark heuristics are exercised
+    detector = MediaPipeEmotionDetector.__new__(MediaPipeEmotionDetector)
+    faces = synthetic_landmarks(ctx['faces'])
+
+    def run(i):
+        for points in faces:
+            detector._extract_emotion_from_points(points)
+    return ctx['measure'](run, ctx['iterations'] * 10)
+
+@case("session_process_frame")
+def bench_process_frame(ctx):
+    import numpy as np
+    from core.session_manager import SessionManager
+    from .fixtures import synthetic_detections, SyntheticDetector, FRAME_SIZE
+
+    dets = synthetic_detections(ctx['frames'], n_faces=ctx['faces'])
+    manager = SessionManager(emotion_detector=SyntheticDetector(dets))
+    manager.start_session("bench_teacher", "bench_class")
+    w, h = FRAME_SIZE
+    frames = [np.full((h, w, 3), 100 + (i % 50), np.uint8) for i in range(8)]
+    try:
+        return ctx['measure'](lambda i: manager.process_frame(frames[i % len(frames)].copy()), ctx['iterations'])
+    finally:
+        manager.stop_session()
+
+@case("session_replay")
+def bench_replay(ctx):
+    import os
+    from core.session_recorder import SessionRecorder, replay
+    from .fixtures import synthetic_detections, FRAME_SIZE
+
+    # Throughput is per replay of a whole recording (frames x faces detections)
+    path = os.path.join(ctx['tmp'], "bench.rec")
+    recorder = SessionRecorder(path, *FRAME_SIZE)
+    for i, dets in enumerate(synthetic_detections(ctx['frames'], n_faces=ctx['faces'], occlusion=0.1)):
+        recorder.write(i / 10.0, dets)
+    recorder.close()
+    return ctx['measure'](lambda i: replay(path), max(3, ctx['iterations'] // 20), warmup=1, memory_iterations=1)
+
+@case("association")
+def bench_association(ctx):
+    from core.session_manager import SessionManager
+    from .fixtures import synthetic_detections, FakeTrack
+
+    dets = synthetic_detections(1, n_faces=30)[0]
+    tracks = [FakeTrack(str(i), (d['bbox'][0] + 2, d['bbox'][1] + 1,
+                                 d['bbox'][0] + d['bbox'][2], d['bbox'][1] + d['bbox'][3]))
+              for i, d in enumerate(dets)]
+    manager = SessionManager.__new__(SessionManager)  # association needs no tracker/model
+    return ctx['measure'](lambda i: manager._associate(tracks, dets), ctx['iterations'] * 10)
+
+@case("heatmap_update")
+def bench_heatmap(ctx):
+    import numpy as np
+    from core.heatmap import EngagementHeatmap
+
+    # One frame's 30 tracked people on a 1280x720 frame
+    rng = np.random.default_rng(0)
+    people = [{'bbox': [int(x), int(y), int(x) + 60, int(y) + 80], 'attention': float(a), 'engagement': float(a)}
+              for x, y, a in zip(rng.uniform(0, 1220, 30), rng.uniform(0, 640, 30), rng.uniform(0, 100, 30))]
+    heatmap = EngagementHeatmap()
+    return ctx['measure'](lambda i: heatmap.add(people, 1280, 720), ctx['iterations'] * 10)
+
+@case("audio_analyze_chunk")
+def bench_audio(ctx):
+    import numpy as np
+    from core.audio_analysis import AudioAnalyzer
+
+    analyzer = AudioAnalyzer()
+    rng = np.random.default_rng(0)
+    # 4096 samples @ 16 kHz, what the dashboard's ScriptProcessor sends
+    chunks = [(rng.normal(0, 0.02, 4096)).astype(np.float32) for _ in range(16)]
+    return ctx['measure'](lambda i: analyzer.analyze_audio_chunk(chunks[i % len(chunks)]), ctx['iterations'] * 10)
+
+@case("audio_ingest_decode")
+def bench_audio_ingest(ctx):
+    import zlib
+    import numpy as np
+    from core.audio_ingest import AudioStream, negotiate
+
+    # 100 ms chunks of 48 kHz stereo int16, zlib-compressed, down to 16 kHz mono windows
+    rng = np.random.default_rng(0)
+    pcm = (rng.normal(0, 0.05, (4800, 2)) * 32767).astype('<i2')
+    chunk = zlib.compress(pcm.tobytes())
+    stream = AudioStream(negotiate({'encoding': 's16le', 'sample_rate': 48000, 'channels': 2,
+                                    'compression': 'zlib'}))
+    return ctx['measure'](lambda i: stream.feed(chunk), ctx['iterations'] * 10)
+
+@case("analytics_trends")
+def bench_trends(ctx):
+    from core.analytics_service import AnalyticsService
+
+    service = AnalyticsService()
+    sid = ctx['session_ids'][0]
+    return ctx['measure'](lambda i: service.get_session_trends(sid), max(5, ctx['iterations'] // 10))
+
+def _drain(iterator):
+    n = 0
+    for chunk in iterator:
+        n += len(chunk)
+    return n
+
+@case("export_csv")
+def bench_export_csv(ctx):
+    from core.report_generator import ReportGenerator
+
+    rg = ReportGenerator(cache_dir=ctx['tmp'])
+    sid = ctx['session_ids'][0]
+    return ctx['measure'](lambda i: _drain(rg.iter_export('csv', [sid])), max(5, ctx['iterations'] // 10))
+
+@case("export_parquet")
+def bench_export_parquet(ctx):
+    from core.report_generator import ReportGenerator
+
+    rg = ReportGenerator(cache_dir=ctx['tmp'])
+    sid = ctx['session_ids'][0]
+    return ctx['measure'](lambda i: _drain(rg.iter_export('parquet', [sid])), max(5, ctx['iterations'] // 10))
+
+@case("export_pdf")
+def bench_export_pdf(ctx):
+    from core.report_generator import ReportGenerator
+
+    rg = ReportGenerator(cache_dir=ctx['tmp'])
+    sid = ctx['session_ids'][0]
+    return ctx['measure'](lambda i: rg.generate_pdf_report(sid), max(5, ctx['iterations'] // 10))
+
+@case("history_sqlite")
+def bench_history_sqlite(ctx):
+    import os
+    from core.analytics_service import AnalyticsService
+    from core.archive import SessionArchive
+
+    service = AnalyticsService(archive=SessionArchive(os.path.join(ctx['tmp'], "archive")))
+    return ctx['measure'](lambda i: service.get_history(), max(5, ctx['iterations'] // 10))
+
+@case("history_archive")
+def bench_history_archive(ctx):
+    import os
+    from core.analytics_service import AnalyticsService
+    from core.archive import SessionArchive
+
+    # Archives the second half of the seeded sessions; earlier cases keep using the first
+    archive = SessionArchive(os.path.join(ctx['tmp'], "archive"))
+    ids = ctx['session_ids']
+    for sid in ids[len(ids) // 2:]:
+        archive.archive_session(sid)
+    service = AnalyticsService(archive=archive)
+    return ctx['measure'](lambda i: service.get_history(), max(5, ctx['iterations'] // 10))
+
+@case("analytics_fused")
+def bench_fused(ctx):
+    from core.analytics_service import AnalyticsService
+
+    service = AnalyticsService()
+    sid = ctx['session_ids'][0]
+    return ctx['measure'](lambda i: service.get_fused_timeline(sid, 10), ctx['iterations'])
+
+@case("analytics_hub_publish")
+def bench_hub_publish(ctx):
+    import asyncio
+    from datetime import datetime, timedelta
+    from core.analytics_hub import AnalyticsHub
+
+    # One frame of 30 students fanned out to 20 dashboards; a bucket closes every 150 frames
+    hub = AnalyticsHub()
+    people = [{'id': str(i), 'attention': 50.0 + i, 'emotion': 'engaged', 'engagement': 55.0} for i in range(30)]
+    t0 = datetime(2026, 1, 5, 9)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    queues = [hub.subscribe(1) for _ in range(20)]
+
+    def step(i):
+        metrics = {'timestamp': (t0 + timedelta(seconds=i / 30)).isoformat(), 'total_people': 30, 'people': people}
+        hub.publish(1, metrics, {'people_count': 30})
+        for q in queues:
+            while not q.empty():
+                q.get_nowait()
+    try:
+        return ctx['measure'](step, ctx['iterations'] * 20)
+    finally:
+        loop.close()
+
+@case("engine_ipc_call")
+def bench_engine_call(ctx):
+    import asyncio
+    import contextlib
+    import threading
+    from core.engine import LiveEngine, EngineServer, EngineClient
+    from core.service_registry import ServiceRegistry
+
+    # One API-worker call (leaderboard) answered by an engine on a Unix socket in another thread
+    services = ServiceRegistry()
+    services.register("gamification_engine", "core.gamification_engine:GamificationEngine")
+    path = os.path.join(ctx['tmp'], "engine.sock")
+    server_loop = asyncio.new_event_loop()
+    server_task = server_loop.create_task(EngineServer(LiveEngine(services), path).serve_forever())
+    def serve():
+        with contextlib.suppress(asyncio.CancelledError):
+            server_loop.run_until_complete(server_task)
+        server_loop.close()
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    while not os.path.exists(path):
+        thread.join(0.01)
+
+    client = EngineClient(path)
+    loop = asyncio.new_event_loop()
+    try:
+        return ctx['measure'](lambda i: loop.run_until_complete(client.leaderboard()), ctx['iterations'] * 10)
+    finally:
+        client.close()
+        loop.run_until_complete(asyncio.sleep(0.05))  # lets the server see the hang-up
+        loop.close()
+        server_loop.call_soon_threadsafe(server_task.cancel)
+        thread.join()
+
+@case("maintenance_compact")
+def bench_maintenance(ctx):
+    from datetime import datetime
+    from core.maintenance import MetricsMaintenance
+
+    # A single pass over the seeded 2 s samples as if a year had passed (raw -> 10 s -> 1 min).
+    # It rewrites the seeded tables, so it is registered last.
+    maintenance = MetricsMaintenance(raw_days=0, ten_second_days=0, pause=0)
+    return ctx['measure'](lambda i: maintenance.run(now=datetime(2027, 1, 1)), 1, warmup=0, memory_iterations=0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller inputs and fewer iterations")
+    parser.add_argument("--only", help="comma-separated case names")
+    parser.add_argument("--video", help="video file to use for the detector case")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown (default 0.25)")
+    parser.add_argument("--update-baseline", action="store_true", help=f"overwrite {BASELINE_PATH}")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="attendance-bench-")
+    # Must be set before any core module imports the database engine
+    os.environ["ATTENDANCE_DB_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    from .fixtures import seed_database
+    from .harness import measure, compare
+
+    size = SIZES['quick' if args.quick else 'full']
+    names = args.only.split(",") if args.only else list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    print(f"Seeding {size['sessions']} sessions x {size['people']} people x {size['samples']} samples ...")
+    ctx = dict(size, tmp=tmp, video=args.video, measure=measure,
+               session_ids=seed_database(size['sessions'], size['people'], size['samples']))
+
+    results = {}
+    for name in names:
+        try:
+            results[name] = CASES[name](ctx)
+            r = results[name]
+            print(f"{name:<24} {r['throughput_per_s']:>10} /s   p50 {r['p50_ms']:>9.3f} ms   "
+                  f"p99 {r['p99_ms']:>9.3f} ms   peak {r['peak_mem_kb']:>9.1f} KiB"
+                  + (f"   recall {r['recall']:.2f} ({r['tiles']} tiles)" if 'recall' in r else ""))
+        except Exception as e:
+            results[name] = {'error': str(e)}
+            print(f"{name:<24} ERROR: {e}")
+
+    report = {'size': 'quick' if args.quick else 'full', 'results': results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {BASELINE_PATH}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('size') != report['size']:
+            print(f"⚠️ Baseline was recorded with size '{baseline.get('size')}', this run is '{report['size']}'")
+        missing = [n for n, r in results.items() if 'error' not in r and n not in baseline['results']]
+        if missing:
+            print(f"⚠️ No baseline for {', '.join(missing)}; not compared (see --update-baseline)")
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for name, msg in regressions:
+            print(f"REGRESSION {name}: {msg}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
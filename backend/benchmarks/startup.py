@@ -0,0 +1,63 @@
+"""
+Startup-time benchmark.
+
+Runs each measurement in a fresh interpreter so import caches don't hide
+cold-start cost. Reports how long `import main` takes (what every uvicorn
+worker pays before accepting requests) and the import/init time of each
+lazily-built service.
+
+Usage (from backend/):
+    python -m benchmarks.startup [--json startup.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+main.init_db()
+t2 = time.perf_counter()
+main.services.warm_up()
+t3 = time.perf_counter()
+print(json.dumps({
+    'import_main_ms': round((t1 - t0) * 1000, 1),
+    'init_db_ms': round((t2 - t1) * 1000, 1),
+    'warm_up_ms': round((t3 - t2) * 1000, 1),
+    'services': main.services.status()['services'],
+}))
+"""
+
+def run_probe():
+    env = dict(os.environ, WARM_UP_SERVICES="0")
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    # Services print banners; the JSON report is the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    report = run_probe()
+    print(f"import main      {report['import_main_ms']:>9.1f} ms")
+    print(f"init_db          {report['init_db_ms']:>9.1f} ms")
+    print(f"warm-up (total)  {report['warm_up_ms']:>9.1f} ms")
+    for name, s in report['services'].items():
+        print(f"  {name:<24} import {s.get('import_ms', 0):>8.1f} ms   init {s.get('init_ms', 0):>8.1f} ms   [{s['state']}]")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
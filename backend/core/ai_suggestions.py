@@ -1,5 +1,4 @@
 import os
-from groq import Groq
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,7 +6,10 @@ load_dotenv()
 class AISuggestionEngine:
     def __init__(self):
         api_key = os.environ.get("GROQ_API_KEY")
-        self.client = Groq(api_key=api_key) if api_key else None
+        self.client = None
+        if api_key:
+            from groq import Groq
+            self.client = Groq(api_key=api_key)
         
     def generate_suggestions(self, session_data: dict):
         """
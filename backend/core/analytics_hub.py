@@ -0,0 +1,163 @@
+"""
+Live analytics for dashboards, pushed instead of polled. The video and
+ingest loops hand every frame's metrics to the hub, which folds them into
+per-session time buckets in memory. When a bucket closes, or the session
+status changes, the message is built and JSON-encoded once and the same
+string is queued for every subscriber of that session. A subscriber first
+gets a snapshot of the buckets so far, then only what is new.
+
+Runs on the event loop; publish() and subscribe() must be called from it.
+"""
+import asyncio
+import json
+from collections import Counter
+from datetime import datetime
+
+# Width of the pushed time buckets
+BUCKET_SECONDS = 5
+# A subscriber further behind than this many messages is resynced with a fresh snapshot
+SUBSCRIBER_QUEUE = 64
+
+class SessionFeed:
+    def __init__(self, session_id, bucket_seconds=BUCKET_SECONDS):
+        self.session_id = session_id
+        self.bucket_seconds = bucket_seconds
+        self.buckets = []       # closed buckets, oldest first
+        self.current = None     # open bucket accumulator
+        self.status = {}
+        self.subscribers = set()
+        self.ended = False
+
+    def _open(self, bucket):
+        return {'bucket': bucket, 'attention': 0.0, 'engagement': 0.0, 'samples': 0, 'frames': 0,
+                'emotions': {}}
+
+    def _close(self):
+        acc, self.current = self.current, None
+        if acc is None or not acc['frames']:
+            return None
+        n = max(acc['samples'], 1)
+        start = datetime.utcfromtimestamp(acc['bucket'] * self.bucket_seconds)
+        bucket = {
+            'time': start.strftime("%H:%M:%S"),
+            'ts': start.isoformat(),
+            'avg_attention': round(acc['attention'] / n, 1),
+            'engagement': round(acc['engagement'] / n, 1),
+            'student_count': len(acc['emotions']),
+            'frames': acc['frames'],
+        }
+        # Same shape as /api/analytics/trends: one count per student, by their last emotion in the bucket
+        bucket.update(Counter(acc['emotions'].values()))
+        self.buckets.append(bucket)
+        return bucket
+
+    def add_frame(self, ts, people):
+        """Fold one frame in; returns the bucket it closed, if any."""
+        bucket = int(ts // self.bucket_seconds)
+        closed = None
+        if self.current is not None and bucket > self.current['bucket']:
+            closed = self._close()
+        if self.current is None:
+            self.current = self._open(bucket)
+        acc = self.current
+        acc['frames'] += 1
+        for p in people:
+            acc['attention'] += p['attention']
+            acc['engagement'] += p.get('engagement', p['attention'])
+            acc['samples'] += 1
+            acc['emotions'][p['id']] = p['emotion']
+        return closed
+
+    def status_delta(self, status):
+        """Keys of status whose value changed since the last call."""
+        delta = {k: v for k, v in status.items() if self.status.get(k) != v}
+        self.status.update(delta)
+        return delta
+
+    def snapshot(self):
+        return {'type': 'snapshot', 'session_id': self.session_id, 'live': not self.ended,
+                'bucket_seconds': self.bucket_seconds, 'buckets': self.buckets, 'status': self.status}
+
+class AnalyticsHub:
+    def __init__(self, bucket_seconds=BUCKET_SECONDS, queue_size=SUBSCRIBER_QUEUE):
+        self.bucket_seconds = bucket_seconds
+        self.queue_size = queue_size
+        self.feeds = {}  # session id -> SessionFeed
+
+    def is_live(self, session_id):
+        feed = self.feeds.get(session_id)
+        return feed is not None and not feed.ended
+
+    def _feed(self, session_id):
+        feed = self.feeds.get(session_id)
+        if feed is None:
+            feed = self.feeds[session_id] = SessionFeed(session_id, self.bucket_seconds)
+        return feed
+
+    def _broadcast(self, feed, message):
+        if not feed.subscribers:
+            return
+        item = (message['type'], json.dumps(message))
+        for queue in feed.subscribers:
+            try:
+                queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # Too far behind for deltas to make sense: start it over from a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(('snapshot', json.dumps(feed.snapshot())))
+
+    def publish(self, session_id, metrics, status=None):
+        """
+        One processed frame of a live session: its 'people', 'timestamp',
+        'total_people' and 'recommendations' plus any extra status fields.
+        """
+        if not session_id:
+            return
+        feed = self._feed(session_id)
+        ts = datetime.fromisoformat(metrics['timestamp'])
+        closed = feed.add_frame((ts - datetime(1970, 1, 1)).total_seconds(), metrics.get('people', []))
+        if closed:
+            self._broadcast(feed, {'type': 'bucket', 'session_id': session_id, 'bucket': closed})
+
+        current = {'present': metrics.get('total_people', 0)}
+        if 'recommendations' in metrics:
+            current['alerts'] = len(metrics['recommendations'])
+        if status:
+            current.update(status)
+        delta = feed.status_delta(current)
+        if delta:
+            self._broadcast(feed, {'type': 'status', 'session_id': session_id, 'status': delta})
+
+    def end_session(self, session_id):
+        """Close the open bucket and tell subscribers the session ended."""
+        feed = self.feeds.get(session_id)
+        if feed is None:
+            return
+        closed = feed._close()
+        if closed:
+            self._broadcast(feed, {'type': 'bucket', 'session_id': session_id, 'bucket': closed})
+        feed.ended = True
+        self._broadcast(feed, {'type': 'end', 'session_id': session_id})
+        if not feed.subscribers:
+            del self.feeds[session_id]
+
+    def subscribe(self, session_id):
+        """A queue of (message type, JSON text) for the session, starting with the catch-up snapshot."""
+        feed = self._feed(session_id)
+        queue = asyncio.Queue(self.queue_size)
+        queue.put_nowait(('snapshot', json.dumps(feed.snapshot())))
+        feed.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, session_id, queue):
+        feed = self.feeds.get(session_id)
+        if feed is None:
+            return
+        feed.subscribers.discard(queue)
+        if feed.ended and not feed.subscribers:
+            del self.feeds[session_id]
+
+    def status(self):
+        return {sid: {'subscribers': len(f.subscribers), 'buckets': len(f.buckets), 'ended': f.ended}
+                for sid, f in self.feeds.items()}
@@ -1,8 +1,20 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from .database import SessionLocal, Session as SessionModel, SessionPerson, PersonMetric
+from sqlalchemy import func, Integer, cast
+from datetime import datetime
+import numpy as np
+
+from .database import SessionLocal, Session as SessionModel, SessionPerson, PersonMetric, AudioMetric, ArchivedSession, SessionHeatmap
+from .archive import SessionArchive, column_values
+from .fusion import asof_indices, engagement_score
+from .heatmap import EngagementHeatmap
 
 class AnalyticsService:
+    def __init__(self, archive=None):
+        self.archive = archive or SessionArchive()
+
+    def _is_archived(self, db, session_id):
+        return db.query(ArchivedSession.session_id).filter(ArchivedSession.session_id == session_id).first() is not None
+
     def get_session_trends(self, session_id: int):
         db = SessionLocal()
         try:
@@ -11,20 +23,24 @@ class AnalyticsService:
             # For simplicity, we just return all metrics and let frontend downsample or bin
             
             # Fetch last 1000 points to avoid overload
-            metrics = db.query(PersonMetric)\
-                .filter(PersonMetric.session_id == session_id)\
-                .order_by(PersonMetric.timestamp.asc())\
-                .all()
+            if self._is_archived(db, session_id):
+                table = self.archive.scan('person_metrics', ['timestamp', 'emotion', 'attention'], session_ids=[session_id])
+                metrics = zip(*(column_values(table, c) for c in ('timestamp', 'emotion', 'attention')))
+            else:
+                metrics = db.query(PersonMetric.timestamp, PersonMetric.emotion, PersonMetric.attention_score)\
+                    .filter(PersonMetric.session_id == session_id)\
+                    .order_by(PersonMetric.timestamp.asc())\
+                    .all()
                 
             # Group by timestamp (seconds)
             timeline = {}
-            for m in metrics:
-                ts_str = m.timestamp.strftime("%H:%M:%S")
+            for timestamp, emotion, attention_score in metrics:
+                ts_str = timestamp.strftime("%H:%M:%S")
                 if ts_str not in timeline:
                     timeline[ts_str] = {'att': [], 'emo': {}}
                 
-                timeline[ts_str]['att'].append(m.attention_score)
-                timeline[ts_str]['emo'][m.emotion] = timeline[ts_str]['emo'].get(m.emotion, 0) + 1
+                timeline[ts_str]['att'].append(attention_score)
+                timeline[ts_str]['emo'][emotion] = timeline[ts_str]['emo'].get(emotion, 0) + 1
             
             # Format output
             graph_data = []
@@ -42,6 +58,84 @@ class AnalyticsService:
         finally:
             db.close()
             
+    def get_attention_rollup(self, session_id: int, bucket_seconds: int = 60, db=None):
+        """
+        Attention averaged into fixed time buckets, aggregated in SQL so only
+        one row per bucket leaves the database.
+        Returns: [ { 'time': datetime, 'avg_attention': float, 'samples': int } ]
+        """
+        own_db = db is None
+        if own_db:
+            db = SessionLocal()
+        try:
+            if self._is_archived(db, session_id):
+                return self.archive.attention_rollup(session_id, bucket_seconds)
+            epoch = cast(func.strftime('%s', PersonMetric.timestamp), Integer)
+            bucket = (epoch // bucket_seconds).label('bucket')
+            rows = db.query(
+                    bucket,
+                    func.avg(PersonMetric.attention_score),
+                    func.count(PersonMetric.id)
+                )\
+                .filter(PersonMetric.session_id == session_id)\
+                .group_by(bucket)\
+                .order_by(bucket)\
+                .all()
+            return [{
+                'time': datetime.utcfromtimestamp(int(b) * bucket_seconds),
+                'avg_attention': float(avg or 0.0),
+                'samples': count
+            } for b, avg, count in rows]
+        finally:
+            if own_db:
+                db.close()
+
+    def get_fused_timeline(self, session_id: int, bucket_seconds: int = 10):
+        """
+        Attention and room audio per time bucket, with the combined
+        engagement score (see fusion.py). Each table is first reduced to one
+        row per bucket, sorted (the (session_id, timestamp) indexes serve
+        both), then the two bucket lists are merge-joined.
+        Returns: [ { 'time', 'avg_attention', 'noise_db', 'speech_ratio', 'engagement' } ]
+        """
+        db = SessionLocal()
+        try:
+            if self._is_archived(db, session_id):
+                vb, v, _ = self.archive.bucket_means('person_metrics', ['attention'], session_id, bucket_seconds)
+                ab, a, _ = self.archive.bucket_means('audio_metrics', ['noise_db', 'speech_ratio'],
+                                                     session_id, bucket_seconds)
+                attention, noise, speech = v['attention'], a['noise_db'], a['speech_ratio']
+            else:
+                def buckets(model, *columns):
+                    bucket = (cast(func.strftime('%s', model.timestamp), Integer) // bucket_seconds).label('bucket')
+                    rows = db.query(bucket, *(func.avg(c) for c in columns))\
+                        .filter(model.session_id == session_id)\
+                        .group_by(bucket)\
+                        .order_by(bucket)\
+                        .all()
+                    return [np.array(c, dtype=np.float64) for c in zip(*rows)] or [np.empty(0)] * (len(columns) + 1)
+                vb, attention = buckets(PersonMetric, PersonMetric.attention_score)
+                ab, noise, speech = buckets(AudioMetric, AudioMetric.noise_db, AudioMetric.speech_ratio)
+        finally:
+            db.close()
+
+        # Exact bucket matches between the two sorted lists
+        idx = asof_indices(vb, ab, 0)
+        hit = idx >= 0
+        bucket_noise = np.full(len(vb), np.nan)
+        bucket_speech = np.full(len(vb), np.nan)
+        bucket_noise[hit] = np.asarray(noise, dtype=np.float64)[idx[hit]]
+        bucket_speech[hit] = np.asarray(speech, dtype=np.float64)[idx[hit]]
+        attention = np.nan_to_num(np.asarray(attention, dtype=np.float64))
+        engagement = engagement_score(attention, bucket_noise, bucket_speech)
+        return [{
+            'time': datetime.utcfromtimestamp(int(b) * bucket_seconds),
+            'avg_attention': round(float(att), 2),
+            'noise_db': None if np.isnan(n) else round(float(n), 1),
+            'speech_ratio': None if np.isnan(sp) else round(float(sp), 3),
+            'engagement': float(e),
+        } for b, att, n, sp, e in zip(vb, attention, bucket_noise, bucket_speech, engagement)]
+
     def get_student_heatmap(self, session_id: int):
         # Return per-student average attention/engagement for the session
         db = SessionLocal()
@@ -56,3 +150,56 @@ class AnalyticsService:
              } for p in people]
         finally:
              db.close()
+
+    def get_engagement_heatmap(self, session_id: int):
+        """Stored spatial attention grid of a finished session (see core/heatmap.py), or None."""
+        db = SessionLocal()
+        try:
+            row = db.query(SessionHeatmap).filter(SessionHeatmap.session_id == session_id).first()
+            return EngagementHeatmap.from_record(row).snapshot() if row else None
+        finally:
+            db.close()
+
+    def get_history(self, start=None, end=None, student_id=None, session_ids=None):
+        """
+        Cross-session attention and emotion stats, one entry per session:
+        archived sessions are aggregated from the archive, the rest in SQL.
+        """
+        history = self.archive.session_stats(session_ids, start, end, student_id)
+        archived = set(self.archive.archived_ids(session_ids))
+        db = SessionLocal()
+        try:
+            def live(q):
+                q = q.join(SessionModel, SessionModel.id == PersonMetric.session_id)
+                if session_ids:
+                    q = q.filter(PersonMetric.session_id.in_(session_ids))
+                if archived:
+                    q = q.filter(~PersonMetric.session_id.in_(archived))
+                if start:
+                    q = q.filter(PersonMetric.timestamp >= start)
+                if end:
+                    q = q.filter(PersonMetric.timestamp < end)
+                if student_id is not None:
+                    q = q.filter(PersonMetric.person_id == str(student_id))
+                return q
+
+            stats = {}
+            rows = live(db.query(PersonMetric.session_id, SessionModel.start_time,
+                                 func.avg(PersonMetric.attention_score), func.count(PersonMetric.attention_score)))\
+                .group_by(PersonMetric.session_id).all()
+            for session_id, start_time, avg, count in rows:
+                stats[session_id] = {
+                    'session_id': session_id,
+                    'day': start_time.strftime("%Y-%m-%d"),
+                    'avg_attention': round(float(avg or 0.0), 2),
+                    'samples': count,
+                    'emotions': {},
+                }
+            rows = live(db.query(PersonMetric.session_id, PersonMetric.emotion, func.count(PersonMetric.id)))\
+                .group_by(PersonMetric.session_id, PersonMetric.emotion).all()
+            for session_id, emotion, count in rows:
+                if emotion is not None:
+                    stats[session_id]['emotions'][emotion] = count
+        finally:
+            db.close()
+        return sorted(history + list(stats.values()), key=lambda s: s['session_id'])
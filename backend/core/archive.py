@@ -0,0 +1,329 @@
+"""
+Columnar archive for completed sessions. Their person_metrics and
+audio_metrics rows move out of SQLite into Parquet files partitioned by
+day and session:
+
+    archive/person_metrics/day=2026-03-02/session_id=41/part-0.parquet
+    archive/audio_metrics/day=2026-03-02/session_id=41/part-0.parquet
+
+Students and emotions are dictionary-encoded and scores stored as float32.
+Queries go through pyarrow.dataset over a memory-mapped filesystem, so a
+filter on day or session_id skips whole directories and only the requested
+columns are read. SQLite keeps live and recent sessions; archived_sessions
+records what moved.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from .database import SessionLocal, DB_DIR, Session as SessionModel, PersonMetric, AudioMetric, ArchivedSession
+
+ARCHIVE_DIR = os.environ.get("ATTENDANCE_ARCHIVE_DIR", os.path.join(DB_DIR, "archive"))
+# Completed sessions older than this are archived by archive_completed()
+ARCHIVE_AFTER_DAYS = 7
+ARCHIVE_CHUNK_SIZE = 5000
+# day is the session's start date; its rows can run past midnight by up to this much
+SESSION_MAX_SPAN = timedelta(days=1)
+
+TABLES = ('person_metrics', 'audio_metrics')
+
+def _schemas():
+    import pyarrow as pa
+
+    emotion = pa.dictionary(pa.int8(), pa.string())
+    return {
+        'person_metrics': pa.schema([
+            ('timestamp', pa.timestamp('us')),
+            ('student_id', pa.dictionary(pa.int32(), pa.string())),
+            ('emotion', emotion),
+            ('confidence', pa.float32()),
+            ('attention', pa.float32()),
+            ('gaze_focus', pa.float32()),
+            ('yaw', pa.float32()),
+            ('pitch', pa.float32()),
+            ('roll', pa.float32()),
+            ('audio_noise', pa.float32()),
+            ('speech_ratio', pa.float32()),
+        ]),
+        'audio_metrics': pa.schema([
+            ('timestamp', pa.timestamp('us')),
+            ('noise_db', pa.float32()),
+            ('speech_ratio', pa.float32()),
+            ('activity_type', pa.dictionary(pa.int8(), pa.string())),
+        ]),
+    }
+
+def _head_pose(value):
+    if not value:
+        return (None, None, None)
+    try:
+        pose = json.loads(value)
+        return (pose.get('yaw'), pose.get('pitch'), pose.get('roll'))
+    except (ValueError, AttributeError):
+        return (None, None, None)
+
+# Scores are stored as float32; values read back for export are rounded to
+# this many decimals so they match what SQLite held (0.85, not 0.8500000238)
+READ_DECIMALS = 4
+
+def column_values(table, name):
+    """A column as a Python list, with float32 scores rounded back to their stored precision."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    column = table.column(name)
+    if pa.types.is_float32(column.type):
+        column = pc.round(column.cast(pa.float64()), READ_DECIMALS)
+    return column.to_pylist()
+
+class SessionArchive:
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+
+    # Writing
+
+    def _partition(self, table, day, session_id):
+        return os.path.join(self.root, table, f"day={day}", f"session_id={session_id}")
+
+    def _write(self, table, day, session_id, chunks, to_columns):
+        """Stream row chunks into one Parquet file; returns the row count."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = _schemas()[table]
+        directory = self._partition(table, day, session_id)
+        path = os.path.join(directory, "part-0.parquet")
+        tmp_path = f"{path}.tmp"
+        writer = None
+        rows = 0
+        try:
+            for chunk in chunks:
+                if writer is None:
+                    os.makedirs(directory, exist_ok=True)
+                    writer = pq.ParquetWriter(tmp_path, schema, compression='zstd')
+                columns = to_columns(chunk)
+                arrays = []
+                for field, values in zip(schema, columns):
+                    if pa.types.is_dictionary(field.type):
+                        arrays.append(pa.array(values, type=pa.string()).dictionary_encode().cast(field.type))
+                    else:
+                        arrays.append(pa.array(values, type=field.type))
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                rows += len(chunk)
+        except Exception:
+            if writer is not None:
+                writer.close()
+                os.remove(tmp_path)
+            raise
+        if writer is not None:
+            writer.close()
+            os.replace(tmp_path, path)
+        return rows
+
+    @staticmethod
+    def _chunks(query, chunk_size=ARCHIVE_CHUNK_SIZE):
+        chunk = []
+        for row in query.execution_options(stream_results=True).yield_per(chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def archive_session(self, session_id: int):
+        """
+        Move a completed session's metrics into the archive. Files are
+        written before the SQLite rows are deleted, in one transaction with
+        the archived_sessions entry. Returns the archived_sessions row as a
+        dict, or None if the session is missing, still active or already
+        archived.
+        """
+        db = SessionLocal()
+        try:
+            session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+            if not session or session.status != "completed" or db.query(ArchivedSession).get(session_id):
+                return None
+            day = session.start_time.strftime("%Y-%m-%d")
+
+            person_query = db.query(
+                PersonMetric.timestamp, PersonMetric.person_id, PersonMetric.emotion,
+                PersonMetric.emotion_confidence, PersonMetric.attention_score, PersonMetric.gaze_focus,
+                PersonMetric.head_pose, PersonMetric.audio_noise, PersonMetric.speech_ratio
+            ).filter(PersonMetric.session_id == session_id).order_by(PersonMetric.id)
+
+            def person_columns(chunk):
+                ts, pid, emotion, conf, att, gaze, pose, noise, speech = zip(*chunk)
+                yaw, pitch, roll = zip(*(_head_pose(p) for p in pose))
+                return [ts, [str(p) for p in pid], emotion, conf, att, gaze, yaw, pitch, roll, noise, speech]
+
+            audio_query = db.query(
+                AudioMetric.timestamp, AudioMetric.noise_db, AudioMetric.speech_ratio, AudioMetric.activity_type
+            ).filter(AudioMetric.session_id == session_id).order_by(AudioMetric.id)
+
+            person_rows = self._write('person_metrics', day, session_id, self._chunks(person_query),
+                                      person_columns)
+            audio_rows = self._write('audio_metrics', day, session_id, self._chunks(audio_query),
+                                     lambda chunk: list(zip(*chunk)))
+
+            db.query(PersonMetric).filter(PersonMetric.session_id == session_id).delete(synchronize_session=False)
+            db.query(AudioMetric).filter(AudioMetric.session_id == session_id).delete(synchronize_session=False)
+            entry = ArchivedSession(session_id=session_id, day=day, person_rows=person_rows, audio_rows=audio_rows)
+            db.add(entry)
+            db.commit()
+            return {'session_id': session_id, 'day': day, 'person_rows': person_rows, 'audio_rows': audio_rows}
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def archive_completed(self, older_than_days=ARCHIVE_AFTER_DAYS):
+        """Archive every completed session that ended more than older_than_days ago."""
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        db = SessionLocal()
+        try:
+            archived = db.query(ArchivedSession.session_id)
+            ids = [sid for (sid,) in db.query(SessionModel.id)
+                   .filter(SessionModel.status == "completed", SessionModel.end_time < cutoff)
+                   .filter(~SessionModel.id.in_(archived))
+                   .order_by(SessionModel.id)]
+        finally:
+            db.close()
+        results = []
+        for session_id in ids:
+            try:
+                result = self.archive_session(session_id)
+                if result:
+                    results.append(result)
+            except Exception as e:
+                print(f"Archive error (session {session_id}): {e}")
+        return results
+
+    # Reading
+
+    def archived_ids(self, session_ids=None):
+        db = SessionLocal()
+        try:
+            q = db.query(ArchivedSession.session_id)
+            if session_ids:
+                q = q.filter(ArchivedSession.session_id.in_(session_ids))
+            return [sid for (sid,) in q]
+        finally:
+            db.close()
+
+    def _dataset(self, table):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        path = os.path.abspath(os.path.join(self.root, table))
+        if not os.path.isdir(path):
+            return None
+        partitioning = ds.partitioning(pa.schema([('day', pa.string()), ('session_id', pa.int32())]), flavor="hive")
+        return ds.dataset(path, format="parquet", partitioning=partitioning,
+                          filesystem=fs.LocalFileSystem(use_mmap=True))
+
+    @staticmethod
+    def _filter(session_ids=None, start=None, end=None, student_id=None):
+        import pyarrow.dataset as ds
+
+        expr = None
+        def both(e):
+            return e if expr is None else expr & e
+        if session_ids:
+            expr = both(ds.field('session_id').isin(list(session_ids)))
+        if start:
+            # Partition pruning on day (sessions that started a day earlier may still have rows
+            # after `start`), then exact on the timestamp column
+            expr = both(ds.field('day') >= (start - SESSION_MAX_SPAN).strftime("%Y-%m-%d"))
+            expr = both(ds.field('timestamp') >= start)
+        if end:
+            expr = both(ds.field('day') <= end.strftime("%Y-%m-%d"))
+            expr = both(ds.field('timestamp') < end)
+        if student_id is not None:
+            expr = both(ds.field('student_id') == str(student_id))
+        return expr
+
+    def scan(self, table, columns=None, session_ids=None, start=None, end=None, student_id=None):
+        """Archived rows as a pyarrow Table with only `columns` (plus partition keys when asked for)."""
+        dataset = self._dataset(table)
+        if dataset is None:
+            import pyarrow as pa
+            schema = pa.schema(list(_schemas()[table]) + [('day', pa.string()), ('session_id', pa.int32())])
+            return schema.empty_table().select(columns) if columns else schema.empty_table()
+        return dataset.to_table(columns=columns, filter=self._filter(session_ids, start, end, student_id))
+
+    def has_metrics(self, session_ids=None, start=None, end=None):
+        dataset = self._dataset('person_metrics')
+        if dataset is None:
+            return False
+        return dataset.head(1, columns=['timestamp'], filter=self._filter(session_ids, start, end)).num_rows > 0
+
+    def iter_metric_chunks(self, session_ids=None, start=None, end=None, chunk_size=ARCHIVE_CHUNK_SIZE):
+        """Rows shaped like ReportGenerator's SQLite export query, one record batch at a time."""
+        dataset = self._dataset('person_metrics')
+        if dataset is None:
+            return
+        columns = ['session_id', 'timestamp', 'student_id', 'emotion', 'confidence', 'attention']
+        for batch in dataset.to_batches(columns=columns, filter=self._filter(session_ids, start, end),
+                                        batch_size=chunk_size):
+            if batch.num_rows:
+                yield list(zip(*(column_values(batch, c) for c in columns)))
+
+    def bucket_means(self, table, columns, session_id, bucket_seconds):
+        """
+        One archived session's `columns` averaged per time bucket (NaN/nulls
+        skipped). Returns (bucket numbers, {column: means}, samples per bucket),
+        sorted by bucket.
+        """
+        data = self.scan(table, ['timestamp'] + list(columns), session_ids=[session_id])
+        if not data.num_rows:
+            return np.empty(0, dtype=np.int64), {c: np.empty(0) for c in columns}, np.empty(0, dtype=np.int64)
+        seconds = data.column('timestamp').cast('int64').to_numpy() // 1_000_000
+        buckets, inverse = np.unique(seconds // bucket_seconds, return_inverse=True)
+        means = {}
+        for c in columns:
+            values = data.column(c).to_numpy(zero_copy_only=False).astype(np.float64)
+            valid = ~np.isnan(values)
+            sums = np.bincount(inverse[valid], weights=values[valid], minlength=len(buckets))
+            n = np.bincount(inverse[valid], minlength=len(buckets))
+            means[c] = np.where(n > 0, sums / np.maximum(n, 1), np.nan)
+        return buckets, means, np.bincount(inverse, minlength=len(buckets))
+
+    def attention_rollup(self, session_id: int, bucket_seconds: int = 60):
+        """Same result as AnalyticsService.get_attention_rollup, for an archived session."""
+        buckets, means, counts = self.bucket_means('person_metrics', ['attention'], session_id, bucket_seconds)
+        return [{
+            'time': datetime.utcfromtimestamp(int(b) * bucket_seconds),
+            'avg_attention': 0.0 if np.isnan(a) else float(a),
+            'samples': int(c)
+        } for b, a, c in zip(buckets, means['attention'], counts)]
+
+    def session_stats(self, session_ids=None, start=None, end=None, student_id=None):
+        """
+        Per archived session: day, average attention, sample count and
+        emotion counts, aggregated in Arrow over three columns.
+        """
+        table = self.scan('person_metrics', ['day', 'session_id', 'emotion', 'attention'],
+                          session_ids=session_ids, start=start, end=end, student_id=student_id)
+        if not table.num_rows:
+            return []
+        table = table.set_column(table.schema.get_field_index('emotion'), 'emotion',
+                                 table.column('emotion').cast('string'))
+        stats = {}
+        for row in table.group_by(['session_id', 'day']).aggregate(
+                [('attention', 'mean'), ('attention', 'count')]).to_pylist():
+            stats[row['session_id']] = {
+                'session_id': row['session_id'],
+                'day': row['day'],
+                'avg_attention': round(row['attention_mean'] or 0.0, 2),
+                'samples': row['attention_count'],
+                'emotions': {},
+            }
+        for row in table.group_by(['session_id', 'emotion']).aggregate([('emotion', 'count')]).to_pylist():
+            if row['emotion'] is not None:
+                stats[row['session_id']]['emotions'][row['emotion']] = row['emotion_count']
+        return [stats[k] for k in sorted(stats)]
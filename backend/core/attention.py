@@ -0,0 +1,132 @@
+"""
+Attention from geometry the face landmarker already produces: head pose
+(from MediaPipe's facial transformation matrix, or estimated from 2D
+landmarks when only points are available, e.g. pushed or replayed
+detections), iris position within each eye, and eye openness. Everything
+is computed for all faces of a frame at once.
+"""
+import numpy as np
+
+# Mesh indices (image-left eye first)
+NOSE_TIP, CHIN, FOREHEAD = 1, 152, 10
+CHEEK_L, CHEEK_R = 234, 454
+EYES = (
+    # iris center, corner (image-left), corner (image-right), upper lid, lower lid
+    (468, 33, 133, 159, 145),
+    (473, 362, 263, 386, 374),
+)
+REQUIRED = (NOSE_TIP, CHIN, FOREHEAD, CHEEK_L, CHEEK_R) + tuple(i for eye in EYES for i in eye)
+
+# Frontal-face calibration (nose tip sits ~40% of the way from eye line to chin)
+PITCH_NEUTRAL = 0.40
+PITCH_RANGE = 0.25
+# Iris travel from the eye's center to its corner, as a fraction of eye width
+GAZE_RANGE = 0.25
+
+# Tolerances before attention falls off (degrees / normalized gaze offset)
+YAW_TOLERANCE = 35.0
+PITCH_TOLERANCE = 25.0
+GAZE_TOLERANCE = 0.6
+# Eye opening / face width; below CLOSED the eyes count as shut
+EYES_CLOSED = 0.02
+EYES_OPEN = 0.04
+
+# Time constant (seconds) of the per-track exponential smoothing (track_state.py)
+ATTENTION_TAU = 1.0
+
+def pose_from_matrices(matrices):
+    """(N, 4, 4) facial transformation matrices -> (N, 3) yaw, pitch, roll in degrees."""
+    m = np.asarray(matrices, dtype=np.float64)
+    r = m[:, :3, :3] / np.linalg.norm(m[:, :3, :3], axis=1, keepdims=True)  # drop scale
+    pitch = np.degrees(np.arctan2(r[:, 2, 1], r[:, 2, 2]))
+    yaw = np.degrees(np.arctan2(-r[:, 2, 0], np.hypot(r[:, 2, 1], r[:, 2, 2])))
+    roll = np.degrees(np.arctan2(r[:, 1, 0], r[:, 0, 0]))
+    return np.stack([yaw, pitch, roll], axis=1)
+
+def pose_from_landmarks(points):
+    """
+    (N, 478, 2) image points -> (N, 3) yaw, pitch, roll in degrees, from the
+    nose tip's offset within the face outline. Coarser than the matrix but
+    needs nothing beyond the points.
+    """
+    p = np.asarray(points, dtype=np.float64)
+    eye_l, eye_r = p[:, EYES[0][1]], p[:, EYES[1][2]]
+    eye_vec = eye_r - eye_l
+    tilt = np.arctan2(eye_vec[:, 1], eye_vec[:, 0])  # image y points down
+
+    # Undo the tilt so yaw and pitch are measured along the face's own axes
+    c, s = np.cos(-tilt), np.sin(-tilt)
+    rot = np.stack([np.stack([c, -s], 1), np.stack([s, c], 1)], 1)  # (N, 2, 2)
+    q = np.einsum('nij,nkj->nki', rot, p - p[:, NOSE_TIP:NOSE_TIP + 1])
+
+    half_width = np.maximum((q[:, CHEEK_R, 0] - q[:, CHEEK_L, 0]) / 2, 1e-6)
+    center_x = (q[:, CHEEK_R, 0] + q[:, CHEEK_L, 0]) / 2
+    yaw = np.degrees(np.arcsin(np.clip(-center_x / half_width, -1, 1)))
+
+    eye_line = (q[:, EYES[0][1], 1] + q[:, EYES[1][2], 1]) / 2
+    span = np.maximum(q[:, CHIN, 1] - eye_line, 1e-6)
+    ratio = -eye_line / span  # nose tip is the origin
+    pitch = np.degrees(np.arcsin(np.clip((ratio - PITCH_NEUTRAL) / PITCH_RANGE, -1, 1)))
+    # Same sign convention as the transformation matrix
+    roll = -np.degrees(tilt)
+    return np.stack([yaw, pitch, roll], axis=1)
+
+def gaze_from_iris(points):
+    """
+    (N, 478, 2) -> (N, 2) horizontal and vertical gaze offsets, 0 when the
+    iris is centered in the eye and +-1 at the corners/lids, averaged over
+    both eyes.
+    """
+    p = np.asarray(points, dtype=np.float64)
+    offsets = []
+    for iris, left, right, top, bottom in EYES:
+        axis = p[:, right] - p[:, left]
+        width2 = np.maximum((axis ** 2).sum(axis=1), 1e-6)
+        h = ((p[:, iris] - p[:, left]) * axis).sum(axis=1) / width2
+        lid = p[:, bottom] - p[:, top]
+        height2 = np.maximum((lid ** 2).sum(axis=1), 1e-6)
+        v = ((p[:, iris] - p[:, top]) * lid).sum(axis=1) / height2
+        offsets.append(np.stack([(h - 0.5) / GAZE_RANGE, (v - 0.5) * 2], axis=1))
+    return np.clip((offsets[0] + offsets[1]) / 2, -1, 1)
+
+def eye_openness(points):
+    """(N, 478, 2) -> (N,) mean lid distance over face width."""
+    p = np.asarray(points, dtype=np.float64)
+    face_width = np.maximum(np.linalg.norm(p[:, CHEEK_R] - p[:, CHEEK_L], axis=1), 1.0)
+    lids = [np.linalg.norm(p[:, top] - p[:, bottom], axis=1) for _, _, _, top, bottom in EYES]
+    return (lids[0] + lids[1]) / 2 / face_width
+
+def estimate(detections_raw):
+    """
+    Adds 'head_pose' (yaw, pitch, roll), 'gaze_focus' (0-1) and
+    'attention_raw' (0-100) to every detection that has usable landmarks,
+    in one batched pass per frame. Others are left untouched.
+    """
+    usable = []
+    for i, det in enumerate(detections_raw):
+        points = det.get('landmarks')
+        if points is not None and len(points) > max(REQUIRED) and not np.isnan(np.asarray(points)[list(REQUIRED)]).any():
+            usable.append(i)
+    if not usable:
+        return
+
+    points = np.stack([np.asarray(detections_raw[i]['landmarks'], dtype=np.float64) for i in usable])
+    pose = pose_from_landmarks(points)
+    with_matrix = [j for j, i in enumerate(usable) if detections_raw[i].get('pose_matrix') is not None]
+    if with_matrix:
+        pose[with_matrix] = pose_from_matrices([detections_raw[usable[j]]['pose_matrix'] for j in with_matrix])
+    gaze = gaze_from_iris(points)
+    eyes = eye_openness(points)
+
+    yaw, pitch = pose[:, 0], pose[:, 1]
+    head = np.exp(-((yaw / YAW_TOLERANCE) ** 2 + (pitch / PITCH_TOLERANCE) ** 2))
+    looking = np.exp(-((gaze / GAZE_TOLERANCE) ** 2).sum(axis=1))
+    awake = np.clip((eyes - EYES_CLOSED) / (EYES_OPEN - EYES_CLOSED), 0, 1)
+    focus = head * looking
+    attention = 100 * head * (0.5 + 0.5 * looking) * awake
+
+    for j, i in enumerate(usable):
+        det = detections_raw[i]
+        det['head_pose'] = tuple(round(float(v), 1) for v in pose[j])
+        det['gaze_focus'] = round(float(focus[j]), 3)
+        det['attention_raw'] = float(attention[j])
@@ -1,18 +1,29 @@
-import librosa
+import math
 import numpy as np
 import os
 
+from .metrics import stage
+
+# Speech detection works on frames of this length
+SPEECH_FRAME_SECONDS = 0.02
+# A frame is speech when its energy is this far above the chunk's noise floor...
+SPEECH_FLOOR_RATIO = 2.0
+SPEECH_MIN_RMS = 0.002
+# ...and its zero-crossing rate is below this (higher is hiss-like noise)
+SPEECH_MAX_ZCR = 0.35
+
 class AudioAnalyzer:
     def __init__(self, sample_rate=16000):
         self.sample_rate = sample_rate
     
-    def analyze_audio_chunk(self, audio_data):
+    def analyze_audio_chunk(self, audio_data, sample_rate=None):
         """
         Analyzes raw audio bytes/array:
         1. Noise level (decibels)
         2. Speech vs silence ratio
         3. Sound activity patterns
         
+        sample_rate: rate of audio_data when it isn't self.sample_rate.
         Returns engagement metrics
         """
         try:
@@ -26,14 +37,21 @@ class AudioAnalyzer:
             if len(y) == 0:
                 return None
 
+            if sample_rate and sample_rate != self.sample_rate:
+                # Speech frames and thresholds assume self.sample_rate
+                from scipy.signal import resample_poly
+                g = math.gcd(int(sample_rate), self.sample_rate)
+                y = resample_poly(y, self.sample_rate // g, int(sample_rate) // g).astype(np.float32)
+
             # Metrics
-            noise_level = self.get_noise_level(y)  # dB
-            # speech_ratio = self.estimate_speech_ratio(y)  # 0-1 (Requires longer buffer usually)
-            activity = self.detect_activity(y)  # active/silent/chaotic
+            with stage("audio_analysis"):
+                noise_level = self.get_noise_level(y)  # dB
+                speech_ratio = self.estimate_speech_ratio(y)  # 0-1
+                activity = self.detect_activity(y)  # active/silent/chaotic
             
             return {
                 'noise_db': float(noise_level),
-                # 'speech_ratio': float(speech_ratio),
+                'speech_ratio': float(speech_ratio),
                 'activity_type': activity,
                 'engagement_level': self.map_to_engagement(noise_level, activity)
             }
@@ -46,9 +64,16 @@ class AudioAnalyzer:
         return 20 * np.log10(max(rms, 1e-10))
     
     def estimate_speech_ratio(self, y):
-        # Zero crossing rate is a simple proxy for speech vs noise
-        zcr = librosa.feature.zero_crossing_rate(y)
-        return np.mean(zcr)
+        """Share of 20 ms frames that look like speech: energy above the noise floor, voice-like zero crossings."""
+        n = max(int(self.sample_rate * SPEECH_FRAME_SECONDS), 1)
+        frames = y[:len(y) // n * n].reshape(-1, n)
+        if not len(frames):
+            return 0.0
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        zcr = np.mean(np.abs(np.diff(np.signbit(frames), axis=1)), axis=1)
+        floor = np.percentile(rms, 10)
+        speech = (rms > max(SPEECH_MIN_RMS, SPEECH_FLOOR_RATIO * floor)) & (zcr < SPEECH_MAX_ZCR)
+        return float(np.mean(speech))
     
     def detect_activity(self, y):
         # Simple energy based activity detection
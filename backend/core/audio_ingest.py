@@ -0,0 +1,185 @@
+"""
+Audio ingest for /ws/audio. The client declares its format in a first text
+message, e.g.
+
+    {"encoding": "s16le", "sample_rate": 48000, "channels": 2, "compression": "zlib"}
+
+encoding: s16le (default), f32le or mulaw; compression: none or zlib.
+Clients that send binary straight away get the old format (f32le, 16 kHz,
+mono). Incoming chunks are decoded without intermediate copies (a view on
+the message, converted into a preallocated scratch buffer), downmixed,
+resampled to the analysis rate with a streaming polyphase filter and
+written into a ring buffer. Analysis then runs on fixed windows, however
+large the client's chunks are.
+"""
+import math
+import zlib
+
+import numpy as np
+
+ENCODINGS = ('s16le', 'f32le', 'mulaw')
+COMPRESSIONS = ('none', 'zlib')
+MIN_RATE = 8000
+MAX_RATE = 48000
+MAX_CHANNELS = 8
+# Largest decoded chunk accepted, in seconds (bounds the zlib output as well)
+MAX_CHUNK_SECONDS = 5.0
+
+# Ring buffer capacity, and the analysis window/hop taken from it
+RING_SECONDS = 4.0
+WINDOW_SECONDS = 0.5
+HOP_SECONDS = 0.5
+
+LEGACY_FORMAT = {'encoding': 'f32le', 'sample_rate': 16000, 'channels': 1, 'compression': 'none'}
+
+def _mulaw_table():
+    """G.711 mu-law byte -> float32 in [-1, 1]."""
+    codes = ~np.arange(256, dtype=np.uint8)
+    sign = codes & 0x80
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = ((mantissa.astype(np.int32) << 3) + 0x84 << exponent) - 0x84
+    return (np.where(sign, -magnitude, magnitude) / 32768.0).astype(np.float32)
+
+MULAW_TABLE = _mulaw_table()
+
+def negotiate(config):
+    """Validated format dict from the client's first message; raises ValueError."""
+    fmt = dict(LEGACY_FORMAT, encoding='s16le')
+    fmt.update({k: config[k] for k in ('encoding', 'sample_rate', 'channels', 'compression') if k in config})
+    if fmt['encoding'] not in ENCODINGS:
+        raise ValueError(f"Unsupported encoding: {fmt['encoding']}")
+    if fmt['compression'] not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression: {fmt['compression']}")
+    fmt['sample_rate'] = int(fmt['sample_rate'])
+    fmt['channels'] = int(fmt['channels'])
+    if not MIN_RATE <= fmt['sample_rate'] <= MAX_RATE:
+        raise ValueError(f"sample_rate must be between {MIN_RATE} and {MAX_RATE}")
+    if not 1 <= fmt['channels'] <= MAX_CHANNELS:
+        raise ValueError(f"channels must be between 1 and {MAX_CHANNELS}")
+    return fmt
+
+class StreamResampler:
+    """
+    scipy's resample_poly applied chunk by chunk without seams: each call
+    filters with `context` input samples of history on the left and holds the
+    last `context` samples back as look-ahead for the next one, so the output
+    equals resampling the whole stream at once (delayed by `context` samples).
+    """
+    def __init__(self, rate_in, rate_out):
+        g = math.gcd(rate_in, rate_out)
+        self.up, self.down = rate_out // g, rate_in // g
+        self.passthrough = self.up == self.down
+        # resample_poly's filter spans 10 * max(up, down) upsampled taps each side
+        half = math.ceil(10 * max(self.up, self.down) / self.up)
+        self.context = math.ceil(half / self.down) * self.down
+        self.pending = np.zeros(self.context, dtype=np.float32)  # history + unprocessed input
+        # Seconds the output trails the input (the look-ahead)
+        self.delay = 0.0 if self.passthrough else self.context / rate_in
+
+    def process(self, samples):
+        if self.passthrough:
+            return samples
+        from scipy.signal import resample_poly
+
+        data = np.concatenate((self.pending, samples))
+        # Emit whole multiples of `down`, keeping `context` samples of look-ahead
+        usable = (len(data) - 2 * self.context) // self.down * self.down
+        if usable <= 0:
+            self.pending = data
+            return samples[:0]
+        block = data[:usable + 2 * self.context]
+        out = resample_poly(block, self.up, self.down)
+        skip = self.context * self.up // self.down
+        out = out[skip:skip + usable * self.up // self.down].astype(np.float32, copy=False)
+        self.pending = data[usable:]
+        return out
+
+class AudioRing:
+    """Fixed float32 ring of the most recent samples."""
+    def __init__(self, capacity):
+        self.buf = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.pos = 0     # next write index
+        self.total = 0   # samples written since start
+
+    def write(self, samples):
+        n = len(samples)
+        if n >= self.capacity:
+            samples = samples[-self.capacity:]
+            n = self.capacity
+        first = min(n, self.capacity - self.pos)
+        self.buf[self.pos:self.pos + first] = samples[:first]
+        self.buf[:n - first] = samples[first:]
+        self.pos = (self.pos + n) % self.capacity
+        self.total += len(samples)
+
+    def latest(self, n):
+        """The last n samples, oldest first (a view unless they wrap around)."""
+        n = min(n, self.capacity, self.total)
+        start = self.pos - n
+        if start >= 0:
+            return self.buf[start:self.pos]
+        return np.concatenate((self.buf[start:], self.buf[:self.pos]))
+
+class AudioStream:
+    """One microphone connection: decode, downmix, resample, buffer, window."""
+    def __init__(self, fmt, analysis_rate=16000):
+        self.fmt = fmt
+        self.rate = analysis_rate
+        self.channels = fmt['channels']
+        self.resampler = StreamResampler(fmt['sample_rate'], analysis_rate)
+        self.ring = AudioRing(int(RING_SECONDS * analysis_rate))
+        self.window = int(WINDOW_SECONDS * analysis_rate)
+        self.hop = int(HOP_SECONDS * analysis_rate)
+        self.next_window = self.window
+        self.max_bytes = int(MAX_CHUNK_SECONDS * fmt['sample_rate'] * fmt['channels'] * 4)
+        self._scratch = np.empty(0, dtype=np.float32)
+
+    def _float_view(self, data):
+        enc = self.fmt['encoding']
+        if enc == 'f32le':
+            return np.frombuffer(data, dtype='<f4', count=len(data) // 4)
+        if enc == 's16le':
+            raw = np.frombuffer(data, dtype='<i2', count=len(data) // 2)
+        else:
+            raw = np.frombuffer(data, dtype=np.uint8)
+        if len(self._scratch) < len(raw):
+            self._scratch = np.empty(max(len(raw), 2 * len(self._scratch)), dtype=np.float32)
+        out = self._scratch[:len(raw)]
+        if enc == 's16le':
+            np.multiply(raw, np.float32(1 / 32768), out=out, casting='unsafe')
+        else:
+            np.take(MULAW_TABLE, raw, out=out)
+        return out
+
+    def feed(self, data):
+        """
+        Add one message's audio. Returns the analysis windows it completed
+        (usually 0 or 1) as (samples, seconds since the window's end); the
+        samples are a view into the ring, valid until the next feed().
+        """
+        if self.fmt['compression'] == 'zlib':
+            d = zlib.decompressobj()
+            data = d.decompress(data, self.max_bytes)
+            if d.unconsumed_tail:
+                raise ValueError("Audio chunk too large")
+        elif len(data) > self.max_bytes:
+            raise ValueError("Audio chunk too large")
+        samples = self._float_view(data)
+        if self.channels > 1:
+            frames = len(samples) // self.channels
+            samples = samples[:frames * self.channels].reshape(frames, self.channels).mean(axis=1, dtype=np.float32)
+        self.ring.write(self.resampler.process(samples))
+
+        windows = []
+        while self.ring.total >= self.next_window:
+            behind = self.ring.total - self.next_window
+            if behind + self.window > self.ring.capacity:
+                # A huge chunk: skip windows that already left the ring
+                self.next_window = self.ring.total
+                behind = 0
+            lag = behind / self.rate + self.resampler.delay
+            windows.append((self.ring.latest(self.window + behind)[:self.window], lag))
+            self.next_window += self.hop
+        return windows
@@ -0,0 +1,78 @@
+"""
+Emotion labels from the 52 blendshape coefficients the face landmarker
+already outputs: a softmax over a linear model, evaluated for all faces of
+a frame in one matrix product. Weights live in a small JSON file
+(emotion_weights.json); benchmarks/emotion_calibration.py refits and
+evaluates them on labelled images.
+"""
+import json
+import os
+
+import numpy as np
+
+DEFAULT_WEIGHTS = os.path.join(os.path.dirname(__file__), "emotion_weights.json")
+# Time constant (seconds) for smoothing each track's class probabilities
+EMOTION_TAU = 1.5
+
+# FaceLandmarker blendshape categories, in output order
+BLENDSHAPE_NAMES = [
+    '_neutral', 'browDownLeft', 'browDownRight', 'browInnerUp', 'browOuterUpLeft', 'browOuterUpRight',
+    'cheekPuff', 'cheekSquintLeft', 'cheekSquintRight', 'eyeBlinkLeft', 'eyeBlinkRight',
+    'eyeLookDownLeft', 'eyeLookDownRight', 'eyeLookInLeft', 'eyeLookInRight', 'eyeLookOutLeft',
+    'eyeLookOutRight', 'eyeLookUpLeft', 'eyeLookUpRight', 'eyeSquintLeft', 'eyeSquintRight',
+    'eyeWideLeft', 'eyeWideRight', 'jawForward', 'jawLeft', 'jawOpen', 'jawRight', 'mouthClose',
+    'mouthDimpleLeft', 'mouthDimpleRight', 'mouthFrownLeft', 'mouthFrownRight', 'mouthFunnel',
+    'mouthLeft', 'mouthLowerDownLeft', 'mouthLowerDownRight', 'mouthPressLeft', 'mouthPressRight',
+    'mouthPucker', 'mouthRight', 'mouthRollLower', 'mouthRollUpper', 'mouthShrugLower',
+    'mouthShrugUpper', 'mouthSmileLeft', 'mouthSmileRight', 'mouthStretchLeft', 'mouthStretchRight',
+    'mouthUpperUpLeft', 'mouthUpperUpRight', 'noseSneerLeft', 'noseSneerRight',
+]
+
+class BlendshapeEmotionClassifier:
+    def __init__(self, path=DEFAULT_WEIGHTS):
+        with open(path) as f:
+            spec = json.load(f)
+        self.path = path
+        self.labels = tuple(spec['labels'])
+        # Features are matched by name, so files may list any subset in any order
+        index = {name: i for i, name in enumerate(BLENDSHAPE_NAMES)}
+        self.weights = np.zeros((len(self.labels), len(BLENDSHAPE_NAMES)), dtype=np.float32)
+        for j, name in enumerate(spec['features']):
+            if name in index:
+                self.weights[:, index[name]] = [row[j] for row in spec['weights']]
+        self.bias = np.asarray(spec['bias'], dtype=np.float32)
+        self.source = spec.get('source', '')
+
+    def predict_proba(self, scores):
+        """(N, 52) blendshape scores -> (N, labels) probabilities."""
+        logits = np.asarray(scores, dtype=np.float32) @ self.weights.T + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def classify(self, scores):
+        """
+        Returns (probabilities, [(label, confidence, explanation)]), where the
+        explanation names the two blendshapes that pushed hardest toward the
+        winning label.
+        """
+        scores = np.asarray(scores, dtype=np.float32)
+        probs = self.predict_proba(scores)
+        best = probs.argmax(axis=1)
+        contrib = scores * self.weights[best]
+        top = np.argsort(-contrib, axis=1)[:, :2]
+        results = []
+        for i, k in enumerate(best):
+            drivers = [BLENDSHAPE_NAMES[j] for j in top[i] if contrib[i, j] > 0]
+            results.append((self.labels[k], round(float(probs[i, k]), 3), ", ".join(drivers) or "baseline"))
+        return probs, results
+
+def save_weights(path, labels, weights, bias, source):
+    """Write weights in the layout DEFAULT_WEIGHTS uses (one label per line)."""
+    rows = [json.dumps([round(float(w), 4) for w in row]) for row in weights]
+    with open(path, "w") as f:
+        f.write("{\n")
+        f.write(f'  "version": 1,\n  "source": {json.dumps(source)},\n  "labels": {json.dumps(list(labels))},\n')
+        f.write(f'  "features": {json.dumps(BLENDSHAPE_NAMES)},\n  "weights": [\n')
+        f.write(",\n".join("    " + r for r in rows) + "\n  ],\n")
+        f.write(f'  "bias": {json.dumps([round(float(b), 4) for b in bias])}\n}}\n')
@@ -1,32 +1,202 @@
+"""
+Camera capture. A capture profile fixes what the driver delivers instead of
+leaving it to its defaults (which can be 1080p raw YUYV at 5 FPS with a
+queue of stale frames): resolution, frame rate, MJPG compression (cheap to
+transfer and decode) and a one-frame driver buffer. The profile is applied
+when the camera opens and read back, and any setting the driver did not
+take is reported in status().
+
+Frames are fetched with grab() and decoded with retrieve(), so a frame that
+sat in the buffer while the pipeline was busy is dropped without being
+decoded. Capture latency (time blocked waiting for the frame, decode time,
+and the frame's age when the driver timestamps it) is tracked per frame.
+"""
 import cv2
+import json
+import os
 import time
 import asyncio
+from collections import deque
+
+import numpy as np
 from fastapi import WebSocket
 
+from .metrics import stage, FRAMES_DROPPED
+
+# name -> requested settings; fourcc None and missing keys leave the driver default
+CAPTURE_PROFILES = {
+    'vga': {'width': 640, 'height': 480, 'fps': 30, 'fourcc': 'MJPG', 'buffer_size': 1},
+    'vga_15': {'width': 640, 'height': 480, 'fps': 15, 'fourcc': 'MJPG', 'buffer_size': 1},
+    'hd': {'width': 1280, 'height': 720, 'fps': 30, 'fourcc': 'MJPG', 'buffer_size': 1},
+    'full_hd': {'width': 1920, 'height': 1080, 'fps': 30, 'fourcc': 'MJPG', 'buffer_size': 1},
+    'driver': {},
+}
+# CAMERA_PROFILE picks a profile by name, or gives the settings as JSON
+DEFAULT_PROFILE = os.environ.get("CAMERA_PROFILE", "vga")
+# Capture latency statistics cover this many recent frames
+LATENCY_WINDOW = 120
+# A buffered frame older than this many frame intervals is dropped undecoded
+STALE_INTERVALS = 1.5
+# Driver timestamps further than this from the monotonic clock are not comparable to it
+MAX_TIMESTAMP_SKEW = 10.0
+
+def resolve_profile(profile):
+    """Settings dict for a profile name, JSON object string or dict; raises ValueError."""
+    if isinstance(profile, dict):
+        return dict(profile)
+    if profile in CAPTURE_PROFILES:
+        return dict(CAPTURE_PROFILES[profile])
+    try:
+        settings = json.loads(profile)
+    except (TypeError, ValueError):
+        settings = None
+    if not isinstance(settings, dict):
+        raise ValueError(f"Unknown camera profile '{profile}' (expected one of {', '.join(CAPTURE_PROFILES)} or JSON)")
+    return settings
+
+def _fourcc_name(code):
+    code = int(code)
+    name = "".join(chr((code >> 8 * i) & 0xFF) for i in range(4))
+    return name if code and name.isprintable() else None
+
+def _percentile(values, q):
+    return round(float(np.percentile(values, q)), 2) if values else None
+
 class CameraService:
-    def __init__(self, camera_id=0):
+    def __init__(self, camera_id=0, profile=DEFAULT_PROFILE):
         self.camera_id = camera_id
+        self.profile_name = profile if isinstance(profile, str) and profile in CAPTURE_PROFILES else "custom"
+        self.profile = resolve_profile(profile)
         self.cap = None
         self.is_running = False
+        # Shape of the last captured frame, so callers can size a buffer for get_frame(out=...)
+        self.frame_shape = None
+        self.settings = {}      # what the driver actually uses after the profile was applied
+        self.mismatches = {}    # setting -> (requested, actual) where they differ
+        self.frame_interval = None
+        self.last_grab = None
+        self.stale_dropped = 0
+        self.frames = 0
+        self.read_ms = deque(maxlen=LATENCY_WINDOW)    # time in get_frame: waiting for the frame + decode
+        self.decode_ms = deque(maxlen=LATENCY_WINDOW)
+        self.age_ms = deque(maxlen=LATENCY_WINDOW)     # exposure -> decoded, when the driver timestamps frames
+        self.grab_times = deque(maxlen=LATENCY_WINDOW)
 
     def start(self):
         if self.cap is None:
             self.cap = cv2.VideoCapture(self.camera_id)
             self.is_running = True
+            if self.cap.isOpened():
+                self._apply_profile()
+
+    def _apply_profile(self):
+        """Set the profile (FOURCC first: drivers pick the size and rate per format), then read it back."""
+        p = self.profile
+        if p.get('fourcc'):
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*p['fourcc']))
+        if p.get('width'):
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, p['width'])
+        if p.get('height'):
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, p['height'])
+        if p.get('fps'):
+            self.cap.set(cv2.CAP_PROP_FPS, p['fps'])
+        if p.get('buffer_size'):
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, p['buffer_size'])
+
+        self.settings = {
+            'width': int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': round(self.cap.get(cv2.CAP_PROP_FPS), 2),
+            'fourcc': _fourcc_name(self.cap.get(cv2.CAP_PROP_FOURCC)),
+            'buffer_size': int(self.cap.get(cv2.CAP_PROP_BUFFERSIZE)),
+            'backend': self.cap.getBackendName(),
+        }
+        self.mismatches = {}
+        for key in ('width', 'height', 'fps', 'fourcc', 'buffer_size'):
+            wanted, actual = p.get(key), self.settings[key]
+            # Drivers that don't report a property (0 or -1) can't be checked
+            if wanted and actual not in (None, 0, -1) and actual != wanted:
+                self.mismatches[key] = (wanted, actual)
+        if self.mismatches:
+            print(f"⚠️ Camera {self.camera_id} ignored part of profile '{self.profile_name}': {self.mismatches}")
+        if self.settings['width'] and self.settings['height']:
+            self.frame_shape = (self.settings['height'], self.settings['width'], 3)
+        fps = self.settings['fps'] or p.get('fps')
+        self.frame_interval = 1.0 / fps if fps else None
 
     def stop(self):
         if self.cap:
             self.cap.release()
             self.cap = None
             self.is_running = False
+            self.last_grab = None
 
-    def get_frame(self):
+    def _grab(self):
+        """Grab the next frame without decoding it; a frame left waiting in the driver buffer is skipped."""
+        now = time.perf_counter()
+        if (self.last_grab is not None and self.frame_interval
+                and now - self.last_grab > STALE_INTERVALS * self.frame_interval):
+            # Captured while we were busy: drop it, the next one is fresh
+            if self.cap.grab():
+                self.stale_dropped += 1
+                FRAMES_DROPPED.labels("camera_stale").inc()
+        ok = self.cap.grab()
+        self.last_grab = time.perf_counter()
+        return ok
+
+    def get_frame(self, out=None):
+        """
+        Next frame, or None. With `out` (an array of the camera's frame
+        shape, e.g. an inference pool slot) the frame is decoded into it.
+        """
         if self.is_running and self.cap:
-            ret, frame = self.cap.read()
+            t0 = time.perf_counter()
+            with stage("capture"):
+                ret = self._grab()
+                t1 = time.perf_counter()
+                if ret:
+                    ret, frame = self.cap.retrieve(out) if out is not None else self.cap.retrieve()
             if ret:
+                t2 = time.perf_counter()
+                self.frame_shape = frame.shape
+                self._record(t0, t1, t2)
                 return frame
+            FRAMES_DROPPED.labels("capture_failed").inc()
         return None
 
+    def _record(self, t0, t1, t2):
+        self.frames += 1
+        self.read_ms.append((t2 - t0) * 1000)
+        self.decode_ms.append((t2 - t1) * 1000)
+        self.grab_times.append(t1)
+        # V4L2 reports the buffer's CLOCK_MONOTONIC timestamp; other backends a stream position
+        stamp = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        now = time.monotonic()
+        if stamp and 0 <= now - stamp < MAX_TIMESTAMP_SKEW:
+            self.age_ms.append((now - stamp) * 1000)
+
+    def status(self):
+        """Profile, what the driver applied, and capture latency over the last LATENCY_WINDOW frames."""
+        span = self.grab_times[-1] - self.grab_times[0] if len(self.grab_times) > 1 else 0
+        read, decode, age = list(self.read_ms), list(self.decode_ms), list(self.age_ms)
+        return {
+            'camera_id': self.camera_id,
+            'running': self.is_running,
+            'opened': bool(self.cap is not None and self.cap.isOpened()),
+            'profile': self.profile_name,
+            'requested': self.profile,
+            'applied': self.settings,
+            'mismatches': {k: {'requested': w, 'actual': a} for k, (w, a) in self.mismatches.items()},
+            'frames': self.frames,
+            'stale_dropped': self.stale_dropped,
+            'measured_fps': round((len(self.grab_times) - 1) / span, 2) if span else None,
+            'latency_ms': {
+                'read_p50': _percentile(read, 50), 'read_p95': _percentile(read, 95),
+                'decode_p50': _percentile(decode, 50), 'decode_p95': _percentile(decode, 95),
+                'age_p50': _percentile(age, 50), 'age_p95': _percentile(age, 95),
+            },
+        }
+
     async def stream_frames(self, websocket: WebSocket):
         await websocket.accept()
         self.start()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 import datetime
@@ -8,7 +8,10 @@ import os
 DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "student_db")
 os.makedirs(DB_DIR, exist_ok=True)
 
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(DB_DIR, 'attendance.db')}"
+# ATTENDANCE_DB_URL points the app (or a benchmark) at another database
+SQLALCHEMY_DATABASE_URL = os.environ.get(
+    "ATTENDANCE_DB_URL", f"sqlite:///{os.path.join(DB_DIR, 'attendance.db')}"
+)
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
@@ -24,23 +27,26 @@ class EmotionMetric(Base):
     student_id = Column(String, index=True, default="unknown")
     emotion = Column(String)
     confidence = Column(Float)
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
 
 class AudioMetric(Base):
     __tablename__ = "audio_metrics"
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, index=True, default="default")
+    session_id = Column(Integer, ForeignKey("sessions.id"), index=True)
     noise_db = Column(Float)
     speech_ratio = Column(Float)
     activity_type = Column(String)
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+    # Per-session time-range scans (fusion with person_metrics)
+    __table_args__ = (Index("ix_audio_metrics_session_time", "session_id", "timestamp"),)
 
 class Session(Base):
     __tablename__ = "sessions"
 
     id = Column(Integer, primary_key=True, index=True)
-    teacher_id = Column(String, default="default_teacher")
+    teacher_id = Column(String, default="default_teacher", index=True)
     class_id = Column(String, default="default_class")
     start_time = Column(DateTime, default=datetime.datetime.utcnow)
     end_time = Column(DateTime, nullable=True)
@@ -60,21 +66,46 @@ class SessionPerson(Base):
     dominant_emotion = Column(String, nullable=True)
     notes = Column(Text, nullable=True)
 
+class SessionPresence(Base):
+    __tablename__ = "session_presence"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("sessions.id"), index=True)
+    person_id = Column(String, index=True)
+    status = Column(String) # present, late, partial, absent
+    first_seen = Column(Float, default=0.0) # seconds from session start
+    intervals = Column(Text) # JSON [[start, end], ...], seconds from session start
+    track_ids = Column(String) # tracker ids merged into this person, comma-separated
+
+class SessionHeatmap(Base):
+    __tablename__ = "session_heatmaps"
+
+    session_id = Column(Integer, ForeignKey("sessions.id"), primary_key=True)
+    rows = Column(Integer)
+    cols = Column(Integer)
+    frame_width = Column(Integer, nullable=True)
+    frame_height = Column(Integer, nullable=True)
+    attention_sum = Column(Text) # JSON rows x cols, summed per-frame attention (see core/heatmap.py)
+    engagement_sum = Column(Text) # JSON rows x cols
+    counts = Column(Text) # JSON rows x cols, samples per cell
+
 class PersonMetric(Base):
     __tablename__ = "person_metrics"
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("sessions.id"))
+    session_id = Column(Integer, ForeignKey("sessions.id"), index=True)
     person_id = Column(String, index=True)
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     emotion = Column(String)
     emotion_confidence = Column(Float)
     attention_score = Column(Float)
     gaze_focus = Column(Float, nullable=True)
     head_pose = Column(String, nullable=True)
-    audio_noise = Column(Float, nullable=True)
+    audio_noise = Column(Float, nullable=True) # room audio at this sample (see fusion.py)
     speech_ratio = Column(Float, nullable=True)
 
+    __table_args__ = (Index("ix_person_metrics_session_time", "session_id", "timestamp"),)
+
 class Insight(Base):
     __tablename__ = "insights"
 
@@ -85,6 +116,33 @@ class Insight(Base):
     insight_text = Column(Text)
     generated_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+class Recommendation(Base):
+    __tablename__ = "recommendations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, index=True)
+    student_id = Column(String(50), nullable=True)
+    recommendation = Column(Text)
+    urgency_level = Column(String(20)) # alert, warning, info, success
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ArchivedSession(Base):
+    __tablename__ = "archived_sessions"
+
+    session_id = Column(Integer, primary_key=True)
+    day = Column(String(10)) # archive partition (session start date, UTC)
+    person_rows = Column(Integer, default=0)
+    audio_rows = Column(Integer, default=0)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class MaintenanceWatermark(Base):
+    __tablename__ = "maintenance_watermarks"
+
+    table_name = Column(String(50), primary_key=True)
+    bucket_seconds = Column(Integer, primary_key=True) # retention tier
+    done_until = Column(DateTime, nullable=True) # rows before this are compacted to the tier
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 class SystemLog(Base):
     __tablename__ = "system_logs"
 
@@ -94,7 +152,41 @@ class SystemLog(Base):
     message = Column(String)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
 
+class StudentPoints(Base):
+    __tablename__ = "student_points"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, index=True)
+    student_id = Column(String(50))
+    points = Column(Integer, default=0)
+    badge = Column(String(50), nullable=True)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+
+class TeacherProfile(Base):
+    __tablename__ = "teacher_profiles"
+
+    teacher_id = Column(String(50), primary_key=True)
+    effectiveness_score = Column(Float, default=0.0)
+    total_sessions = Column(Integer, default=0)
+    avg_engagement = Column(Float, default=0.0)
+    improvement_trend = Column(Float, default=0.0)
+
+class TeacherStudentStat(Base):
+    __tablename__ = "teacher_student_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    teacher_id = Column(String(50), index=True)
+    person_id = Column(String, index=True)
+    sessions = Column(Integer, default=0)
+    avg_attention = Column(Float, default=0.0)
+    last_attention = Column(Float, default=0.0)
+    last_change = Column(Float, default=0.0)
+
 def init_db():
+    if engine.dialect.name == "sqlite":
+        # Only takes effect on a new, empty database (see core/maintenance.py)
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
     Base.metadata.create_all(bind=engine)
 
 def get_db():
@@ -0,0 +1,315 @@
+"""
+Face/emotion detector backends behind one interface, so a stream can use
+whichever suits the machine:
+
+    mediapipe        FaceLandmarker + blendshape emotions (emotion_detector_v2)
+    mediapipe_tiled  the same on overlapping tiles, for large rooms (tiled_detection)
+    fer              FER's MTCNN face detector and CNN emotions (emotion_detection)
+    haar             OpenCV Haar cascade (face_detection); boxes only, no emotions
+
+Every backend takes a batch of frames and returns a FaceBatch: one array
+per field over all faces found (frame index, box, emotion, confidence,
+landmarks where the backend has them). detect(frame) gives the per-frame
+dict list SessionManager and the tracker consume.
+
+DETECTOR_BACKEND picks the backend for the camera ('auto' runs a short
+benchmark once per process and takes the first of DETECTOR_CANDIDATES that
+keeps up with DETECTOR_TARGET_FPS, or the fastest one if none does). Ingest rooms
+can override it per stream with a "detector" key in their config.
+"""
+import os
+import threading
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+from .metrics import stage, DETECTOR_ERRORS
+from .session_recorder import EMOTION_LABELS, EMOTION_INDEX, UNKNOWN_EMOTION
+from .tiled_detection import TiledDetector, parse_grid, DETECTION_TILES, DETECTION_BACK_TILES
+
+# Backend for camera streams: a name from BACKENDS, or 'auto'
+DETECTOR_BACKEND = os.environ.get("DETECTOR_BACKEND", "mediapipe_tiled" if DETECTION_TILES else "mediapipe")
+# 'auto' wants at least this many frames per second from the detector alone
+DETECTOR_TARGET_FPS = float(os.environ.get("DETECTOR_TARGET_FPS", "15"))
+# Tried by 'auto' in this order (most capable first)
+DETECTOR_CANDIDATES = os.environ.get(
+    "DETECTOR_CANDIDATES", ("mediapipe_tiled," if DETECTION_TILES else "") + "mediapipe,fer,haar").split(",")
+# Timed frames per candidate (after one warm-up frame)
+SELECTION_FRAMES = 5
+# Tile grid for mediapipe_tiled when DETECTION_TILES isn't set
+DEFAULT_TILE_GRID = (3, 4)
+# 'auto' benchmarks once per process; later streams reuse its choice
+_auto_selection = None
+_auto_lock = threading.Lock()
+CALIBRATION_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "fixtures", "face.jpg")
+
+def _emotion_result(label, confidence, explanation):
+    from .emotion_detector_v2 import EmotionResult
+    return EmotionResult(emotion=label, confidence=confidence, explanation=explanation)
+
+class FaceBatch:
+    """
+    Faces found in a batch of frames, struct-of-arrays: row i of every
+    array is face i, which belongs to frame frame_index[i].
+
+        frame_index  (N,) int32
+        boxes        (N, 4) int32, x y w h
+        emotion      (N,) uint8 index into EMOTION_LABELS (UNKNOWN_EMOTION if unlabeled)
+        confidence   (N,) float32
+        landmarks    (N, P, 2) float32 or None
+    plus optional per-face extras (pose matrices, blendshapes, class
+    probabilities) that only some backends produce.
+    """
+    def __init__(self, n_frames, frame_index, boxes, emotion, confidence, landmarks=None,
+                 explanations=None, extras=None):
+        self.n_frames = n_frames
+        self.frame_index = frame_index
+        self.boxes = boxes
+        self.emotion = emotion
+        self.confidence = confidence
+        self.landmarks = landmarks
+        self.explanations = explanations or [""] * len(frame_index)
+        self.extras = extras or [{} for _ in range(len(frame_index))]
+
+    def __len__(self):
+        return len(self.frame_index)
+
+    def counts(self):
+        """Faces per frame."""
+        return np.bincount(self.frame_index, minlength=self.n_frames)
+
+    @classmethod
+    def from_detections(cls, per_frame):
+        """Packs per-frame lists of detect()-style dicts."""
+        dets = [d for frame in per_frame for d in frame]
+        frame_index = np.repeat(np.arange(len(per_frame), dtype=np.int32), [len(f) for f in per_frame])
+        boxes = np.array([d['bbox'] for d in dets], dtype=np.int32).reshape(-1, 4)
+        emotion = np.array([EMOTION_INDEX.get(d['emotion'].emotion, UNKNOWN_EMOTION) for d in dets], dtype=np.uint8)
+        confidence = np.array([d['emotion'].confidence for d in dets], dtype=np.float32)
+        landmarks = None
+        shapes = {np.shape(d['landmarks']) for d in dets if d.get('landmarks') is not None}
+        if dets and len(shapes) == 1 and all(d.get('landmarks') is not None for d in dets):
+            landmarks = np.stack([d['landmarks'] for d in dets]).astype(np.float32)
+        extras = [{k: d[k] for k in ('pose_matrix', 'blendshapes', 'emotion_probs', 'emotion_labels') if k in d}
+                  for d in dets]
+        return cls(len(per_frame), frame_index, boxes, emotion, confidence, landmarks,
+                   [d['emotion'].explanation for d in dets], extras)
+
+    def detections(self, frame):
+        """Frame `frame`'s faces as detect()-style dicts."""
+        out = []
+        for i in np.flatnonzero(self.frame_index == frame):
+            code = int(self.emotion[i])
+            label = EMOTION_LABELS[code] if code != UNKNOWN_EMOTION else 'neutral'
+            det = {
+                'bbox': [int(v) for v in self.boxes[i]],
+                'emotion': _emotion_result(label, float(self.confidence[i]), self.explanations[i]),
+            }
+            if self.landmarks is not None:
+                det['landmarks'] = self.landmarks[i]
+            det.update(self.extras[i])
+            out.append(det)
+        return out
+
+class DetectorBackend:
+    """
+    detect_batch(frames) -> FaceBatch. Subclasses with a native per-frame
+    path override detect() as well; otherwise it unpacks a one-frame batch.
+    """
+    name = None
+    # Blendshape classifier whose class probabilities come with the detections (MediaPipe only)
+    classifier = None
+
+    @property
+    def available(self):
+        return True
+
+    def detect_batch(self, frames) -> FaceBatch:
+        raise NotImplementedError
+
+    def detect(self, frame) -> List[Dict]:
+        return self.detect_batch([frame]).detections(0)
+
+    def close(self):
+        """Release models and threads (backends that hold none keep this no-op)."""
+
+class MediaPipeBackend(DetectorBackend):
+    name = "mediapipe"
+
+    def __init__(self):
+        from .emotion_detector_v2 import MediaPipeEmotionDetector
+        self.model = MediaPipeEmotionDetector()
+        self.classifier = self.model.classifier
+        self.detector = self.model.detector
+
+    @property
+    def available(self):
+        return self.model.detector is not None
+
+    def detect(self, frame):
+        return self.model.detect(frame)
+
+    def detect_batch(self, frames):
+        return FaceBatch.from_detections([self.model.detect(f) for f in frames])
+
+    def close(self):
+        self.model.close()
+
+class TiledMediaPipeBackend(MediaPipeBackend):
+    name = "mediapipe_tiled"
+
+    def __init__(self, grid=None, back_grid=None):
+        self.model = TiledDetector(grid or parse_grid(DETECTION_TILES) or DEFAULT_TILE_GRID,
+                                   back_grid or parse_grid(DETECTION_BACK_TILES))
+        self.classifier = self.model.classifier
+        self.detector = self.model.detector
+
+class FERBackend(DetectorBackend):
+    """FER (the 'fer' package, not in requirements.txt) with MTCNN face detection."""
+    name = "fer"
+
+    def __init__(self):
+        self.model = None
+        try:
+            from fer import FER
+        except ImportError:
+            return
+        try:
+            self.model = FER(mtcnn=True)
+        except Exception as e:
+            print(f"⚠️ FER with MTCNN failed, using its cascade detector: {e}")
+            self.model = FER()
+
+    @property
+    def available(self):
+        return self.model is not None
+
+    def _detect_one(self, frame):
+        faces = []
+        try:
+            found = self.model.detect_emotions(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        except Exception:
+            DETECTOR_ERRORS.labels("fer").inc()
+            return faces
+        for face in found:
+            label, score = max(face['emotions'].items(), key=lambda kv: kv[1])
+            faces.append({'bbox': [int(v) for v in face['box']],
+                          'emotion': _emotion_result(label, float(score), 'fer')})
+        return faces
+
+    def detect_batch(self, frames):
+        if self.model is None:
+            return FaceBatch.from_detections([[] for _ in frames])
+        return FaceBatch.from_detections([self._detect_one(f) for f in frames])
+
+class HaarBackend(DetectorBackend):
+    """Haar cascade faces; every face is labeled neutral since there is no emotion model."""
+    name = "haar"
+
+    def __init__(self):
+        from .face_detection import FaceDetector
+        self.cascade = FaceDetector().face_cascade
+
+    @property
+    def available(self):
+        return not self.cascade.empty()
+
+    def detect_batch(self, frames):
+        per_frame = []
+        for frame in frames:
+            if not self.available:
+                per_frame.append(np.empty((0, 4), np.int32))
+                continue
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # Same parameters as FaceDetector.process_frame, without its drawing
+            found = self.cascade.detectMultiScale(gray, 1.1, 5, minSize=(30, 30))
+            per_frame.append(np.asarray(found, dtype=np.int32).reshape(-1, 4))
+        boxes = np.concatenate(per_frame) if per_frame else np.empty((0, 4), np.int32)
+        frame_index = np.repeat(np.arange(len(frames), dtype=np.int32), [len(b) for b in per_frame])
+        n = len(boxes)
+        return FaceBatch(len(frames), frame_index, boxes,
+                         np.full(n, EMOTION_INDEX['neutral'], np.uint8), np.full(n, 0.5, np.float32),
+                         explanations=["face only"] * n)
+
+BACKENDS = {
+    'mediapipe': MediaPipeBackend,
+    'mediapipe_tiled': TiledMediaPipeBackend,
+    'fer': FERBackend,
+    'haar': HaarBackend,
+}
+
+def create_backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown detector backend '{name}' (expected one of {', '.join(BACKENDS)} or auto)")
+    return BACKENDS[name]()
+
+def calibration_frames(n=SELECTION_FRAMES + 1, size=(640, 480)):
+    """Frames with a few faces for timing backends (the benchmark fixture face; plain gray if it is missing)."""
+    w, h = size
+    frame = np.full((h, w, 3), (90, 110, 130), np.uint8)
+    face = cv2.imread(CALIBRATION_IMAGE) if os.path.exists(CALIBRATION_IMAGE) else None
+    if face is not None:
+        fh, fw = h // 2, int(face.shape[1] * (h // 2) / face.shape[0])
+        face = cv2.resize(face, (fw, fh))
+        for x in np.linspace(0, w - fw, 3).astype(int):
+            frame[h // 4:h // 4 + fh, x:x + fw] = face
+    # Slightly different frames, so no backend can reuse a previous result
+    return [np.roll(frame, 4 * i, axis=1) for i in range(n)]
+
+def select_backend(target_fps=DETECTOR_TARGET_FPS, candidates=DETECTOR_CANDIDATES, frames=None):
+    """
+    Times each available candidate on `frames` and returns the first one
+    (in candidate order) that reaches target_fps, or else the fastest.
+    The backend's `selection` attribute holds the measurements.
+    """
+    frames = frames or calibration_frames()
+    report = {}
+    built = {}
+    for name in candidates:
+        try:
+            backend = create_backend(name)
+        except Exception as e:
+            report[name] = {'error': str(e)}
+            continue
+        if not backend.available:
+            report[name] = {'error': "unavailable"}
+            backend.close()
+            continue
+        backend.detect_batch(frames[:1])
+        t0 = time.perf_counter()
+        with stage("detector_selection"):
+            batch = backend.detect_batch(frames[1:])
+        elapsed = time.perf_counter() - t0
+        fps = (len(frames) - 1) / elapsed if elapsed > 0 else float('inf')
+        report[name] = {'fps': round(fps, 1), 'faces_per_frame': round(len(batch) / max(len(frames) - 1, 1), 2)}
+        built[name] = backend
+        if fps >= target_fps:
+            break
+    if not built:
+        raise RuntimeError(f"No detector backend available: {report}")
+    meeting = [n for n in built if report[n]['fps'] >= target_fps]
+    chosen = meeting[0] if meeting else max(built, key=lambda n: report[n]['fps'])
+    for name, other in built.items():
+        if name != chosen:
+            other.close()
+    backend = built[chosen]
+    backend.selection = {'chosen': chosen, 'target_fps': target_fps, 'candidates': report}
+    print(f"✅ Detector backend '{chosen}' selected ({report[chosen]['fps']} FPS, target {target_fps})")
+    return backend
+
+def detector_from_env(name=None):
+    """The detector for one stream: `name` if given (a per-stream override), else DETECTOR_BACKEND."""
+    global _auto_selection
+    name = name or DETECTOR_BACKEND
+    if name != "auto":
+        return create_backend(name)
+    with _auto_lock:
+        if _auto_selection is None:
+            backend = select_backend()
+            _auto_selection = backend.selection
+            return backend
+    backend = create_backend(_auto_selection['chosen'])
+    backend.selection = _auto_selection
+    return backend
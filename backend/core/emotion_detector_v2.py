@@ -9,6 +9,12 @@ from typing import Dict, List
 from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
 
+from .metrics import stage, DETECTOR_ERRORS
+from .blendshape_emotion import BlendshapeEmotionClassifier, DEFAULT_WEIGHTS
+
+# Faces per landmarker pass (see core/tiled_detection.py for rooms with more)
+MAX_FACES = 10
+
 @dataclass
 class EmotionResult:
     emotion: str
@@ -21,8 +27,14 @@ class MediaPipeEmotionDetector:
     Uses 'core/face_landmarker.task' model.
     """
     
-    def __init__(self):
+    def __init__(self, num_faces=MAX_FACES):
         self.detector = None
+        self.last_error = None
+        self.classifier = None
+        try:
+            self.classifier = BlendshapeEmotionClassifier(os.environ.get("EMOTION_WEIGHTS", DEFAULT_WEIGHTS))
+        except Exception as e:
+            print(f"⚠️ Blendshape emotion weights unavailable, using landmark heuristics: {e}")
         try:
             model_path = os.path.join(os.path.dirname(__file__), 'face_landmarker.task')
             
@@ -38,8 +50,8 @@ class MediaPipeEmotionDetector:
             options = vision.FaceLandmarkerOptions(
                 base_options=base_options,
                 output_face_blendshapes=True,
-                output_facial_transformation_matrixes=False,
-                num_faces=10,
+                output_facial_transformation_matrixes=True,
+                num_faces=num_faces,
                 min_face_detection_confidence=0.5,
                 min_face_presence_confidence=0.5,
             )
@@ -50,6 +62,30 @@ class MediaPipeEmotionDetector:
             self.detector = None
     
     def detect(self, frame) -> List[Dict]:
+        output = self.detect_faces(frame)
+        if output:
+            with stage("emotion_classify"):
+                self._classify(output)
+        return output
+
+    def close(self):
+        if self.detector is not None:
+            self.detector.close()
+            self.detector = None
+
+    @staticmethod
+    def face_box(points, w, h):
+        """Landmark extent plus a 10 px margin, clipped to the w x h frame, as [x, y, w, h]."""
+        x_min, y_min = np.min(points, axis=0)
+        x_max, y_max = np.max(points, axis=0)
+        box_x = max(0, x_min - 10)
+        box_y = max(0, y_min - 10)
+        box_w = min(w - box_x, (x_max - x_min) + 20)
+        box_h = min(h - box_y, (y_max - y_min) + 20)
+        return [int(box_x), int(box_y), int(box_w), int(box_h)]
+
+    def detect_faces(self, frame) -> List[Dict]:
+        """Boxes, landmarks, pose and blendshapes of the faces in frame, without emotion labels."""
         output = []
         if self.detector is None:
             return output
@@ -57,11 +93,13 @@ class MediaPipeEmotionDetector:
         try:
             # Prepare Image
             # MediaPipe Tasks expects SRGB
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
+            with stage("color_convert"):
+                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
             
             # Detect
-            detection_result = self.detector.detect(mp_image)
+            with stage("landmark_inference"):
+                detection_result = self.detector.detect(mp_image)
             
             # Process Results
             if detection_result.face_landmarks:
@@ -73,39 +111,45 @@ class MediaPipeEmotionDetector:
                     
                     points = np.array([(lm.x * w, lm.y * h) for lm in landmarks])
                     
-                    # BBox
-                    x_min, y_min = np.min(points, axis=0)
-                    x_max, y_max = np.max(points, axis=0)
+                    bbox = self.face_box(points, w, h)
                     
-                    box_x = max(0, x_min - 10)
-                    box_y = max(0, y_min - 10)
-                    box_w = min(w - box_x, (x_max - x_min) + 20)
-                    box_h = min(h - box_y, (y_max - y_min) + 20)
-                    
-                    bbox = [int(box_x), int(box_y), int(box_w), int(box_h)]
-                    
-                    # Emotion Extraction 
-                    # Note: tasks API landmarks are indexed same as legacy
-                    emotion_data = self._extract_emotion_from_points(points)
-                    
-                    err_result = EmotionResult(
-                        emotion=emotion_data['emotion'],
-                        confidence=emotion_data['confidence'],
-                        explanation=emotion_data['explanation']
-                    )
-                    
-                    output.append({
+                    det = {
                         'bbox': bbox,
-                        'emotion': err_result,
                         'landmarks': points
-                    })
-                    
+                    }
+                    # Head pose comes for free with the landmarks (see attention.py)
+                    if detection_result.facial_transformation_matrixes:
+                        det['pose_matrix'] = np.asarray(detection_result.facial_transformation_matrixes[idx])
+                    if detection_result.face_blendshapes:
+                        det['blendshapes'] = np.array(
+                            [b.score for b in detection_result.face_blendshapes[idx]], dtype=np.float32
+                        )
+                    output.append(det)
+
             return output
             
         except Exception as e:
-            # print(f"❌ Detect Error: {e}")
+            # Counted rather than printed: this runs every frame
+            DETECTOR_ERRORS.labels("mediapipe").inc()
+            self.last_error = str(e)
             return []
 
+    def _classify(self, detections):
+        """
+        Label all faces of a frame: one batched softmax over blendshapes when
+        the model provides them, the landmark heuristics otherwise.
+        """
+        with_scores = [d for d in detections if 'blendshapes' in d] if self.classifier else []
+        if with_scores:
+            probs, results = self.classifier.classify(np.stack([d['blendshapes'] for d in with_scores]))
+            for det, p, (label, confidence, explanation) in zip(with_scores, probs, results):
+                det['emotion'] = EmotionResult(emotion=label, confidence=confidence, explanation=explanation)
+                det['emotion_probs'] = p
+                det['emotion_labels'] = self.classifier.labels
+        for det in detections:
+            if 'emotion' not in det:
+                det['emotion'] = EmotionResult(**self._extract_emotion_from_points(det['landmarks']))
+
     def _extract_emotion_from_points(self, points) -> Dict:
         # Re-implement using numpy points array directly
         # Left Eye: 159 (top), 145 (bottom)
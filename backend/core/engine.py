@@ -0,0 +1,515 @@
+"""
+Live state: the camera, the active session, points, alerts and the
+analytics feeds. Exactly one process may own it, since it holds the camera
+and the trackers.
+
+By default that is the API process itself (LiveEngine on main.py's service
+registry), which limits uvicorn to one worker. With ENGINE_SOCKET set, a
+separate engine process owns it instead:
+
+    python -m core.engine --socket /tmp/attendance-engine.sock
+    ENGINE_SOCKET=/tmp/attendance-engine.sock uvicorn main:app --workers 4
+
+and every API worker talks to it through EngineClient, which has the same
+async methods as LiveEngine. Camera frames are processed once in the engine
+and fanned out to all viewers, whichever worker their websocket landed on.
+
+Wire format (Unix socket): each message is an 8-byte header with the two
+part lengths, then a JSON head and a binary body. Calls send
+{"op", "args"} and get {"result"} or {"error"} back on the same
+connection; the 'frames' and 'analytics' streams keep it open and push
+(metrics JSON, JPEG) and (message JSON, message type) pairs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import struct
+from datetime import datetime
+
+import numpy as np
+
+from .metrics import registry as metrics_registry, stage, FRAMES_PROCESSED, FRAMES_DROPPED
+
+# Socket path used when neither --socket nor ENGINE_SOCKET is given
+DEFAULT_SOCKET = "/tmp/attendance-engine.sock"
+# Head and body lengths in front of every message
+FRAME_HEADER = struct.Struct(">II")
+# Idle connections an EngineClient keeps for calls
+CLIENT_POOL_SIZE = 8
+# A call that takes longer than this means the engine is stuck
+CALL_TIMEOUT = 30.0
+# Pause between camera frames
+FRAME_INTERVAL = 0.033
+
+def register_live_services(registry, inference_workers=0):
+    """The services LiveEngine drives, in warm-up order (the video pipeline first)."""
+    registry.register("session_manager", "core.session_manager:SessionManager")
+    if inference_workers:
+        registry.register("inference_pool", "core.inference_pool:InferencePool", workers=inference_workers)
+    registry.register("camera", "core.camera_service:CameraService")
+    registry.register("gamification_engine", "core.gamification_engine:GamificationEngine")
+    registry.register("recommendations_engine", "core.recommendations_engine:RecommendationsEngine")
+    registry.register("analytics_hub", "core.analytics_hub:AnalyticsHub")
+
+class EngineUnavailable(ConnectionError):
+    """The engine process can't be reached."""
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _encode(head, body=b""):
+    if not isinstance(head, bytes):
+        head = json.dumps(head, default=_json_default).encode()
+    return FRAME_HEADER.pack(len(head), len(body)) + head + body
+
+async def _read(reader):
+    """(head bytes, body bytes) of the next message; IncompleteReadError once the peer is gone."""
+    head_len, body_len = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    head = await reader.readexactly(head_len)
+    body = await reader.readexactly(body_len) if body_len else b""
+    return head, body
+
+class LiveEngine:
+    """
+    The live state, in this process. main.py uses it directly unless
+    ENGINE_SOCKET is set; the engine process serves it over the socket.
+    """
+    def __init__(self, services):
+        self.services = services
+        self.viewers = set()      # one single-slot queue per /ws/video client
+        self.capture_task = None
+        self.alerts_pending = False
+
+    async def start_session(self, teacher_id, class_id):
+        session_manager = await self.services.aget("session_manager")
+        gamification_engine = await self.services.aget("gamification_engine")
+        recommendations_engine = await self.services.aget("recommendations_engine")
+        result = session_manager.start_session(teacher_id, class_id)
+        if result.get("status") != "error":
+            gamification_engine.start_session(result["session_id"])
+            recommendations_engine.start_session(result["session_id"])
+        return result
+
+    async def stop_session(self):
+        session_manager = await self.services.aget("session_manager")
+        gamification_engine = await self.services.aget("gamification_engine")
+        recommendations_engine = await self.services.aget("recommendations_engine")
+        result = session_manager.stop_session()
+        gamification_engine.end_session()
+        recommendations_engine.end_session()
+        if result.get("session_id"):
+            analytics_hub = await self.services.aget("analytics_hub")
+            analytics_hub.end_session(result["session_id"])
+        return result
+
+    async def status(self):
+        session_manager = await self.services.aget("session_manager")
+        return session_manager.get_status()
+
+    async def person(self, student_id, last=10):
+        """Recent emotions and attention of one tracked student in the active session, or None."""
+        session_manager = await self.services.aget("session_manager")
+        if not session_manager.active_session_id:
+            return None
+        data = session_manager.person_history.get(student_id)
+        if not data:
+            return None
+        return {'emotions': [e['label'] for e in data['emotions'][-last:]], 'attention': data['attention'][-last:]}
+
+    async def heatmap(self, session_id):
+        """Spatial attention grid so far if session_id is the active session, else None."""
+        session_manager = await self.services.aget("session_manager")
+        if session_manager.active_session_id != session_id:
+            return None
+        return session_manager.heatmap.snapshot()
+
+    async def leaderboard(self):
+        gamification_engine = await self.services.aget("gamification_engine")
+        return gamification_engine.get_leaderboard()
+
+    async def add_audio(self, now, windows):
+        """
+        The camera room's analyzed microphone windows as [(clock time,
+        metrics)]; see SessionManager.add_audio. Ingest rooms take their
+        audio in the API process instead (main.py's /ws/audio).
+        """
+        session_manager = await self.services.aget("session_manager")
+        due = session_manager.add_audio(now, windows)
+        if due:
+            await asyncio.to_thread(session_manager.log_audio, due[0], now, due[1])
+
+    async def publish(self, session_id, metrics, status=None):
+        """Feeds an ingest room's frame to the analytics hub."""
+        analytics_hub = await self.services.aget("analytics_hub")
+        analytics_hub.publish(session_id, metrics, status)
+
+    async def end_analytics(self, session_id):
+        analytics_hub = await self.services.aget("analytics_hub")
+        analytics_hub.end_session(session_id)
+
+    async def services_status(self):
+        return self.services.status()
+
+    async def metrics(self):
+        """This process's metric families (pipeline stages run here), for the API's /metrics."""
+        return metrics_registry.families("engine")
+
+    async def camera_status(self):
+        camera = await self.services.aget("camera")
+        status = camera.status()
+        if self.services.is_ready("session_manager"):
+            # Which detector backend the camera's frames go through (and why, if picked by benchmark)
+            detector = self.services.get("session_manager").emotion_detector
+            status['detector'] = {'backend': getattr(detector, 'name', type(detector).__name__),
+                                  'selection': getattr(detector, 'selection', None)}
+        return status
+
+    # Streams
+
+    async def frames(self):
+        """
+        Async iterator of (JPEG bytes, metrics JSON) for one viewer. All
+        viewers share one capture loop, which runs while anyone watches; a
+        viewer that falls behind skips to the newest frame.
+        """
+        queue = asyncio.Queue(1)
+        self.viewers.add(queue)
+        # Newcomers need the full alert list, not just changes
+        self.alerts_pending = True
+        if self.capture_task is None or self.capture_task.done():
+            self.capture_task = asyncio.create_task(self._capture())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                yield item
+        finally:
+            self.viewers.discard(queue)
+
+    def _deliver(self, item):
+        for queue in self.viewers:
+            if queue.full():
+                queue.get_nowait()
+                if item is not None:
+                    FRAMES_DROPPED.labels("stale").inc()
+            queue.put_nowait(item)
+
+    async def _capture(self):
+        import contextlib
+        import cv2
+        from .inference_pool import WorkerLost
+        camera = await self.services.aget("camera")
+        session_manager = await self.services.aget("session_manager")
+        gamification_engine = await self.services.aget("gamification_engine")
+        recommendations_engine = await self.services.aget("recommendations_engine")
+        analytics_hub = await self.services.aget("analytics_hub")
+        pool = await self.services.aget("inference_pool") if "inference_pool" in self.services else None
+        try:
+            camera.start()
+        except:
+            pass
+
+        try:
+            while self.viewers:
+                # With a pool, the camera decodes straight into a shared-memory slot
+                async with (pool.slot("camera") if pool else contextlib.nullcontext()) as slot:
+                    frame = camera.get_frame(out=slot.view(camera.frame_shape) if slot else None)
+                    if frame is None:
+                        FRAMES_DROPPED.labels("no_frame").inc()
+                        await asyncio.sleep(0.1)
+                        continue
+
+                    with stage("frame_total"):
+                        if slot:
+                            try:
+                                matches = await pool.track(slot, frame)
+                            except WorkerLost as e:
+                                # The pool restarted the worker; carry on with the next frame
+                                print(f"Video Error: {e}")
+                                FRAMES_DROPPED.labels("worker_lost").inc()
+                                continue
+                            processed_frame, metrics = session_manager.process_matches(frame, matches)
+                        else:
+                            processed_frame, metrics = session_manager.process_frame(frame)
+
+                        # Phase 4: Gamification & Suggestions Real-time
+                        metrics['leaderboard'] = gamification_engine.process_frame_points(metrics) # Top 5
+
+                        # Recommendations: only new/resolved alerts change what clients show
+                        if recommendations_engine.process_frame(metrics, include_active=self.alerts_pending):
+                            self.alerts_pending = False
+                        analytics_hub.publish(session_manager.active_session_id, metrics,
+                                              {'people_count': len(session_manager.person_history)})
+
+                        # Encoded once, whatever the number of viewers
+                        with stage("encode"):
+                            _, buffer = cv2.imencode('.jpg', processed_frame)
+                            item = (buffer.tobytes(), json.dumps(metrics))
+                        self._deliver(item)
+                FRAMES_PROCESSED.inc()
+                await asyncio.sleep(FRAME_INTERVAL)
+        except Exception as e:
+            print(f"Video Error: {e}")
+        finally:
+            # Ends every viewer's iterator
+            self._deliver(None)
+
+    async def analytics(self, session_id):
+        """
+        Async iterator of (message type, JSON text) for a live session's
+        dashboard feed (see core/analytics_hub.py), or None if it isn't live.
+        """
+        analytics_hub = await self.services.aget("analytics_hub")
+        session_manager = await self.services.aget("session_manager")
+        if not analytics_hub.is_live(session_id) and session_manager.active_session_id != session_id:
+            return None
+        return self._feed(analytics_hub, session_id)
+
+    async def _feed(self, analytics_hub, session_id):
+        queue = analytics_hub.subscribe(session_id)
+        try:
+            while True:
+                kind, text = await queue.get()
+                yield kind, text
+                if kind == 'end':
+                    return
+        finally:
+            analytics_hub.unsubscribe(session_id, queue)
+
+class EngineServer:
+    """Serves a LiveEngine on a Unix socket (the engine process)."""
+    CALLS = ('start_session', 'stop_session', 'status', 'person', 'heatmap', 'leaderboard', 'add_audio',
+             'publish', 'end_analytics', 'services_status', 'camera_status', 'metrics')
+
+    def __init__(self, live, path=DEFAULT_SOCKET):
+        self.live = live
+        self.path = path
+
+    async def serve_forever(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left over from a previous run
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        print(f"✅ Engine listening on {self.path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head, _ = await _read(reader)
+                request = json.loads(head)
+                op, args = request.get('op'), request.get('args', {})
+                if op == 'frames':
+                    await self._stream_frames(reader, writer)
+                    return
+                if op == 'analytics':
+                    await self._stream_analytics(reader, writer, **args)
+                    return
+                if op not in self.CALLS:
+                    writer.write(_encode({'error': f"Unknown op '{op}'"}))
+                else:
+                    try:
+                        writer.write(_encode({'result': await getattr(self.live, op)(**args)}))
+                    except Exception as e:
+                        print(f"Engine error ({op}): {e}")
+                        writer.write(_encode({'error': str(e)}))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _until_closed(self, reader, source):
+        """Runs the stream `source` until it ends or the client hangs up."""
+        closed = asyncio.ensure_future(reader.read())
+        pump = asyncio.ensure_future(source)
+        try:
+            await asyncio.wait({closed, pump}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+            pump.cancel()
+
+    async def _stream_frames(self, reader, writer):
+        async def pump():
+            async for jpeg, text in self.live.frames():
+                writer.write(_encode(text.encode(), jpeg))
+                await writer.drain()
+        await self._until_closed(reader, pump())
+
+    async def _stream_analytics(self, reader, writer, session_id):
+        feed = await self.live.analytics(session_id)
+        writer.write(_encode({'live': feed is not None}))
+        await writer.drain()
+        if feed is None:
+            return
+        async def pump():
+            try:
+                async for kind, text in feed:
+                    writer.write(_encode(text.encode(), kind.encode()))
+                    await writer.drain()
+            finally:
+                await feed.aclose()
+        await self._until_closed(reader, pump())
+
+class EngineClient:
+    """LiveEngine's methods, answered by the engine process (API workers with ENGINE_SOCKET set)."""
+    def __init__(self, path=DEFAULT_SOCKET, pool_size=CLIENT_POOL_SIZE):
+        self.path = path
+        self.pool_size = pool_size
+        self._idle = []  # open (reader, writer) pairs
+
+    async def _connect(self):
+        try:
+            return await asyncio.open_unix_connection(self.path)
+        except OSError as e:
+            raise EngineUnavailable(f"Engine not reachable at {self.path}: {e}") from e
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+    async def _call(self, op, **args):
+        reader, writer = self._idle.pop() if self._idle else await self._connect()
+        try:
+            writer.write(_encode({'op': op, 'args': args}))
+            await writer.drain()
+            head, _ = await asyncio.wait_for(_read(reader), CALL_TIMEOUT)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            writer.close()
+            raise EngineUnavailable(f"Engine call '{op}' failed: {e!r}") from e
+        except BaseException:
+            # Cancelled mid-call: the reply would confuse the next user of this connection
+            writer.close()
+            raise
+        if len(self._idle) < self.pool_size:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        reply = json.loads(head)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply['result']
+
+    async def start_session(self, teacher_id, class_id):
+        return await self._call('start_session', teacher_id=teacher_id, class_id=class_id)
+
+    async def stop_session(self):
+        return await self._call('stop_session')
+
+    async def status(self):
+        return await self._call('status')
+
+    async def person(self, student_id, last=10):
+        return await self._call('person', student_id=student_id, last=last)
+
+    async def heatmap(self, session_id):
+        return await self._call('heatmap', session_id=session_id)
+
+    async def leaderboard(self):
+        return await self._call('leaderboard')
+
+    async def add_audio(self, now, windows):
+        return await self._call('add_audio', now=now, windows=windows)
+
+    async def publish(self, session_id, metrics, status=None):
+        return await self._call('publish', session_id=session_id, metrics=metrics, status=status)
+
+    async def end_analytics(self, session_id):
+        return await self._call('end_analytics', session_id=session_id)
+
+    async def services_status(self):
+        return await self._call('services_status')
+
+    async def metrics(self):
+        return await self._call('metrics')
+
+    async def camera_status(self):
+        return await self._call('camera_status')
+
+    async def frames(self):
+        reader, writer = await self._connect()
+        try:
+            writer.write(_encode({'op': 'frames'}))
+            await writer.drain()
+            while True:
+                try:
+                    text, jpeg = await _read(reader)
+                except asyncio.IncompleteReadError:
+                    return
+                yield jpeg, text.decode()
+        finally:
+            writer.close()
+
+    async def analytics(self, session_id):
+        reader, writer = await self._connect()
+        try:
+            writer.write(_encode({'op': 'analytics', 'args': {'session_id': session_id}}))
+            await writer.drain()
+            head, _ = await _read(reader)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            writer.close()
+            raise EngineUnavailable(f"Engine analytics feed failed: {e!r}") from e
+        if not json.loads(head)['live']:
+            writer.close()
+            return None
+        return self._feed(reader, writer)
+
+    async def _feed(self, reader, writer):
+        try:
+            while True:
+                try:
+                    text, kind = await _read(reader)
+                except asyncio.IncompleteReadError:
+                    return
+                yield kind.decode(), text.decode()
+        finally:
+            writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the live engine (camera, sessions) for multi-worker APIs.")
+    parser.add_argument("--socket", default=os.environ.get("ENGINE_SOCKET", DEFAULT_SOCKET))
+    args = parser.parse_args()
+
+    from .database import init_db
+    from .service_registry import ServiceRegistry
+    init_db()
+    services = ServiceRegistry()
+    register_live_services(services, int(os.environ.get("INFERENCE_WORKERS", "0")))
+    services.register("maintenance", "core.maintenance:MetricsMaintenance")
+    live = LiveEngine(services)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        if os.environ.get("WARM_UP_SERVICES", "1") != "0":
+            loop.run_in_executor(None, services.warm_up)
+        # Periodic jobs run here once, instead of in every API worker
+        tasks = []
+        interval = float(os.environ.get("MAINTENANCE_INTERVAL_HOURS", "24"))
+        if interval > 0:
+            maintenance = await services.aget("maintenance")
+            tasks.append(asyncio.create_task(maintenance.run_periodically(interval)))
+        try:
+            await EngineServer(live, args.socket).serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if services.is_ready("inference_pool"):
+                services.get("inference_pool").close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
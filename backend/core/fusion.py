@@ -0,0 +1,155 @@
+"""
+Audio/video fusion on one clock. Audio features and per-frame visual state
+go into short rolling windows stamped with clock() (epoch seconds driven by
+time.monotonic, so a wall-clock step can't reorder samples). Both windows
+are append-only and therefore sorted, which makes joining them an as-of
+merge (np.searchsorted) instead of a nested loop: each visual sample takes
+the latest audio sample that is at most AUDIO_MAX_AGE old.
+
+Audio is added from the event loop while an ingest room's frames read it
+from a worker thread, so the audio window is only touched under a lock.
+"""
+import threading
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+_CLOCK_ANCHOR = time.time() - time.monotonic()
+
+def clock():
+    """Epoch seconds that never go backwards; video frames and audio chunks are both stamped with it."""
+    return time.monotonic() + _CLOCK_ANCHOR
+
+# Rolling windows keep this many seconds
+WINDOW_SECONDS = 60.0
+# A visual sample joins audio at most this old
+AUDIO_MAX_AGE = 3.0
+# Share of attention and of the audio score in the combined engagement
+VISUAL_WEIGHT = 0.8
+AUDIO_WEIGHT = 0.2
+# Loudness (dBFS) where the audio score starts to drop, and where it reaches zero
+LOUD_DB = -26.0
+CHAOTIC_DB = -6.0
+
+def engagement_score(attention, noise_db=None, speech_ratio=None):
+    """
+    Combined 0-100 engagement: mostly attention, plus how much of the
+    audio is speech, discounted when the room gets loud. Attention alone
+    where audio is missing (None/NaN). Works element-wise on arrays.
+    """
+    attention = np.asarray(attention, dtype=np.float64)
+    noise = np.asarray(np.nan if noise_db is None else noise_db, dtype=np.float64)
+    speech = np.asarray(np.nan if speech_ratio is None else speech_ratio, dtype=np.float64)
+    loudness = np.clip((noise - LOUD_DB) / (CHAOTIC_DB - LOUD_DB), 0.0, 1.0)
+    audio = np.clip(speech, 0.0, 1.0) * (1.0 - loudness)
+    fused = VISUAL_WEIGHT * attention + AUDIO_WEIGHT * 100.0 * audio
+    out = np.round(np.where(np.isnan(audio), attention, fused), 1)
+    return float(out) if out.ndim == 0 else out
+
+def asof_indices(left, right, max_age):
+    """
+    For each time in sorted `left`, the index of the latest time in sorted
+    `right` at or before it and at most max_age older; -1 where none.
+    """
+    left = np.asarray(left, dtype=np.float64)
+    right = np.asarray(right, dtype=np.float64)
+    if not len(right):
+        return np.full(len(left), -1)
+    idx = np.searchsorted(right, left, side='right') - 1
+    valid = (idx >= 0) & (left - right[np.maximum(idx, 0)] <= max_age)
+    return np.where(valid, idx, -1)
+
+class FusionEngine:
+    def __init__(self, window=WINDOW_SECONDS, max_age=AUDIO_MAX_AGE):
+        self.window = window
+        self.max_age = max_age
+        self.lock = threading.Lock()  # guards self.audio
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.audio = deque()   # (t, noise_db, speech_ratio, activity)
+        self.visual = deque()  # (t, {track id: attention})
+
+    def _trim(self, samples, now):
+        while samples and samples[0][0] < now - self.window:
+            samples.popleft()
+
+    def add_audio(self, t, noise_db, speech_ratio, activity=None):
+        with self.lock:
+            # Chunks can arrive slightly out of order; keep the window sorted
+            if self.audio and t < self.audio[-1][0]:
+                t = self.audio[-1][0]
+            self.audio.append((t, noise_db, speech_ratio, activity))
+            self._trim(self.audio, t)
+
+    def add_visual(self, t, people):
+        """people: the session manager's per-frame list of {id, attention, ...}."""
+        if self.visual and t < self.visual[-1][0]:
+            t = self.visual[-1][0]
+        self.visual.append((t, {p['id']: p['attention'] for p in people}))
+        self._trim(self.visual, t)
+
+    def audio_at(self, t):
+        """Latest audio features at or before t, if fresh enough: {noise_db, speech_ratio, activity_type}."""
+        with self.lock:
+            audio = tuple(self.audio)
+        for ts, noise, speech, activity in reversed(audio):
+            if ts <= t:
+                if t - ts > self.max_age:
+                    return None
+                return {'noise_db': round(noise, 1), 'speech_ratio': round(speech, 3), 'activity_type': activity}
+        return None
+
+    def audio_summary(self, since, until):
+        """Mean noise and speech ratio and the most common activity of the audio in (since, until]."""
+        with self.lock:
+            samples = [s for s in self.audio if since < s[0] <= until]
+        if not samples:
+            return None
+        _, noise, speech, activity = zip(*samples)
+        return {
+            'noise_db': float(np.mean(noise)),
+            'speech_ratio': float(np.mean(speech)),
+            'activity_type': Counter(activity).most_common(1)[0][0],
+        }
+
+    def timeline(self, bucket_seconds=5):
+        """
+        The rolling window as buckets of {time, attention, noise_db,
+        speech_ratio, engagement}: every frame is joined to its audio
+        first, then frames are averaged per bucket.
+        """
+        frames = [(t, sum(people.values()) / len(people)) for t, people in self.visual if people]
+        if not frames:
+            return []
+        vt, attention = (np.array(c, dtype=np.float64) for c in zip(*frames))
+        noise = np.full(len(vt), np.nan)
+        speech = np.full(len(vt), np.nan)
+        with self.lock:
+            audio = tuple(self.audio)
+        if audio:
+            at, an, asr, _ = zip(*audio)
+            idx = asof_indices(vt, at, self.max_age)
+            hit = idx >= 0
+            noise[hit] = np.asarray(an, dtype=np.float64)[idx[hit]]
+            speech[hit] = np.asarray(asr, dtype=np.float64)[idx[hit]]
+        engagement = engagement_score(attention, noise, speech)
+
+        buckets, inverse = np.unique(np.floor(vt / bucket_seconds), return_inverse=True)
+        counts = np.bincount(inverse)
+        def mean(values):
+            valid = ~np.isnan(values)
+            n = np.bincount(inverse[valid], minlength=len(buckets))
+            s = np.bincount(inverse[valid], weights=values[valid], minlength=len(buckets))
+            return np.where(n > 0, s / np.maximum(n, 1), np.nan)
+        columns = [mean(attention), mean(noise), mean(speech), mean(engagement)]
+        return [{
+            'time': float(b * bucket_seconds),
+            'attention': round(float(a), 1),
+            'noise_db': None if np.isnan(n) else round(float(n), 1),
+            'speech_ratio': None if np.isnan(s) else round(float(s), 3),
+            'engagement': round(float(e), 1),
+            'frames': int(c),
+        } for b, a, n, s, e, c in zip(buckets, *columns, counts)]
@@ -1,62 +1,173 @@
+import bisect
+import time
+from datetime import datetime
+
+from .database import SessionLocal, StudentPoints
+
+# Attention threshold -> points per second of wall-clock time
+POINT_RATES = [(90, 10.0), (70, 5.0), (50, 1.0)]
+LOW_ATTENTION_RATE = -2.0
+
+STREAK_BADGE_SECONDS = 10.0
+# Gaps longer than this (track lost, pipeline stalled) don't accrue points
+MAX_FRAME_GAP = 1.0
+FLUSH_INTERVAL = 10.0
+
+class Leaderboard:
+    """
+    Scores kept in a list sorted by (-points, id). Each change is located with
+    bisect instead of re-sorting every player, and the top-k slice is cached
+    and only rebuilt when a change lands inside it.
+    """
+    def __init__(self, k=5):
+        self.k = k
+        self._keys = []    # sorted [(-points, person_id)]
+        self._scores = {}  # person_id -> points
+        self._top = []     # cached [(person_id, points)]
+
+    def update(self, pid, points):
+        old = self._scores.get(pid)
+        if old == points:
+            return
+        touched = False
+        if old is not None:
+            i = bisect.bisect_left(self._keys, (-old, pid))
+            del self._keys[i]
+            touched = i < self.k
+        j = bisect.bisect_left(self._keys, (-points, pid))
+        self._keys.insert(j, (-points, pid))
+        self._scores[pid] = points
+        if touched or j < self.k:
+            self._top = [(p, -s) for s, p in self._keys[:self.k]]
+
+    def top(self):
+        return self._top
+
+    def clear(self):
+        self._keys = []
+        self._scores = {}
+        self._top = []
+
 class GamificationEngine:
     def __init__(self):
+        self.session_id = None
         # In-memory points storage for the active session
         self.session_points = {} # person_id -> points
         self.streaks = {} # person_id -> consecutive_high_attention_seconds
+        self.badges = {} # person_id -> badge
+        self.last_seen = {} # person_id -> timestamp of last scored frame
+        self.leaderboard = Leaderboard(k=5)
+
+        # Persistence to student_points
+        self._dirty = set()
+        self._row_ids = {} # person_id -> student_points.id
+        self._last_flush = 0
+
+    def start_session(self, session_id):
+        self.session_id = session_id
+        self.session_points = {}
+        self.streaks = {}
+        self.badges = {}
+        self.last_seen = {}
+        self.leaderboard.clear()
+        self._dirty = set()
+        self._row_ids = {}
+        self._last_flush = time.time()
+
+    def end_session(self):
+        self.flush()
+        self.session_id = None
 
-    def process_frame_points(self, metrics: dict):
+    def process_frame_points(self, metrics: dict, now=None):
         """
-        Calculate points based on current frame metrics.
+        Accrue points from the time elapsed since each person's last scored
+        frame, so scoring is independent of the pipeline's frame rate.
         metrics: { 'people': [ { 'id': '1', 'attention': 80, ... } ] }
+        Returns the current top 5.
         """
-        updates = []
-        
+        now = now if now is not None else time.time()
+
         for p in metrics.get('people', []):
             pid = p['id']
             att = p['attention']
-            
-            # Init
-            if pid not in self.session_points: self.session_points[pid] = 0
-            if pid not in self.streaks: self.streaks[pid] = 0
-            
-            # Points Logic (per second approx, assuming this is called per frame)
-            # We scale down since fps is ~30. 
-            # Logic: +10pts/sec -> +0.33pts/frame
-            
-            pts = 0
-            if att > 90:
-                pts = 0.33
-                self.streaks[pid] += 1
-            elif att > 70:
-                pts = 0.16
-                self.streaks[pid] = 0
-            elif att > 50:
-                pts = 0.03
-                self.streaks[pid] = 0
+
+            last = self.last_seen.get(pid)
+            self.last_seen[pid] = now
+            if last is None:
+                # First sighting: no elapsed time to score yet
+                self.session_points.setdefault(pid, 0.0)
+                self.streaks.setdefault(pid, 0.0)
+                self.leaderboard.update(pid, 0)
+                continue
+            dt = min(max(now - last, 0.0), MAX_FRAME_GAP)
+
+            rate = LOW_ATTENTION_RATE
+            for threshold, pts_per_sec in POINT_RATES:
+                if att > threshold:
+                    rate = pts_per_sec
+                    break
+
+            if att > POINT_RATES[0][0]:
+                self.streaks[pid] += dt
             else:
-                pts = -0.06 # -2pts/sec
-                self.streaks[pid] = 0
-                
-            self.session_points[pid] += pts
-            
+                self.streaks[pid] = 0.0
+
+            before = int(self.session_points[pid])
+            self.session_points[pid] += rate * dt
+            after = int(self.session_points[pid])
+
             # Badge Logic
-            badge = None
-            if self.streaks[pid] > 300: # 10 seconds (approx 30fps)
-                badge = "🔥 Hot Streak"
-                
-            updates.append({
-                "id": pid,
-                "points": int(self.session_points[pid]),
-                "badge": badge
-            })
-            
-        # rank
-        updates.sort(key=lambda x: x['points'], reverse=True)
-        return updates
+            badge = "🔥 Hot Streak" if self.streaks[pid] >= STREAK_BADGE_SECONDS else None
+            if badge != self.badges.get(pid):
+                self.badges[pid] = badge
+                self._dirty.add(pid)
+
+            if after != before:
+                self.leaderboard.update(pid, after)
+                self._dirty.add(pid)
+
+        if self.session_id and now - self._last_flush > FLUSH_INTERVAL:
+            self.flush()
+            self._last_flush = now
+
+        return self.get_leaderboard()
 
     def get_leaderboard(self):
-        leaderboard = []
-        for pid, score in self.session_points.items():
-            leaderboard.append({"id": pid, "points": int(score)})
-        leaderboard.sort(key=lambda x: x['points'], reverse=True)
-        return leaderboard[:5] # Top 5
+        return [{
+            "id": pid,
+            "points": points,
+            "badge": self.badges.get(pid)
+        } for pid, points in self.leaderboard.top()] # Top 5
+
+    def flush(self):
+        """Upsert changed per-student totals into student_points."""
+        if not self.session_id or not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        db = SessionLocal()
+        try:
+            new_rows = {}
+            updates = []
+            for pid in dirty:
+                row = {
+                    'points': int(self.session_points.get(pid, 0)),
+                    'badge': self.badges.get(pid),
+                    'timestamp': datetime.utcnow()
+                }
+                if pid in self._row_ids:
+                    row['id'] = self._row_ids[pid]
+                    updates.append(row)
+                else:
+                    new_rows[pid] = StudentPoints(session_id=self.session_id, student_id=str(pid), **row)
+            if updates:
+                db.bulk_update_mappings(StudentPoints, updates)
+            db.add_all(new_rows.values())
+            db.commit()
+            for pid, obj in new_rows.items():
+                self._row_ids[pid] = obj.id
+        except Exception as e:
+            print(f"Gamification flush error: {e}")
+            db.rollback()
+            self._dirty |= dirty
+        finally:
+            db.close()
@@ -0,0 +1,92 @@
+"""
+Where in the room attention drops: a coarse grid over the camera frame
+with per-cell attention and engagement sums and sample counts. Every
+processed frame adds each tracked person at the cell of their box center,
+all people in one np.bincount per accumulator, so the map is always up to
+date and is never rebuilt from stored samples. Row 0 is the top of the
+frame, which for a camera at the front of the room is the back row.
+
+Saved to session_heatmaps when the session stops (see SessionManager).
+"""
+import json
+
+import numpy as np
+
+# Grid cells (rows x columns) over the frame
+HEATMAP_ROWS = 6
+HEATMAP_COLS = 8
+
+def _means(sums, counts):
+    """Per-cell means rounded to 0.1, None where a cell has no samples."""
+    means = np.round(sums / np.maximum(counts, 1), 1)
+    return [[float(m) if n else None for m, n in zip(mrow, nrow)] for mrow, nrow in zip(means, counts)]
+
+class EngagementHeatmap:
+    def __init__(self, rows=HEATMAP_ROWS, cols=HEATMAP_COLS):
+        self.rows = rows
+        self.cols = cols
+        self.reset()
+
+    def reset(self):
+        self.attention = np.zeros((self.rows, self.cols))
+        self.engagement = np.zeros((self.rows, self.cols))
+        self.counts = np.zeros((self.rows, self.cols), dtype=np.int64)
+        self.frame_size = None  # (width, height) of the frames seen
+
+    def add(self, people, width, height):
+        """One frame's people ({bbox: [l, t, r, b], attention, engagement}) in a width x height frame."""
+        self.frame_size = (int(width), int(height))
+        if not people:
+            return
+        boxes = np.array([p['bbox'] for p in people], dtype=np.float64)
+        rows = np.clip(((boxes[:, 1] + boxes[:, 3]) / 2 * self.rows / height).astype(np.intp), 0, self.rows - 1)
+        cols = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2 * self.cols / width).astype(np.intp), 0, self.cols - 1)
+        cells = rows * self.cols + cols
+        size = self.rows * self.cols
+        attention = np.array([p['attention'] for p in people], dtype=np.float64)
+        engagement = np.array([p.get('engagement', p['attention']) for p in people], dtype=np.float64)
+        self.attention += np.bincount(cells, weights=attention, minlength=size).reshape(self.rows, self.cols)
+        self.engagement += np.bincount(cells, weights=engagement, minlength=size).reshape(self.rows, self.cols)
+        self.counts += np.bincount(cells, minlength=size).reshape(self.rows, self.cols)
+
+    def snapshot(self):
+        """Per-cell means and counts, plus per-row means (back of the room first)."""
+        row_counts = self.counts.sum(axis=1)
+        row_attention = self.attention.sum(axis=1)
+        half = self.rows // 2
+        def band(rows):
+            n = row_counts[rows].sum()
+            return round(float(row_attention[rows].sum() / n), 1) if n else None
+        return {
+            'rows': self.rows,
+            'cols': self.cols,
+            'frame_size': self.frame_size,
+            'attention': _means(self.attention, self.counts),
+            'engagement': _means(self.engagement, self.counts),
+            'samples': self.counts.tolist(),
+            'row_attention': [round(float(s / n), 1) if n else None for s, n in zip(row_attention, row_counts)],
+            'back_attention': band(slice(0, half)),
+            'front_attention': band(slice(half, self.rows)),
+        }
+
+    def to_record(self):
+        """Columns of a SessionHeatmap row."""
+        return {
+            'rows': self.rows,
+            'cols': self.cols,
+            'frame_width': self.frame_size[0] if self.frame_size else None,
+            'frame_height': self.frame_size[1] if self.frame_size else None,
+            'attention_sum': json.dumps(np.round(self.attention, 2).tolist(), separators=(',', ':')),
+            'engagement_sum': json.dumps(np.round(self.engagement, 2).tolist(), separators=(',', ':')),
+            'counts': json.dumps(self.counts.tolist(), separators=(',', ':')),
+        }
+
+    @classmethod
+    def from_record(cls, row):
+        heatmap = cls(row.rows, row.cols)
+        heatmap.attention = np.array(json.loads(row.attention_sum), dtype=np.float64)
+        heatmap.engagement = np.array(json.loads(row.engagement_sum), dtype=np.float64)
+        heatmap.counts = np.array(json.loads(row.counts), dtype=np.int64)
+        if row.frame_width:
+            heatmap.frame_size = (row.frame_width, row.frame_height)
+        return heatmap
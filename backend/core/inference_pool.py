@@ -0,0 +1,321 @@
+"""
+Detection and tracking in worker processes, so several rooms use several
+cores and the API process only does session bookkeeping.
+
+Each worker owns one shared-memory block split into frame slots. The
+caller writes a frame into a free slot (CameraService can capture straight
+into it), sends the worker a few bytes naming the slot, and the worker
+runs the DETECTOR_BACKEND detector (core/detectors.py) and the room's
+tracker on a view of that memory. Results come back as one small
+structured array per frame (MATCH_DTYPE) instead of pickled detection
+dicts.
+
+Rooms stick to the worker that first served them, since their tracker
+state lives there. A worker that dies is replaced by a new one: the frame
+in flight raises WorkerLost, and the worker's rooms start over with fresh
+trackers on whichever worker they are assigned next. Enabled in main.py
+with INFERENCE_WORKERS=N.
+"""
+import asyncio
+import multiprocessing as mp
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .metrics import stage
+from .session_recorder import EMOTION_LABELS, EMOTION_INDEX, UNKNOWN_EMOTION
+
+MAX_FRAME_SHAPE = (1080, 1920, 3)
+SLOTS_PER_WORKER = 2
+WORKER_START_TIMEOUT = 120.0
+
+MATCH_DTYPE = np.dtype([
+    ('track_id', 'i4'),
+    ('ltrb', 'f4', 4),
+    ('emotion', 'u1'),      # index into EMOTION_LABELS
+    ('confidence', 'f4'),
+    ('attention', 'f4'),    # NaN when the face had no usable landmarks
+    ('gaze_focus', 'f4'),
+    ('head_pose', 'f4', 3), # yaw, pitch, roll
+])
+
+class WorkerLost(RuntimeError):
+    """The worker process serving a frame exited; the pool has started a replacement."""
+
+def encode_matches(matches, labels=None):
+    """
+    [(track_id, ltrb, detection)] -> (MATCH_DTYPE array, probs or None).
+    probs is (N, len(labels)) when the detector gave class probabilities.
+    """
+    out = np.zeros(len(matches), dtype=MATCH_DTYPE)
+    out['attention'] = np.nan
+    out['gaze_focus'] = np.nan
+    out['head_pose'] = np.nan
+    probs = None
+    if labels and matches and all('emotion_probs' in det for _, _, det in matches):
+        probs = np.stack([det['emotion_probs'] for _, _, det in matches]).astype(np.float32)
+    for i, (track_id, ltrb, det) in enumerate(matches):
+        row = out[i]
+        row['track_id'] = int(track_id)
+        row['ltrb'] = ltrb
+        row['emotion'] = EMOTION_INDEX.get(det['emotion'].emotion, UNKNOWN_EMOTION)
+        row['confidence'] = det['emotion'].confidence
+        if 'attention_raw' in det:
+            row['attention'] = det['attention_raw']
+            row['gaze_focus'] = det['gaze_focus']
+            row['head_pose'] = det['head_pose']
+    return out, probs
+
+def decode_matches(rows, probs=None, labels=None):
+    """Inverse of encode_matches, in the form SessionManager.process_matches takes."""
+    from .emotion_detector_v2 import EmotionResult
+
+    matches = []
+    for i, row in enumerate(rows):
+        code = int(row['emotion'])
+        det = {'emotion': EmotionResult(
+            emotion=EMOTION_LABELS[code] if code < len(EMOTION_LABELS) else 'unknown',
+            confidence=round(float(row['confidence']), 3),
+            explanation='worker'
+        )}
+        if not np.isnan(row['attention']):
+            det['attention_raw'] = float(row['attention'])
+            det['gaze_focus'] = round(float(row['gaze_focus']), 3)
+            det['head_pose'] = tuple(round(float(v), 1) for v in row['head_pose'])
+        if probs is not None:
+            det['emotion_probs'] = probs[i]
+            det['emotion_labels'] = labels
+        matches.append((str(int(row['track_id'])), row['ltrb'], det))
+    return matches
+
+def _worker_main(shm_name, slot_bytes, conn):
+    """Worker loop: ('frame', room, slot, shape) -> (rows, probs, worker_ms); ('drop', room)."""
+    from .detectors import detector_from_env
+    from .session_manager import SessionManager
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    detector = detector_from_env()
+    labels = tuple(detector.classifier.labels) if detector.classifier else None
+    rooms = {}  # room id -> SessionManager used only for track()
+    conn.send(('ready', os.getpid(), labels, detector.available))
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            if msg[0] == 'drop':
+                rooms.pop(msg[1], None)
+                continue
+            _, room_id, slot, shape = msg
+            t0 = time.perf_counter()
+            try:
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+                manager = rooms.get(room_id)
+                if manager is None:
+                    manager = rooms[room_id] = SessionManager(emotion_detector=detector)
+                matches = manager.track(frame, detector.detect(frame))
+                rows, probs = encode_matches(matches, labels)
+                conn.send((rows, probs, (time.perf_counter() - t0) * 1000))
+            except Exception as e:
+                conn.send(e)
+            finally:
+                frame = None  # release the view before the block can be closed
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shm.close()
+
+class FrameSlot:
+    """One frame-sized region of a worker's shared memory."""
+    def __init__(self, worker, index):
+        self.worker = worker
+        self.index = index
+
+    def view(self, shape):
+        """Writable (h, w, 3) uint8 array over the slot, or None if the frame is too large."""
+        if shape is None or int(np.prod(shape)) > self.worker.slot_bytes:
+            return None
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.worker.shm.buf,
+                          offset=self.index * self.worker.slot_bytes)
+
+class _Worker:
+    def __init__(self, ctx, slots, slot_bytes):
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(self.shm.name, slot_bytes, child), daemon=True)
+        self.process.start()
+        child.close()
+        self.lock = threading.Lock()  # one request in flight per pipe
+        self.free = None              # asyncio.Queue of slot indices, made on the serving loop
+        self.n_slots = slots
+        self.rooms = set()
+        self.labels = None
+        self.dead = False
+
+    def wait_ready(self, timeout):
+        try:
+            if not self.conn.poll(timeout):
+                raise TimeoutError("Inference worker did not start")
+            _, self.pid, self.labels, has_model = self.conn.recv()
+        except EOFError:
+            raise RuntimeError(f"Inference worker exited during startup (code {self.process.exitcode})")
+        if not has_model:
+            print(f"⚠️ Inference worker {self.pid} has no face model; it will return no detections")
+
+    def request(self, msg):
+        with self.lock:
+            try:
+                self.conn.send(msg)
+                reply = self.conn.recv()
+            except (EOFError, OSError) as e:
+                self.dead = True
+                raise WorkerLost(f"Inference worker {self.process.pid} exited (code {self.process.exitcode})") from e
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def send(self, msg):
+        with self.lock:
+            try:
+                self.conn.send(msg)
+            except OSError:
+                self.dead = True
+
+    def stop(self):
+        try:
+            self.send(None)
+        except Exception:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+class InferencePool:
+    """
+    async with pool.slot(room_id) as slot:
+        frame = camera.get_frame(out=slot.view(camera.frame_shape))
+        matches = await pool.track(slot, frame)
+        _, metrics = session_manager.process_matches(frame, matches)
+    """
+    def __init__(self, workers=None, max_frame_shape=MAX_FRAME_SHAPE, slots_per_worker=SLOTS_PER_WORKER):
+        workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.slot_bytes = int(np.prod(max_frame_shape))
+        self.slots_per_worker = slots_per_worker
+        # spawn: workers must not inherit the server's threads or MediaPipe state
+        self.ctx = mp.get_context("spawn")
+        self.workers = [_Worker(self.ctx, slots_per_worker, self.slot_bytes) for _ in range(workers)]
+        self.room_workers = {}  # room id -> _Worker
+        self.restarts = 0
+        self._retired = []      # shared memory of replaced workers (frames may still view it)
+        self._replace_lock = threading.Lock()
+        try:
+            for w in self.workers:
+                w.wait_ready(WORKER_START_TIMEOUT)
+        except Exception:
+            self.close()
+            raise
+
+    def _worker_for(self, room_id):
+        worker = self.room_workers.get(room_id)
+        if worker is None:
+            # A dead worker is only picked if every worker is (its replacement is starting)
+            worker = min(self.workers, key=lambda w: (w.dead, len(w.rooms)))
+            worker.rooms.add(room_id)
+            self.room_workers[room_id] = worker
+        return worker
+
+    @asynccontextmanager
+    async def slot(self, room_id):
+        """Borrow a free slot on the room's worker (waits while all are busy)."""
+        worker = self._worker_for(room_id)
+        if worker.free is None:
+            worker.free = asyncio.Queue()
+            for i in range(worker.n_slots):
+                worker.free.put_nowait(i)
+        index = await worker.free.get()
+        slot = FrameSlot(worker, index)
+        slot.room_id = room_id
+        try:
+            yield slot
+        finally:
+            worker.free.put_nowait(index)
+
+    async def track(self, slot, frame):
+        """
+        Detect and track the frame on the slot's worker. The frame is only
+        copied if it isn't already the slot's view. Returns
+        [(track_id, ltrb, detection)] for SessionManager.process_matches.
+        """
+        view = slot.view(frame.shape)
+        if view is None:
+            raise ValueError(f"Frame {frame.shape} exceeds the pool's slot size")
+        if not np.may_share_memory(view, frame):
+            view[...] = frame
+        try:
+            with stage("inference_worker"):
+                rows, probs, _ = await asyncio.to_thread(
+                    slot.worker.request, ('frame', slot.room_id, slot.index, frame.shape)
+                )
+        except WorkerLost:
+            await asyncio.to_thread(self._replace, slot.worker)
+            raise
+        return decode_matches(rows, probs, slot.worker.labels)
+
+    def _replace(self, worker):
+        """Start a new worker in place of a dead one and unpin its rooms."""
+        with self._replace_lock:
+            if worker not in self.workers:
+                return  # another room's frame already replaced it
+            for room_id in list(worker.rooms):
+                if self.room_workers.get(room_id) is worker:
+                    del self.room_workers[room_id]
+            print(f"⚠️ Inference worker {worker.process.pid} exited (code {worker.process.exitcode}); "
+                  f"restarting it, {len(worker.rooms)} room(s) lose their tracks")
+            worker.rooms.clear()
+            worker.stop()
+            worker.shm.unlink()
+            self._retired.append(worker.shm)
+            fresh = _Worker(self.ctx, self.slots_per_worker, self.slot_bytes)
+            try:
+                fresh.wait_ready(WORKER_START_TIMEOUT)
+            except Exception:
+                fresh.stop()
+                fresh.shm.close()
+                fresh.shm.unlink()
+                raise
+            self.workers[self.workers.index(worker)] = fresh
+            self.restarts += 1
+
+    def release_room(self, room_id):
+        """Forget a room's tracker (call when its feed closes)."""
+        worker = self.room_workers.pop(room_id, None)
+        if worker is not None:
+            worker.rooms.discard(room_id)
+            worker.send(('drop', room_id))
+
+    def status(self):
+        return [{'pid': w.process.pid, 'alive': w.process.is_alive(), 'rooms': sorted(map(str, w.rooms))}
+                for w in self.workers]
+
+    def close(self):
+        for w in self.workers:
+            try:
+                w.send(None)
+            except Exception:
+                pass
+        for w in self.workers:
+            w.process.join(timeout=5)
+            if w.process.is_alive():
+                w.process.terminate()
+            w.shm.close()
+            w.shm.unlink()
+        for shm in self._retired:
+            try:
+                shm.close()
+            except BufferError:
+                pass  # a frame still views it; freed with the process
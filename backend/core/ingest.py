@@ -0,0 +1,143 @@
+import asyncio
+import json
+import struct
+import time
+
+import cv2
+import numpy as np
+
+from deep_sort_realtime.deepsort_tracker import DeepSort
+
+from .session_manager import SessionManager
+from .detectors import detector_from_env
+from .gamification_engine import GamificationEngine
+from .recommendations_engine import RecommendationsEngine
+from .emotion_detector_v2 import EmotionResult
+from .inference_pool import WorkerLost
+
+# Binary frame messages: 4-byte big-endian sequence number + JPEG bytes
+SEQ_HEADER = struct.Struct(">I")
+
+class _NoDetector:
+    """Placeholder for rooms whose clients push detections, or whose frames go to an inference pool."""
+    def detect(self, frame):
+        return []
+
+class IngestRoom:
+    """
+    One independently tracked camera feed pushed over /ws/ingest/{room_id}.
+    Used by remote cameras and by the load generator (benchmarks/loadgen.py).
+
+    config (first text message):
+        { "mode": "jpeg" | "detections", "width": 640, "height": 480,
+          "session": bool, "teacher_id": str, "class_id": str,
+          "detector": "mediapipe" | "mediapipe_tiled" | "fer" | "haar" | "auto" }
+
+    With an InferencePool, jpeg rooms detect and track in a worker
+    process (process_pooled) instead of in the server.
+    """
+    def __init__(self, room_id, config, pool=None):
+        self.room_id = room_id
+        self.mode = config.get("mode", "jpeg")
+        if self.mode not in ("jpeg", "detections"):
+            raise ValueError(f"Unsupported ingest mode: {self.mode}")
+        self.width = int(config.get("width", 640))
+        self.height = int(config.get("height", 480))
+
+        self.pool = pool if self.mode == "jpeg" else None
+        self.pool_key = f"ingest:{room_id}:{id(self)}"
+        # A room may pick its own detector backend (core/detectors.py); pooled rooms use the workers'
+        if self.mode == "detections" or self.pool:
+            detector = _NoDetector()
+        else:
+            detector = detector_from_env(config.get("detector"))
+        tracker = None
+        if self.mode == "detections":
+            # No pixels to crop appearance features from: DeepSort matches on landmark geometry
+            # (geometry_embeddings) and motion instead of running its CNN embedder
+            tracker = DeepSort(max_age=60, n_init=3, embedder=None)
+        self.session_manager = SessionManager(emotion_detector=detector, tracker=tracker)
+        self.gamification = GamificationEngine()
+        self.recommendations = RecommendationsEngine()
+
+        if config.get("session"):
+            result = self.session_manager.start_session(
+                config.get("teacher_id", f"room_{room_id}"),
+                config.get("class_id", str(room_id)),
+                close_others=False
+            )
+            if result.get("session_id"):
+                self.gamification.start_session(result["session_id"])
+                self.recommendations.start_session(result["session_id"])
+
+    def decode(self, message):
+        """
+        Returns (seq, payload) for a websocket message dict: binary JPEG in
+        jpeg mode, JSON { "seq", "detections": [ {bbox, emotion, confidence} ] }
+        in detections mode.
+        """
+        if self.mode == "jpeg":
+            data = message.get("bytes")
+            if not data or len(data) <= SEQ_HEADER.size:
+                raise ValueError("Expected binary frame message")
+            (seq,) = SEQ_HEADER.unpack_from(data)
+            return seq, data[SEQ_HEADER.size:]
+        msg = json.loads(message.get("text") or "{}")
+        return msg.get("seq", 0), msg.get("detections", [])
+
+    def _decode_jpeg(self, payload):
+        frame = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Could not decode JPEG frame")
+        return frame
+
+    def process(self, payload):
+        """Run one frame through the room's pipeline. Called off the event loop."""
+        t0 = time.perf_counter()
+        if self.mode == "jpeg":
+            frame = self._decode_jpeg(payload)
+            _, metrics = self.session_manager.process_frame(frame, annotate=False)
+        else:
+            detections = [{
+                'bbox': d['bbox'],
+                'emotion': EmotionResult(
+                    emotion=d.get('emotion', 'neutral'),
+                    confidence=float(d.get('confidence', 0.8)),
+                    explanation='pushed'
+                ),
+                'landmarks': None
+            } for d in payload]
+            _, metrics = self.session_manager.process_detections(None, detections, annotate=False,
+                                                                 frame_size=(self.width, self.height))
+        return self._finish(metrics, t0)
+
+    async def process_pooled(self, payload):
+        """process() for jpeg rooms with a pool; runs on the event loop."""
+        t0 = time.perf_counter()
+        try:
+            matches, size = await self._track_pooled(payload)
+        except WorkerLost:
+            # The room's worker died and was replaced; this frame goes to the new one
+            matches, size = await self._track_pooled(payload)
+        # The frame lived in the worker's slot, which is free again by now
+        _, metrics = self.session_manager.process_matches(None, matches, annotate=False, frame_size=size)
+        return self._finish(metrics, t0)
+
+    async def _track_pooled(self, payload):
+        async with self.pool.slot(self.pool_key) as slot:
+            frame = await asyncio.to_thread(self._decode_jpeg, payload)
+            return await self.pool.track(slot, frame), (frame.shape[1], frame.shape[0])
+
+    def _finish(self, metrics, t0):
+        metrics['leaderboard'] = self.gamification.process_frame_points(metrics)
+        self.recommendations.process_frame(metrics, include_active=True)
+        metrics['server_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+        return metrics
+
+    def close(self):
+        if self.pool:
+            self.pool.release_room(self.pool_key)
+        if self.session_manager.active_session_id:
+            self.session_manager.stop_session()
+            self.gamification.end_session()
+            self.recommendations.end_session()
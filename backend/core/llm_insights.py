@@ -1,4 +1,3 @@
-from groq import Groq
 import os
 import random
 from dotenv import load_dotenv
@@ -13,6 +12,7 @@ class InsightGenerator:
             print("⚠️ GROQ_API_KEY not found. Using Mock AI.")
             self.client = None
         else:
+            from groq import Groq
             self.client = Groq(api_key=api_key)
             
     def generate_classroom_insight(self, session_data: dict) -> dict:
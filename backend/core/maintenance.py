@@ -0,0 +1,235 @@
+"""
+Retention for the metrics tables, which otherwise only grow. Rows are kept
+raw for RAW_RETENTION_DAYS, then rolled up into 10 s buckets, and after
+TEN_SECOND_RETENTION_DAYS into 1 min buckets (kept from then on). A bucket
+row holds the mean of the numeric columns and the most common emotion or
+activity for its (session, student) group.
+
+Work proceeds one time window per transaction, with a short pause between
+windows, so live metric writes never wait long on the SQLite write lock.
+A watermark per (table, bucket size) lets each run resume where the last
+one stopped. Afterwards freed pages are released with incremental_vacuum
+and the planner statistics refreshed with ANALYZE.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from .database import SessionLocal, engine, PersonMetric, AudioMetric, EmotionMetric, MaintenanceWatermark
+
+RAW_RETENTION_DAYS = int(os.environ.get("METRICS_RAW_DAYS", "14"))
+TEN_SECOND_RETENTION_DAYS = int(os.environ.get("METRICS_10S_DAYS", "90"))
+# Default hours between background runs (main.py reads MAINTENANCE_INTERVAL_HOURS)
+MAINTENANCE_INTERVAL_HOURS = 24.0
+# First background run this long after startup
+MAINTENANCE_START_DELAY = 300.0
+
+# Rows are compacted one window of this many seconds per transaction (a multiple of every bucket size)
+WINDOW_SECONDS = 600
+# Pause between windows, so other writers get the lock
+WINDOW_PAUSE = 0.05
+# SQLite allows 999 bound parameters per statement
+DELETE_CHUNK = 500
+# Pages released per incremental_vacuum call
+VACUUM_PAGES = 10000
+
+EPOCH = datetime(1970, 1, 1)
+
+# table -> model, group keys, averaged columns, most-common columns, last-value columns
+TABLES = {
+    'person_metrics': dict(
+        model=PersonMetric, keys=('session_id', 'person_id'),
+        mean=('emotion_confidence', 'attention_score', 'gaze_focus', 'audio_noise', 'speech_ratio'),
+        mode=('emotion',), last=('head_pose',)),
+    'audio_metrics': dict(
+        model=AudioMetric, keys=('session_id',),
+        mean=('noise_db', 'speech_ratio'), mode=('activity_type',), last=()),
+    'emotion_metrics': dict(
+        model=EmotionMetric, keys=('student_id',),
+        mean=('confidence',), mode=('emotion',), last=()),
+}
+
+def _bucket_start(ts, bucket):
+    seconds = int((ts - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % bucket)
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+def _mode(values):
+    counts = Counter(v for v in values if v is not None)
+    return counts.most_common(1)[0][0] if counts else None
+
+def _last(values):
+    for v in reversed(values):
+        if v is not None:
+            return v
+    return None
+
+class MetricsMaintenance:
+    def __init__(self, raw_days=RAW_RETENTION_DAYS, ten_second_days=TEN_SECOND_RETENTION_DAYS,
+                 window_seconds=WINDOW_SECONDS, pause=WINDOW_PAUSE):
+        # (age in days, bucket seconds): rows older than the age are rolled up to the bucket size
+        self.tiers = [(raw_days, 10), (ten_second_days, 60)]
+        self.window = timedelta(seconds=window_seconds)
+        self.pause = pause
+        self.lock = threading.Lock()
+        self.last_report = None
+
+    def ensure_indexes(self):
+        """Windows are selected by timestamp; older databases lack those indexes."""
+        for spec in TABLES.values():
+            for index in spec['model'].__table__.indexes:
+                index.create(bind=engine, checkfirst=True)
+
+    # Compaction
+
+    def _watermark(self, db, table, bucket):
+        return db.query(MaintenanceWatermark).filter(
+            MaintenanceWatermark.table_name == table,
+            MaintenanceWatermark.bucket_seconds == bucket
+        ).first()
+
+    def _compact_window(self, db, spec, bucket, start, end):
+        """Replace the rows in [start, end) by one row per bucket and group. Returns (rows in, rows out)."""
+        model = spec['model']
+        names = spec['keys'] + spec['mean'] + spec['mode'] + spec['last']
+        rows = db.query(model.id, model.timestamp, *(getattr(model, n) for n in names))\
+            .filter(model.timestamp >= start, model.timestamp < end)\
+            .order_by(model.timestamp, model.id).all()
+        if not rows:
+            return 0, 0
+
+        n_keys = len(spec['keys'])
+        groups = {}
+        for row in rows:
+            key = tuple(row[2:2 + n_keys]) + (_bucket_start(row[1], bucket),)
+            groups.setdefault(key, []).append(row)
+
+        delete_ids = []
+        added = []
+        for key, group in groups.items():
+            bucket_ts = key[-1]
+            if len(group) == 1 and group[0][1] == bucket_ts:
+                continue  # already a bucket row
+            columns = list(zip(*group))
+            values = dict(zip(spec['keys'], key[:-1]))
+            offset = 2 + n_keys
+            for fn, cols in ((_mean, spec['mean']), (_mode, spec['mode']), (_last, spec['last'])):
+                for name in cols:
+                    values[name] = fn(columns[offset])
+                    offset += 1
+            added.append(model(timestamp=bucket_ts, **values))
+            delete_ids.extend(columns[0])
+
+        for i in range(0, len(delete_ids), DELETE_CHUNK):
+            db.query(model).filter(model.id.in_(delete_ids[i:i + DELETE_CHUNK]))\
+                .delete(synchronize_session=False)
+        db.add_all(added)
+        return len(delete_ids), len(added)
+
+    def compact(self, table, days, bucket, now=None):
+        """Roll rows of `table` older than `days` up to `bucket`-second buckets, window by window."""
+        spec = TABLES[table]
+        model = spec['model']
+        now = now or datetime.utcnow()
+        cutoff = _bucket_start(now - timedelta(days=days), bucket)
+        rows_in = rows_out = windows = 0
+
+        db = SessionLocal()
+        try:
+            mark = self._watermark(db, table, bucket)
+            if mark is None:
+                mark = MaintenanceWatermark(table_name=table, bucket_seconds=bucket, done_until=None)
+                db.add(mark)
+            start = mark.done_until
+            while True:
+                # Skip empty stretches (holidays) straight to the next row
+                q = db.query(func.min(model.timestamp))
+                if start is not None:
+                    q = q.filter(model.timestamp >= start)
+                first = q.scalar()
+                if first is None or first >= cutoff:
+                    break
+                start = _bucket_start(first, bucket)
+                end = min(start + self.window, cutoff)
+                n_in, n_out = self._compact_window(db, spec, bucket, start, end)
+                mark.done_until = end
+                mark.updated_at = datetime.utcnow()
+                db.commit()
+                rows_in += n_in
+                rows_out += n_out
+                windows += 1
+                start = end
+                if self.pause:
+                    time.sleep(self.pause)
+            mark.done_until = max(mark.done_until or cutoff, cutoff)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return {'bucket_seconds': bucket, 'windows': windows, 'rows_removed': rows_in, 'rows_added': rows_out}
+
+    # Storage
+
+    def vacuum(self, full=False):
+        """
+        Release free pages and refresh statistics. Incremental vacuum needs
+        auto_vacuum=INCREMENTAL, which an existing database only gets from
+        one full VACUUM (full=True; it rewrites the file and locks it meanwhile).
+        """
+        if engine.dialect.name != "sqlite":
+            return {}
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+            if full:
+                conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.exec_driver_sql("VACUUM")
+            elif mode == 2:
+                # sqlite3's execute() steps this pragma once (one page); executescript runs it to the end
+                conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES});")
+            elif before:
+                print(f"⚠️ {before} free pages kept: auto_vacuum is off, run maintenance once with full_vacuum")
+            for table in TABLES:
+                conn.exec_driver_sql(f"ANALYZE {table}")
+            after = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        return {'free_pages_before': before, 'free_pages_after': after}
+
+    def run(self, now=None, full_vacuum=False):
+        """One maintenance pass over all tables and tiers. Returns a report, or None if a pass is already running."""
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            t0 = time.perf_counter()
+            self.ensure_indexes()
+            report = {'started_at': datetime.utcnow().isoformat(), 'tables': {}}
+            for table in TABLES:
+                report['tables'][table] = [self.compact(table, days, bucket, now) for days, bucket in self.tiers]
+            report['vacuum'] = self.vacuum(full_vacuum)
+            report['seconds'] = round(time.perf_counter() - t0, 2)
+            self.last_report = report
+            return report
+        finally:
+            self.lock.release()
+
+    async def run_periodically(self, interval_hours=MAINTENANCE_INTERVAL_HOURS, delay=MAINTENANCE_START_DELAY):
+        """Background loop for the app's lifespan; cancel the task to stop it."""
+        await asyncio.sleep(delay)
+        while True:
+            try:
+                report = await asyncio.to_thread(self.run)
+                if report:
+                    removed = sum(t['rows_removed'] for tiers in report['tables'].values() for t in tiers)
+                    print(f"🧹 Metrics maintenance: {removed} rows compacted in {report['seconds']}s")
+            except Exception as e:
+                print(f"Metrics maintenance error: {e}")
+            await asyncio.sleep(interval_hours * 3600)
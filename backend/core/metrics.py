@@ -0,0 +1,197 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; tuned for per-stage frame timings (sub-ms color convert up to slow DB flushes)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+def _format_labels(names, values, *extra):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+def _format_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+class _CounterChild:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+class _Metric:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+    def render(self, extra=()):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values, *extra)} {child.value}"
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+    def time(self):
+        return self._children[()].time()
+
+    def render(self, extra=()):
+        for values, child in list(self._children.items()):
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                labels = _format_labels(self.labelnames, values, *extra, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values, *extra)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {count}"
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus-compatible registry. Observations are a bisect plus a
+    few increments under a per-series lock, cheap enough for every frame.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def families(self, process=None):
+        """[(name, help, type, sample lines)]; every sample gets a process label if one is given."""
+        extra = (("process", process),) if process else ()
+        cpu_labels = _format_labels((), (), *extra)
+        out = [("process_cpu_seconds_total", "Total user and system CPU time spent in seconds.", "counter",
+                [f"process_cpu_seconds_total{cpu_labels} {time.process_time()}"])]
+        for metric in list(self._metrics.values()):
+            out.append((metric.name, metric.help, metric.type, list(metric.render(extra))))
+        return out
+
+    def render(self, process=None, remote=None):
+        """
+        Prometheus text exposition format (version 0.0.4). `remote` is
+        another process's families() (the engine's, see core/engine.py),
+        merged in by metric name.
+        """
+        merged = {}
+        for name, help, type, samples in self.families(process) + list(remote or ()):
+            if name in merged:
+                merged[name][2].extend(samples)
+            else:
+                merged[name] = (help, type, list(samples))
+        lines = []
+        for name, (help, type, samples) in merged.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# Pipeline instrumentation shared across services
+STAGE_SECONDS = registry.histogram(
+    "pipeline_stage_seconds",
+    "Time spent in each frame/audio pipeline stage.",
+    labelnames=("stage",)
+)
+FRAMES_PROCESSED = registry.counter(
+    "frames_processed_total",
+    "Frames that went through the full video pipeline."
+)
+FRAMES_DROPPED = registry.counter(
+    "frames_dropped_total",
+    "Frames that were not processed.",
+    labelnames=("reason",)
+)
+DETECTOR_ERRORS = registry.counter(
+    "detector_errors_total",
+    "Exceptions caught inside face/emotion detectors.",
+    labelnames=("detector",)
+)
+DB_FLUSH_ROWS = registry.histogram(
+    "db_flush_rows",
+    "Rows written per metrics DB flush.",
+    buckets=SIZE_BUCKETS
+)
+
+def stage(name):
+    """Context manager timing one pipeline stage: `with stage("tracking"): ...`"""
+    return STAGE_SECONDS.labels(name).time()
@@ -0,0 +1,173 @@
+"""
+Presence per student as visibility intervals rather than first-to-last
+sighting. Each identity keeps a short list of [start, end] intervals;
+a sighting within GAP_TOLERANCE of the last one extends the open interval,
+so updates are O(1). When the tracker hands out a new id (after an
+occlusion, or someone leaving and coming back), the new track is merged
+into an identity that has been out of sight for a while (none of its
+tracks in the current frame, and not seen for MERGE_MIN_GAP), was last
+seen at the same place and, when landmarks are available, has the same
+face geometry.
+"""
+import numpy as np
+
+from .session_recorder import geometry_embeddings
+
+# Gaps shorter than this (blinks of the detector, brief occlusions) don't break an interval
+GAP_TOLERANCE = 10.0
+# A new track can continue an identity lost at most this long ago...
+MERGE_WINDOW = 300.0
+# ...and at least this long ago (about DeepSort's max_age of 60 frames at 15 FPS),
+# so a neighbour the detector missed for a few frames is not a candidate...
+MERGE_MIN_GAP = 4.0
+# ...whose last box center is within this many face widths of the new one...
+MERGE_MAX_DIST = 1.0
+# ...and whose landmark geometry is at least this similar (cosine), when both have landmarks
+MERGE_MIN_SIMILARITY = 0.9
+
+# Attendance status from the share of the session a student was visible
+PRESENT_RATIO = 0.75
+PARTIAL_RATIO = 0.25
+# First seen later than this after the session started counts as late
+LATE_AFTER = 600.0
+
+class Identity:
+    __slots__ = ('id', 'tracks', 'intervals', 'closed', 'center', 'width', 'landmarks', 'bbox')
+
+    def __init__(self, identity_id):
+        self.id = identity_id
+        self.tracks = [identity_id]
+        self.intervals = []  # [[start, end]], in time order
+        self.closed = 0.0    # total length of all but the last interval
+        self.center = None
+        self.width = 1.0
+        self.landmarks = None
+        self.bbox = None
+
+    @property
+    def first_seen(self):
+        return self.intervals[0][0]
+
+    @property
+    def last_seen(self):
+        return self.intervals[-1][1]
+
+    def present(self):
+        start, end = self.intervals[-1]
+        return self.closed + end - start
+
+class PresenceTracker:
+    def __init__(self, gap_tolerance=GAP_TOLERANCE, merge_window=MERGE_WINDOW, merge_min_gap=MERGE_MIN_GAP,
+                 merge_max_dist=MERGE_MAX_DIST, merge_min_similarity=MERGE_MIN_SIMILARITY,
+                 present_ratio=PRESENT_RATIO, partial_ratio=PARTIAL_RATIO, late_after=LATE_AFTER):
+        self.gap_tolerance = gap_tolerance
+        self.merge_window = merge_window
+        self.merge_min_gap = merge_min_gap
+        self.merge_max_dist = merge_max_dist
+        self.merge_min_similarity = merge_min_similarity
+        self.present_ratio = present_ratio
+        self.partial_ratio = partial_ratio
+        self.late_after = late_after
+        self.reset()
+
+    def reset(self, session_start=None):
+        self.session_start = session_start
+        self.identities = {}  # identity id -> Identity
+        self.track_map = {}   # track id -> Identity
+        self.last_time = None
+        self.frame_tracks = set()  # track ids confirmed in the current frame
+
+    def begin_frame(self, track_ids):
+        """The tracks confirmed in the frame about to be observed; their identities can't take merges."""
+        self.frame_tracks = set(track_ids)
+
+    def observe(self, track_id, ltrb, now, det=None):
+        """Record that track_id was visible at `now`. Returns its identity id."""
+        if self.session_start is None:
+            self.session_start = now
+        if self.last_time is None or now > self.last_time:
+            self.last_time = now
+
+        ident = self.track_map.get(track_id)
+        if ident is None:
+            ident = self._merge_candidate(ltrb, now, det)
+            if ident is None:
+                ident = self.identities[track_id] = Identity(track_id)
+            else:
+                ident.tracks.append(track_id)
+            self.track_map[track_id] = ident
+
+        if ident.intervals and now - ident.intervals[-1][1] <= self.gap_tolerance:
+            ident.intervals[-1][1] = max(ident.intervals[-1][1], now)
+        else:
+            if ident.intervals:
+                start, end = ident.intervals[-1]
+                ident.closed += end - start
+            ident.intervals.append([now, now])
+
+        l, t, r, b = (float(v) for v in ltrb)
+        ident.center = ((l + r) / 2, (t + b) / 2)
+        ident.width = max(r - l, 1.0)
+        if det is not None and det.get('landmarks') is not None:
+            # Kept by reference; embeddings are only computed when a merge is considered
+            ident.landmarks = det['landmarks']
+            ident.bbox = det['bbox']
+        return ident.id
+
+    def _merge_candidate(self, ltrb, now, det):
+        """Lost identity closest to the new track's box, if it passes the merge checks. Runs only for new tracks."""
+        l, t, r, b = (float(v) for v in ltrb)
+        center = np.array([(l + r) / 2, (t + b) / 2])
+        width = max(r - l, 1.0)
+        new_embed = None
+        if det is not None and det.get('landmarks') is not None:
+            new_embed = geometry_embeddings([det])[0]
+
+        best, best_dist = None, None
+        for ident in self.identities.values():
+            idle = now - ident.last_seen
+            # Not gone long enough (or still visible), or lost too long ago
+            if idle < self.merge_min_gap or idle > self.merge_window:
+                continue
+            if any(t in self.frame_tracks for t in ident.tracks):
+                continue
+            dist = np.linalg.norm(center - ident.center) / max(width, ident.width)
+            if dist > self.merge_max_dist:
+                continue
+            if new_embed is not None and ident.landmarks is not None:
+                old_embed = geometry_embeddings([{'bbox': ident.bbox, 'landmarks': ident.landmarks}])[0]
+                if float(new_embed @ old_embed) < self.merge_min_similarity:
+                    continue
+            if best is None or dist < best_dist:
+                best, best_dist = ident, dist
+        return best
+
+    def identity_of(self, track_id):
+        ident = self.track_map.get(track_id)
+        return ident.id if ident else track_id
+
+    def status(self, ident, end=None):
+        """'present', 'late', 'partial' or 'absent' for the session up to `end`."""
+        end = self.last_time if end is None else max(end, self.last_time)
+        duration = max(end - self.session_start, 1e-6)
+        ratio = ident.present() / duration
+        if ratio >= self.present_ratio:
+            return 'late' if ident.first_seen - self.session_start > self.late_after else 'present'
+        if ratio >= self.partial_ratio:
+            return 'partial'
+        return 'absent'
+
+    def summaries(self, end=None):
+        """identity id -> {time_present, first_seen, last_seen, status, tracks, intervals}; times are seconds from session start."""
+        out = {}
+        for ident in self.identities.values():
+            origin = self.session_start
+            out[ident.id] = {
+                'time_present': round(ident.present(), 1),
+                'first_seen': round(ident.first_seen - origin, 1),
+                'last_seen': round(ident.last_seen - origin, 1),
+                'status': self.status(ident, end),
+                'tracks': list(ident.tracks),
+                'intervals': [[round(s - origin, 1), round(e - origin, 1)] for s, e in ident.intervals],
+            }
+        return out
@@ -1,44 +1,183 @@
+import time
+from collections import Counter
+from datetime import datetime
+
+from .database import SessionLocal, Recommendation
+
+# rule -> (urgency, cooldown seconds). An alert can't be raised again for the
+# same rule and student within the cooldown of its last raise.
+RULES = {
+    'distracted': ('alert', 30.0),
+    'class_attention': ('warning', 60.0),
+    'bored': ('info', 60.0),
+    'confused': ('alert', 45.0),
+    'optimal': ('success', 30.0),
+}
+
+CLASS_ATTENTION_MIN_PEOPLE = 3
+CLASS_ATTENTION_LOW = 60.0
+# Class warning clears only once the average is back above LOW + MARGIN
+CLASS_ATTENTION_MARGIN = 5.0
+BORED_MIN = 2
+CONFUSED_MIN = 1
+FLUSH_INTERVAL = 10.0
+
 class RecommendationsEngine:
+    """
+    Stateful rules over the session manager's track events. Per-student
+    state (attention band, emotion) and the emotion counts are updated from
+    metrics['events'] only, so a frame where nothing changed costs one pass
+    for the class average. Active alerts are keyed by (rule, student):
+    a condition that stays true keeps a single alert, and per-rule
+    cooldowns stop it from flapping when the condition does.
+    """
+    def __init__(self):
+        self.session_id = None
+        self.people = {}          # track id -> {'band', 'emotion', 'attention'}
+        self.emotions = Counter() # emotion -> tracked students
+        self.active = {}          # (rule, student) -> alert
+        self.last_raised = {}     # (rule, student) -> ts
+
+        self._pending = []
+        self._last_flush = 0
+
+    def start_session(self, session_id):
+        self.session_id = session_id
+        self.reset()
+        self._pending = []
+        self._last_flush = time.time()
+
+    def end_session(self):
+        self.flush()
+        self.session_id = None
+
+    def reset(self):
+        self.people = {}
+        self.emotions = Counter()
+        self.active = {}
+        self.last_raised = {}
+
+    def _apply_event(self, event):
+        pid = event['id']
+        kind = event['type']
+        person = self.people.get(pid)
+        if kind == 'track_new':
+            if person:
+                self.emotions[person['emotion']] -= 1
+            self.people[pid] = {'band': event.get('band'), 'emotion': event['emotion'],
+                                'attention': event.get('attention')}
+            self.emotions[event['emotion']] += 1
+        elif person is None:
+            return
+        elif kind == 'emotion_change':
+            self.emotions[person['emotion']] -= 1
+            self.emotions[event['to']] += 1
+            person['emotion'] = event['to']
+        elif kind == 'attention_change':
+            person['band'] = event['to']
+            person['attention'] = event['attention']
+        elif kind == 'track_lost':
+            self.emotions[person['emotion']] -= 1
+            del self.people[pid]
+
+    def update(self, metrics: dict, now=None):
+        """
+        Fold one frame's events into the rule state and re-evaluate.
+        Returns (raised, resolved) lists of alerts.
+        """
+        now = now if now is not None else time.time()
+        for event in metrics.get('events', ()):
+            self._apply_event(event)
+
+        people = metrics.get('people', [])
+        avg_att = sum(p['attention'] for p in people) / len(people) if people else 0.0
+
+        # Conditions that hold this frame: (rule, student) -> (message, student)
+        wanted = {}
+        for pid, person in self.people.items():
+            if person['band'] == 'low':
+                wanted[('distracted', pid)] = (f"Student {pid} is distracted ({person['attention']}%).", pid)
+
+        key = ('class_attention', None)
+        threshold = CLASS_ATTENTION_LOW + (CLASS_ATTENTION_MARGIN if key in self.active else 0.0)
+        if len(people) >= CLASS_ATTENTION_MIN_PEOPLE and avg_att < threshold:
+            wanted[key] = ("Class engagement dropping below 60%. Consider a brain break.", None)
+        if self.emotions['bored'] >= BORED_MIN:
+            wanted[('bored', None)] = ("Multiple students appear bored. Change activity?", None)
+        if self.emotions['confused'] >= CONFUSED_MIN:
+            wanted[('confused', None)] = ("Confusion detected. Check for understanding.", None)
+        if people and not any(rule != 'optimal' for rule, _ in wanted):
+            wanted[('optimal', None)] = ("Engagement is optimal. Keep going!", None)
+
+        resolved = [self.active.pop(key) for key in list(self.active) if key not in wanted]
+        raised = []
+        for key, (message, pid) in wanted.items():
+            if key in self.active:
+                continue
+            rule = key[0]
+            urgency, cooldown = RULES[rule]
+            last = self.last_raised.get(key)
+            if last is not None and now - last < cooldown:
+                continue
+            alert = {'id': f"{rule}:{pid}" if pid is not None else rule, 'rule': rule,
+                     'type': urgency, 'message': message, 'student_id': pid, 'since': now}
+            self.active[key] = alert
+            self.last_raised[key] = now
+            raised.append(alert)
+            if self.session_id:
+                self._pending.append(Recommendation(
+                    session_id=self.session_id,
+                    student_id=str(pid) if pid is not None else None,
+                    recommendation=message,
+                    urgency_level=urgency,
+                    timestamp=datetime.utcfromtimestamp(now)
+                ))
+
+        if self.session_id and self._pending and now - self._last_flush > FLUSH_INTERVAL:
+            self.flush()
+            self._last_flush = now
+        return raised, resolved
+
+    def active_alerts(self):
+        """Current alerts, most urgent rules first, as [{type, message, ...}]."""
+        order = {rule: i for i, rule in enumerate(RULES)}
+        return sorted(self.active.values(), key=lambda a: (order[a['rule']], a['since']))
+
+    def process_frame(self, metrics: dict, now=None, include_active=False):
+        """
+        Updates the rules and annotates metrics for clients: 'alerts' holds
+        this frame's raised/resolved alerts, and 'recommendations' (the full
+        active list) is only included when it changed or include_active is set.
+        Returns True when it was included.
+        """
+        raised, resolved = self.update(metrics, now)
+        metrics['alerts'] = {'raised': raised, 'resolved': resolved}
+        if raised or resolved or include_active:
+            metrics['recommendations'] = self.active_alerts()
+            return True
+        return False
+
     def generate_realtime_recommendations(self, session_status: dict):
         """
         Rule-based recommendations for immediate feedback.
-        Input: Session status dict (people, emotions, attention)
-        Output: List of { type: 'alert'|'warning'|'info', message: str }
+        Input: Session status dict (people, events)
+        Output: List of { type: 'alert'|'warning'|'info'|'success', message: str }
         """
-        recs = []
-        
-        # 1. Low Attention Alert
-        avg_att = 0
-        people = session_status.get('people', [])
-        if people:
-            avg_att = sum(p['attention'] for p in people) / len(people)
-            
-            # Individual check
-            for p in people:
-                if p['attention'] < 40:
-                    recs.append({
-                        'type': 'alert',
-                        'message': f"Student {p['id']} is distracted ({p['attention']}%)."
-                    })
-        
-        # 2. Global Attention Warning
-        if len(people) > 2 and avg_att < 60:
-             recs.append({
-                 'type': 'warning',
-                 'message': "Class engagement dropping below 60%. Consider a brain break."
-             })
-             
-        # 3. Emotion Check
-        bored_count = sum(1 for p in people if p['emotion'] == 'bored')
-        confused_count = sum(1 for p in people if p['emotion'] == 'confused')
-        
-        if bored_count >= 2:
-             recs.append({'type': 'info', 'message': "Multiple students appear bored. Change activity?"})
-             
-        if confused_count >= 1:
-             recs.append({'type': 'alert', 'message': "Confusion detected. Check for understanding."})
-             
-        if not recs and people:
-             recs.append({'type': 'success', 'message': "Engagement is optimal. Keep going!"})
-             
-        return recs
+        self.update(session_status)
+        return self.active_alerts()
+
+    def flush(self):
+        """Write raised alerts to the recommendations table."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        db = SessionLocal()
+        try:
+            db.add_all(pending)
+            db.commit()
+        except Exception as e:
+            print(f"Recommendations flush error: {e}")
+            db.rollback()
+            self._pending = pending + self._pending
+        finally:
+            db.close()
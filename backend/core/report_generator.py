@@ -1,17 +1,191 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 from datetime import datetime, timedelta
-import pandas as pd
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.graphics.shapes import Drawing, String
+from reportlab.graphics.charts.lineplots import LinePlot
+import csv
+import hashlib
 import io
 import os
-from .database import Session as SessionModel, SessionPerson, PersonMetric, Insight, get_db, SessionLocal
+import threading
+from .database import Session as SessionModel, SessionPerson, PersonMetric, ArchivedSession, Insight, get_db, SessionLocal, DB_DIR
+from .analytics_service import AnalyticsService
 
-class ReportGenerator:
+# Rendered PDFs of completed sessions, keyed by session id + data version
+REPORT_CACHE_DIR = os.path.join(DB_DIR, "report_cache")
+
+# Rows fetched per round-trip when streaming exports. Memory stays bounded by
+# this chunk regardless of how many metrics a session (or range) holds.
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_COLUMNS = ['session_id', 'timestamp', 'student_id', 'emotion', 'confidence', 'attention']
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow'),
+}
+
+class _ChunkSink:
+    """Write-only file object that collects bytes until drained."""
     def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+@dataclass
+class PdfReport:
+    etag: str
+    path: Optional[str] = None      # cached file (completed sessions)
+    content: Optional[bytes] = None  # rendered in memory (active sessions)
+
+class ReportGenerator:
+    def __init__(self, cache_dir=REPORT_CACHE_DIR):
         self.styles = getSampleStyleSheet()
+        self.analytics = AnalyticsService()
+        self.archive = self.analytics.archive
+        self.export_formats = EXPORT_FORMATS
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # reportlab is CPU bound; keep it off the event loop and serialize
+        # renders so a burst of downloads can't starve the live pipeline.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
+        self._pending = {}  # session_id -> Future
+        self._lock = threading.Lock()
+
+    def submit_pdf(self, session_id: int):
+        """
+        Returns a Future resolving to a PdfReport (or None if the session
+        doesn't exist). Concurrent requests for the same session share one
+        render.
+        """
+        with self._lock:
+            future = self._pending.get(session_id)
+            if future is None:
+                future = self._executor.submit(self.get_pdf_report, session_id)
+                self._pending[session_id] = future
+                future.add_done_callback(lambda f, sid=session_id: self._forget(sid, f))
+            return future
+
+    def _forget(self, session_id, future):
+        with self._lock:
+            if self._pending.get(session_id) is future:
+                del self._pending[session_id]
+
+    def schedule_pdf(self, session_id: int):
+        """Pre-render a report in the background (e.g. right after stop_session)."""
+        future = self.submit_pdf(session_id)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future):
+        if future.exception():
+            print(f"Report generation error: {future.exception()}")
+
+    def _data_version(self, db, session):
+        # Anything that changes the rendered report must change this key
+        metrics = db.query(func.count(PersonMetric.id), func.max(PersonMetric.id))\
+            .filter(PersonMetric.session_id == session.id).one()
+        people = db.query(func.count(SessionPerson.id))\
+            .filter(SessionPerson.session_id == session.id).scalar()
+        archived = db.query(ArchivedSession.person_rows).filter(ArchivedSession.session_id == session.id).scalar()
+        raw = f"{session.status}|{session.end_time}|{session.people_count}|{session.total_attention_avg}|{metrics[0]}|{metrics[1]}|{people}|{archived}"
+        return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+    def _cache_path(self, session_id, version):
+        return os.path.join(self.cache_dir, f"report_{session_id}_{version}.pdf")
+
+    def get_pdf_report(self, session_id: int):
+        """
+        Completed sessions are rendered once and served from disk until their
+        data version changes; active sessions are rendered fresh each time.
+        """
+        db = SessionLocal()
+        try:
+            session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+            if not session:
+                return None
+            version = self._data_version(db, session)
+        finally:
+            db.close()
+
+        if session.status != "completed":
+            buffer = self.generate_pdf_report(session_id)
+            return PdfReport(etag=version, content=buffer.read()) if buffer else None
+
+        path = self._cache_path(session_id, version)
+        if not os.path.exists(path):
+            buffer = self.generate_pdf_report(session_id)
+            if not buffer:
+                return None
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(buffer.getbuffer())
+            os.replace(tmp_path, path)
+            self._evict_stale(session_id, keep=path)
+        return PdfReport(etag=version, path=path)
+
+    def _evict_stale(self, session_id, keep):
+        prefix = f"report_{session_id}_"
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(prefix) and name.endswith(".pdf") and path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _attention_chart(self, rollup, start_time):
+        drawing = Drawing(460, 180)
+        if not rollup:
+            drawing.add(String(150, 90, "No attention data recorded", fontSize=10))
+            return drawing
+
+        points = [(max(0.0, (r['time'] - start_time).total_seconds() / 60.0), r['avg_attention']) for r in rollup]
+        if len(points) == 1:
+            points.append((points[0][0] + 1, points[0][1]))
+
+        plot = LinePlot()
+        plot.x = 40
+        plot.y = 30
+        plot.width = 400
+        plot.height = 130
+        plot.data = [points]
+        plot.lines[0].strokeColor = colors.HexColor("#2563eb")
+        plot.lines[0].strokeWidth = 1.5
+        plot.yValueAxis.valueMin = 0
+        plot.yValueAxis.valueMax = 100
+        plot.yValueAxis.valueStep = 20
+        plot.xValueAxis.valueMin = min(p[0] for p in points)
+        plot.xValueAxis.valueMax = max(p[0] for p in points)
+        drawing.add(plot)
+        drawing.add(String(200, 5, "Minutes since start", fontSize=8))
+        drawing.add(String(0, 170, "Attention %", fontSize=8))
+        return drawing
 
     def generate_pdf_report(self, session_id: int):
         db = SessionLocal()
@@ -68,6 +242,21 @@ class ReportGenerator:
                 ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
             ]))
             elements.append(t2)
+            elements.append(Spacer(1, 20))
+
+            # Attention over time (per-minute rollup)
+            rollup = self.analytics.get_attention_rollup(session_id, bucket_seconds=60, db=db)
+            elements.append(Paragraph("Attention Over Time", self.styles['Heading2']))
+            elements.append(self._attention_chart(rollup, session.start_time))
+            if rollup:
+                low = min(rollup, key=lambda r: r['avg_attention'])
+                high = max(rollup, key=lambda r: r['avg_attention'])
+                elements.append(Spacer(1, 8))
+                elements.append(Paragraph(
+                    f"Peak attention {high['avg_attention']:.1f}% at {high['time'].strftime('%H:%M')}; "
+                    f"lowest {low['avg_attention']:.1f}% at {low['time'].strftime('%H:%M')}.",
+                    self.styles['Normal']
+                ))
             
             doc.build(elements)
             buffer.seek(0)
@@ -76,22 +265,114 @@ class ReportGenerator:
         finally:
             db.close()
 
-    def generate_csv_export(self, session_id: int):
+    def _metrics_query(self, db, session_ids=None, start=None, end=None):
+        # Column query: rows come back as plain tuples, no ORM identity map
+        q = db.query(
+            PersonMetric.session_id,
+            PersonMetric.timestamp,
+            PersonMetric.person_id,
+            PersonMetric.emotion,
+            PersonMetric.emotion_confidence,
+            PersonMetric.attention_score
+        )
+        if session_ids:
+            q = q.filter(PersonMetric.session_id.in_(session_ids))
+        if start:
+            q = q.filter(PersonMetric.timestamp >= start)
+        if end:
+            q = q.filter(PersonMetric.timestamp < end)
+        return q
+
+    def has_metrics(self, session_ids=None, start=None, end=None):
         db = SessionLocal()
         try:
-            metrics = db.query(PersonMetric).filter(PersonMetric.session_id == session_id).all()
-            if not metrics:
-                return None
-                
-            data = [{
-                'timestamp': m.timestamp,
-                'student_id': m.person_id,
-                'emotion': m.emotion,
-                'confidence': m.emotion_confidence,
-                'attention': m.attention_score
-            } for m in metrics]
-            
-            df = pd.DataFrame(data)
-            return df.to_csv(index=False)
+            if self._metrics_query(db, session_ids, start, end).first() is not None:
+                return True
         finally:
             db.close()
+        return self.archive.has_metrics(session_ids, start, end)
+
+    def _iter_metric_chunks(self, session_ids=None, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Yields lists of at most chunk_size metric rows, paging through a
+        streaming cursor so the full result set is never materialized.
+        Archived sessions come first, read batch by batch from the archive.
+        """
+        yield from self.archive.iter_metric_chunks(session_ids, start, end, chunk_size)
+        db = SessionLocal()
+        try:
+            rows = self._metrics_query(db, session_ids, start, end)\
+                .order_by(PersonMetric.session_id, PersonMetric.id)\
+                .execution_options(stream_results=True)\
+                .yield_per(chunk_size)
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            db.close()
+
+    def iter_export(self, fmt, session_ids=None, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+        if fmt == 'csv':
+            return self.iter_csv_export(session_ids, start, end, chunk_size)
+        if fmt in ('parquet', 'arrow'):
+            return self.iter_arrow_export(fmt, session_ids, start, end, chunk_size)
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    def iter_csv_export(self, session_ids=None, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for chunk in self._iter_metric_chunks(session_ids, start, end, chunk_size):
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        if buffer.tell():
+            # Header only (empty range)
+            yield buffer.getvalue()
+
+    def iter_arrow_export(self, fmt, session_ids=None, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Columnar export. Each chunk becomes one Parquet row group / Arrow
+        record batch, flushed to the client as soon as it is encoded.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([
+            ('session_id', pa.int32()),
+            ('timestamp', pa.timestamp('us')),
+            ('student_id', pa.dictionary(pa.int32(), pa.string())),
+            ('emotion', pa.dictionary(pa.int8(), pa.string())),
+            ('confidence', pa.float32()),
+            ('attention', pa.float32()),
+        ])
+        sink = _ChunkSink()
+        if fmt == 'parquet':
+            writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        else:
+            writer = pa.ipc.new_stream(sink, schema)
+
+        try:
+            for chunk in self._iter_metric_chunks(session_ids, start, end, chunk_size):
+                columns = list(zip(*chunk))
+                batch = pa.record_batch([
+                    pa.array(columns[0], type=pa.int32()),
+                    pa.array(columns[1], type=pa.timestamp('us')),
+                    pa.array(columns[2], type=pa.string()).dictionary_encode(),
+                    pa.array(columns[3], type=pa.string()).dictionary_encode().cast(schema.field('emotion').type),
+                    pa.array(columns[4], type=pa.float32()),
+                    pa.array(columns[5], type=pa.float32()),
+                ], schema=schema)
+                writer.write_batch(batch)
+                data = sink.drain()
+                if data:
+                    yield data
+        finally:
+            writer.close()
+        yield sink.drain()
@@ -0,0 +1,96 @@
+import asyncio
+import importlib
+import threading
+import time
+
+class ServiceRegistry:
+    """
+    Builds services on first use instead of at import time. Each service is
+    registered as a "module:Class" spec, so its module (and the heavy
+    dependencies behind it: MediaPipe, DeepSort, librosa, reportlab, Groq)
+    is only imported when the service is first needed or during warm-up.
+    """
+
+    def __init__(self):
+        self._specs = {}      # name -> (module, attr, args, kwargs)
+        self._instances = {}  # name -> service
+        self._locks = {}      # name -> Lock
+        self._state = {}      # name -> pending | loading | ready | error
+        self._timings = {}    # name -> {'import_ms', 'init_ms'}
+        self._errors = {}     # name -> str
+        self.warm_up_started = False
+        self.warm_up_done = False
+
+    def register(self, name, spec, *args, **kwargs):
+        module, attr = spec.split(":")
+        self._specs[name] = (module, attr, args, kwargs)
+        self._locks[name] = threading.Lock()
+        self._state[name] = "pending"
+
+    def get(self, name):
+        inst = self._instances.get(name)
+        if inst is not None:
+            return inst
+        if name not in self._specs:
+            raise KeyError(f"Unknown service '{name}'")
+
+        with self._locks[name]:
+            inst = self._instances.get(name)
+            if inst is not None:
+                return inst
+            module, attr, args, kwargs = self._specs[name]
+            self._state[name] = "loading"
+            try:
+                t0 = time.perf_counter()
+                cls = getattr(importlib.import_module(module), attr)
+                t1 = time.perf_counter()
+                inst = cls(*args, **kwargs)
+                t2 = time.perf_counter()
+            except Exception as e:
+                self._state[name] = "error"
+                self._errors[name] = str(e)
+                raise
+            self._timings[name] = {
+                'import_ms': round((t1 - t0) * 1000, 1),
+                'init_ms': round((t2 - t1) * 1000, 1)
+            }
+            self._instances[name] = inst
+            self._state[name] = "ready"
+            return inst
+
+    async def aget(self, name):
+        """Like get(), but builds a cold service in a thread so the event loop keeps serving."""
+        inst = self._instances.get(name)
+        if inst is not None:
+            return inst
+        return await asyncio.to_thread(self.get, name)
+
+    def __contains__(self, name):
+        return name in self._specs
+
+    def is_ready(self, name):
+        return name in self._instances
+
+    def warm_up(self, names=None):
+        """Build every service (in registration order unless names is given)."""
+        self.warm_up_started = True
+        for name in names or list(self._specs):
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"⚠️ Service '{name}' failed to initialize: {e}")
+        self.warm_up_done = True
+
+    def status(self):
+        services = {}
+        for name in self._specs:
+            entry = {'state': self._state[name]}
+            entry.update(self._timings.get(name, {}))
+            if name in self._errors:
+                entry['error'] = self._errors[name]
+            services[name] = entry
+        return {
+            'ready': all(s == "ready" for s in self._state.values()),
+            'warm_up': "done" if self.warm_up_done else ("running" if self.warm_up_started else "not_started"),
+            'services': services
+        }
@@ -1,37 +1,71 @@
 import cv2
-import time
+import json
+import os
 import numpy as np
 from datetime import datetime
 from sqlalchemy.orm import Session as DBSession
 from deep_sort_realtime.deepsort_tracker import DeepSort
 
-from .database import SessionLocal, Session as SessionModel, SessionPerson, PersonMetric, get_db
-from .emotion_detector_v2 import MediaPipeEmotionDetector
+from .database import SessionLocal, Session as SessionModel, SessionPerson, SessionPresence, SessionHeatmap, PersonMetric, AudioMetric, get_db
+from .detectors import detector_from_env
+from .metrics import stage, DB_FLUSH_ROWS
+from .session_recorder import SessionRecorder, geometry_embeddings
+from .track_state import TrackStates
+from .presence import PresenceTracker
+from .fusion import FusionEngine, clock, engagement_score
+from .heatmap import EngagementHeatmap
+from . import attention
+
+# Max pixel distance between a track center and a detection center to associate them
+ASSOCIATION_MAX_DIST = 50
+# PersonMetric rows are written on stable changes, plus this often per track otherwise
+METRIC_HEARTBEAT_SECONDS = 5.0
+# Pending rows are batched into one DB write at most this often
+DB_FLUSH_INTERVAL = 2.0
+# One audio_metrics row per this many seconds of microphone input
+AUDIO_LOG_SECONDS = 5.0
 
 class SessionManager:
-    def __init__(self):
+    def __init__(self, emotion_detector=None, tracker=None, record_dir=None):
         self.active_session_id = None
         self.active_session_data = None
-        # Initialize DeepSORT
-        self.tracker = DeepSort(max_age=60, n_init=3)
-        self.emotion_detector = MediaPipeEmotionDetector()
+        # Initialize DeepSORT (a tracker built with embedder=None is fed landmark-geometry embeddings)
+        self.tracker = tracker or DeepSort(max_age=60, n_init=3)
+        # Anything with detect(frame) -> [{bbox, emotion, landmarks}] works here
+        self.emotion_detector = emotion_detector or detector_from_env()
         
         # In-memory history for active session
         # { 'track_id': { 'name': str, 'emotions': [], 'attention': [], 'first_seen': ts, 'last_seen': ts } }
         self.person_history = {}
         self.start_time = None
+        # Smoothed attention/emotion per track, with change events (see track_state.py)
+        self.track_states = TrackStates()
+        # Visibility intervals per student, with fragmented tracks merged (see presence.py)
+        self.presence = PresenceTracker()
+        # Rolling audio/visual windows on the shared clock (see fusion.py)
+        self.fusion = FusionEngine()
+        self.audio_logged = 0.0   # clock() of the last audio_metrics row
+        # Attention per region of the frame, for the session (see heatmap.py)
+        self.heatmap = EngagementHeatmap()
         
         # Throttling
         self.last_db_update = 0
+        self.pending_metrics = []
+
+        # Optional detector-output recording, one file per session (see session_recorder.py)
+        self.record_dir = record_dir if record_dir is not None else os.environ.get("SESSION_RECORD_DIR")
+        self.record_landmarks = os.environ.get("SESSION_RECORD_LANDMARKS", "key")
+        self.recorder = None
         
-    def start_session(self, teacher_id="teacher_1", class_id="class_1"):
+    def start_session(self, teacher_id="teacher_1", class_id="class_1", close_others=True):
         db = SessionLocal()
         try:
-            # Close any existing active sessions
-            active = db.query(SessionModel).filter(SessionModel.status == "active").all()
-            for s in active:
-                s.status = "completed"
-                s.end_time = datetime.utcnow()
+            # Close any existing active sessions (independent rooms opt out)
+            if close_others:
+                active = db.query(SessionModel).filter(SessionModel.status == "active").all()
+                for s in active:
+                    s.status = "completed"
+                    s.end_time = datetime.utcnow()
             
             new_session = SessionModel(
                 teacher_id=teacher_id,
@@ -45,11 +79,20 @@ class SessionManager:
             
             self.active_session_id = new_session.id
             self.active_session_data = new_session
-            self.start_time = time.time()
+            self.start_time = clock()
             self.person_history = {}
+            self.track_states.reset()
+            self.presence.reset(self.start_time)
+            self.fusion.reset()
+            self.audio_logged = self.start_time
+            self.heatmap.reset()
+            self.pending_metrics = []
             
             # Reset tracker
             self.tracker.delete_all_tracks()
+            if self.recorder:
+                self.recorder.close()
+                self.recorder = None
             
             return {"status": "started", "session_id": self.active_session_id}
         except Exception as e:
@@ -64,187 +107,374 @@ class SessionManager:
             
         db = SessionLocal()
         try:
+            summary = None
             session = db.query(SessionModel).filter(SessionModel.id == self.active_session_id).first()
             if session:
                 session.status = "completed"
                 session.end_time = datetime.utcnow()
+                # Rows still waiting for the next throttled flush
+                db.add_all(self.pending_metrics)
+                self.pending_metrics = []
                 
-                # Save final summaries to SessionPeople
-                for pid, data in self.person_history.items():
-                    # Calculate aggregates
-                    avg_att = np.mean(data['attention']) if data['attention'] else 0
-                    
-                    # Determine dominant emotion
-                    emotions = [e['label'] for e in data['emotions']]
-                    if emotions:
-                        dom = max(set(emotions), key=emotions.count)
-                    else:
-                        dom = "neutral"
-                        
-                    duration = data['last_seen'] - data['first_seen']
-                    
-                    sp = SessionPerson(
+                # Save final summaries to SessionPeople, with presence intervals alongside
+                people = self.person_summaries(end=clock())
+                for p in people:
+                    db.add(SessionPerson(
                         session_id=self.active_session_id,
-                        person_id=str(pid),
-                        total_time_present=duration,
-                        avg_attention=float(avg_att),
-                        dominant_emotion=dom
-                    )
-                    db.add(sp)
-                
+                        person_id=p['person_id'],
+                        total_time_present=p['time_present'],
+                        avg_attention=p['avg_attention'],
+                        dominant_emotion=p['dominant_emotion']
+                    ))
+                    db.add(SessionPresence(
+                        session_id=self.active_session_id,
+                        person_id=p['person_id'],
+                        status=p['status'],
+                        first_seen=p['first_seen'],
+                        intervals=json.dumps(p['intervals'], separators=(',', ':')),
+                        track_ids=",".join(p['tracks'])
+                    ))
+
+                if self.heatmap.counts.any():
+                    db.merge(SessionHeatmap(session_id=self.active_session_id, **self.heatmap.to_record()))
+
+                session.people_count = len(people)
+                session.total_attention_avg = float(np.mean([p['avg_attention'] for p in people])) if people else 0.0
                 db.commit()
+
+                summary = {
+                    'session_id': session.id,
+                    'teacher_id': session.teacher_id,
+                    'class_id': session.class_id,
+                    'duration': (session.end_time - session.start_time).total_seconds(),
+                    'avg_attention': session.total_attention_avg,
+                    'attendance': self._attendance_counts(people),
+                    'people': people
+                }
                 
+            recording = None
+            if self.recorder:
+                recording = self.recorder.path
+                self.recorder.close()
+                self.recorder = None
+
+            stopped_id = self.active_session_id
             self.active_session_id = None
             self.active_session_data = None
             self.person_history = {}
-            return {"status": "stopped"}
+            result = {"status": "stopped", "session_id": stopped_id, "summary": summary}
+            if recording:
+                result["recording"] = recording
+            return result
         finally:
             db.close()
             
-    def process_frame(self, frame):
+    def process_frame(self, frame, annotate=True):
         """
         Main pipeline step.
         """
         # 1. Detection & Emotion Analysis
         # returns list of {bbox, emotion, landmarks}
         detections_raw = self.emotion_detector.detect(frame)
-        
-        current_people = []
-        
+        return self.process_detections(frame, detections_raw, annotate)
+
+    def process_detections(self, frame, detections_raw, annotate=True, now=None, frame_size=None):
+        """
+        Everything after detection: tracking, association, history,
+        annotation and DB logging. Callers that already have detections
+        (pushed by a client or replayed) enter here, with frame=None and
+        the (width, height) the boxes refer to if they have no frame.
+        `now` lets replays run on the recorded clock.
+        """
+        now = now if now is not None else clock()
+
+        if self.record_dir and self.active_session_id:
+            self._record(frame, detections_raw, now, frame_size)
+
+        matches = self.track(frame, detections_raw)
+        return self.process_matches(frame, matches, annotate, now, frame_size)
+
+    def track(self, frame, detections_raw):
+        """
+        Tracking, attention estimation and association for one frame.
+        Keeps no session state beyond the tracker, so it can run in an
+        inference worker (see inference_pool.py).
+        Returns [(track_id, ltrb, detection)].
+        """
         # 2. Prepare for DeepSORT
-        # format: [[x,y,w,h], confidence, detection_class]
-        ds_detections = []
-        for det in detections_raw:
-            bbox = det['bbox']
-            conf = det['emotion'].confidence
-            # We map detection index to associate later
-            ds_detections.append((bbox, conf, "face", det)) 
-            # Note: DeepSort expects (bbox, conf, class_name) usually. 
-            # deep_sort_realtime allows passing 'others' data?
-            # Actually deep-sort-realtime update_tracks accepts:
-            # raw_detections list of (ltwh, confidence, class)
-            
-        # 3. Tracking
-        # We need to map back inputs. 
-        # DeepSORT might not return tracks in same order. 
-        # But we can try to match by IoU or assume tracker handles it.
-        # deep-sort-realtime requires simple format.
-        
+        # deep-sort-realtime update_tracks accepts:
+        # raw_detections list of (ltwh, confidence, class)
         formatted_dets = []
         for det in detections_raw:
              # (left, top, w, h), confidence, detection_class
              formatted_dets.append((det['bbox'], det['emotion'].confidence, 'person'))
              
-        tracks = self.tracker.update_tracks(formatted_dets, frame=frame)
+        # 3. Tracking
+        with stage("tracking"):
+            if self.tracker.embedder is None:
+                tracks = self.tracker.update_tracks(formatted_dets, embeds=geometry_embeddings(detections_raw))
+            else:
+                tracks = self.tracker.update_tracks(formatted_dets, frame=frame)
         
-        # 4. Process Tracks
-        db_metrics = [] # To save to DB
+        # Head pose, gaze and eye openness for all faces in one pass
+        with stage("attention"):
+            attention.estimate(detections_raw)
+
+        # 4. Associate confirmed tracks with detections (for emotion info)
+        with stage("association"):
+            return [(track.track_id, ltrb, det) for track, ltrb, det in self._associate(tracks, detections_raw)]
+
+    def process_matches(self, frame, matches, annotate=True, now=None, frame_size=None):
+        """
+        Session side of a frame: smoothing, history, annotation and DB
+        logging for [(track_id, ltrb, detection)] from track(). Callers that
+        no longer hold the frame pass None and its (width, height) instead.
+        """
+        now = now if now is not None else clock()
+        current_people = []
+        # Room audio at this frame, joined as-of on the shared clock
+        audio = self.fusion.audio_at(now) or {}
         
-        for track in tracks:
-            if not track.is_confirmed() or track.time_since_update > 1:
-                continue
-                
-            track_id = track.track_id
-            ltrb = track.to_ltrb() # left, top, right, bottom
+        # 5. Process Tracks
+        events = []
+        self.presence.begin_frame(track_id for track_id, _, _ in matches)
+        
+        for track_id, ltrb, det in matches:
+            matched_emotion = det['emotion']
             
-            # Find closest original detection to attach emotion info
-            # Simple IoU matching (or simple distance)
-            matched_emotion = None
+            # Attention from head pose, gaze and eye openness
+            if 'attention_raw' in det:
+                raw_att = det['attention_raw']
+            else:
+                # No landmarks (e.g. pushed boxes): fall back to the emotion-confidence proxy
+                raw_att = matched_emotion.confidence * 100
+                if matched_emotion.emotion in ['bored', 'distracted']:
+                    raw_att = 30
+
+            # Smoothing and emotion hysteresis; only stable changes produce events
+            state, track_events = self.track_states.update(
+                track_id, matched_emotion.emotion, matched_emotion.confidence, raw_att, now,
+                probs=det.get('emotion_probs'), labels=det.get('emotion_labels')
+            )
+            events.extend(track_events)
+            emotion = state.emotion
+            confidence = round(state.confidence, 3)
+            att_score = round(state.attention, 1)
             
-            # Get track center
-            tx = (ltrb[0] + ltrb[2]) / 2
-            ty = (ltrb[1] + ltrb[3]) / 2
+            # Update Person History
+            if track_id not in self.person_history:
+                self.person_history[track_id] = {
+                    'emotions': [],
+                    'attention': [],
+                    'first_seen': now,
+                    'last_seen': now
+                }
             
-            best_dist = 9999
-            for det in detections_raw:
-                dx, dy, dw, dh = det['bbox']
-                cx = dx + dw/2
-                cy = dy + dh/2
-                dist = np.sqrt((tx-cx)**2 + (ty-cy)**2)
-                if dist < 50: # Threshold pixels
-                    if dist < best_dist:
-                        best_dist = dist
-                        matched_emotion = det['emotion']
+            ph = self.person_history[track_id]
+            self.presence.observe(track_id, ltrb, now, det)
+            ph['last_seen'] = now
+            ph['emotions'].append({'label': emotion, 'ts': now})
+            ph['attention'].append(att_score)
             
-            if matched_emotion:
-                # Update Person History
-                if track_id not in self.person_history:
-                    self.person_history[track_id] = {
-                        'emotions': [],
-                        'attention': [],
-                        'first_seen': time.time(),
-                        'last_seen': time.time()
-                    }
-                
-                ph = self.person_history[track_id]
-                ph['last_seen'] = time.time()
-                ph['emotions'].append({'label': matched_emotion.emotion, 'ts': time.time()})
-                
-                # Attention Proxy (Confidence of emotion usually correlates with face visibility/forwardness)
-                # But we can also use gaze if we had it. using (1 - bored_score) etc.
-                att_score = matched_emotion.confidence * 100
-                if matched_emotion.emotion in ['bored', 'distracted']:
-                    att_score = 30
-                
-                ph['attention'].append(att_score)
-                
-                # Annotate Frame
-                label = f"ID: {track_id} | {matched_emotion.emotion}"
-                color = (0, 255, 0)
-                if matched_emotion.emotion in ['bored', 'sad']:
-                    color = (0, 0, 255)
-                
-                cv2.rectangle(frame, (int(ltrb[0]), int(ltrb[1])), (int(ltrb[2]), int(ltrb[3])), color, 2)
-                cv2.putText(frame, label, (int(ltrb[0]), int(ltrb[1])-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                
-                person_data = {
-                    'id': track_id,
-                    'bbox': [int(x) for x in ltrb],
-                    'emotion': matched_emotion.emotion,
-                    'confidence': matched_emotion.confidence,
-                    'attention': att_score
-                }
-                current_people.append(person_data)
-                
-                # Collect DB Metric
-                if self.active_session_id:
-                     db_metrics.append(PersonMetric(
-                         session_id=self.active_session_id,
-                         person_id=str(track_id),
-                         emotion=matched_emotion.emotion,
-                         emotion_confidence=matched_emotion.confidence,
-                         attention_score=att_score
-                     ))
-
-        # 5. DB Logging (Throttled 2s)
-        if self.active_session_id and (time.time() - self.last_db_update > 2.0):
-            if db_metrics:
-                db = SessionLocal()
-                try:
-                    for m in db_metrics:
-                        db.add(m)
-                    
-                    # Update session count
-                    sess = db.query(SessionModel).get(self.active_session_id)
-                    if sess:
-                        sess.people_count = len(current_people)
-                    
-                    db.commit()
-                    self.last_db_update = time.time()
-                finally:
-                    db.close()
+            person_data = {
+                'id': track_id,
+                'bbox': [int(x) for x in ltrb],
+                'emotion': emotion,
+                'confidence': confidence,
+                'attention': att_score,
+                'engagement': engagement_score(att_score, audio.get('noise_db'), audio.get('speech_ratio'))
+            }
+            head_pose = None
+            if 'head_pose' in det:
+                head_pose = dict(zip(('yaw', 'pitch', 'roll'), det['head_pose']))
+                person_data['head_pose'] = head_pose
+                person_data['gaze_focus'] = det['gaze_focus']
+            current_people.append(person_data)
+            
+            # Collect DB Metric: on a stable change, or as a periodic heartbeat
+            if self.active_session_id and (track_events or state.last_logged is None
+                                           or now - state.last_logged >= METRIC_HEARTBEAT_SECONDS):
+                state.last_logged = now
+                self.pending_metrics.append(PersonMetric(
+                    session_id=self.active_session_id,
+                    person_id=str(track_id),
+                    timestamp=datetime.utcfromtimestamp(now),
+                    emotion=emotion,
+                    emotion_confidence=confidence,
+                    attention_score=att_score,
+                    gaze_focus=det.get('gaze_focus'),
+                    head_pose=json.dumps(head_pose) if head_pose else None,
+                    audio_noise=audio.get('noise_db'),
+                    speech_ratio=audio.get('speech_ratio')
+                ))
+
+        events.extend(self.track_states.expire(now))
+        self.fusion.add_visual(now, current_people)
+        if self.active_session_id:
+            width, height = frame_size or (frame.shape[1], frame.shape[0])
+            self.heatmap.add(current_people, width, height)
+
+        # 6. Annotate Frame
+        if annotate:
+            with stage("annotation"):
+                self._annotate(frame, current_people)
+
+        # 7. DB Logging (batched, at most every DB_FLUSH_INTERVAL)
+        if self.active_session_id and self.pending_metrics and (now - self.last_db_update > DB_FLUSH_INTERVAL):
+            with stage("db_flush"):
+                self._flush_metrics(len(current_people), now)
                     
         return frame, {
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': datetime.utcfromtimestamp(now).isoformat(),
             'total_people': len(current_people),
             'people': current_people,
+            'events': events,
+            'audio': audio or None,
+            'engagement': (round(sum(p['engagement'] for p in current_people) / len(current_people), 1)
+                           if current_people else None),
             'session_active': self.active_session_id is not None
         }
 
+    def _associate(self, tracks, detections_raw, max_dist=ASSOCIATION_MAX_DIST):
+        """
+        Match each confirmed track to the nearest detection center within
+        max_dist pixels. Distances for all track/detection pairs are computed
+        in one vectorized step.
+        Returns [(track, ltrb, detection)].
+        """
+        live = [t for t in tracks if t.is_confirmed() and t.time_since_update <= 1]
+        if not live or not detections_raw:
+            return []
+
+        boxes = np.array([t.to_ltrb() for t in live], dtype=np.float32) # left, top, right, bottom
+        track_centers = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+        dets = np.array([d['bbox'] for d in detections_raw], dtype=np.float32) # x, y, w, h
+        det_centers = dets[:, :2] + dets[:, 2:] / 2
+
+        dist = np.linalg.norm(track_centers[:, None, :] - det_centers[None, :, :], axis=2)
+        nearest = dist.argmin(axis=1)
+        nearest_dist = dist[np.arange(len(live)), nearest]
+
+        return [
+            (track, boxes[i], detections_raw[nearest[i]])
+            for i, track in enumerate(live)
+            if nearest_dist[i] < max_dist
+        ]
+
+    def _annotate(self, frame, people):
+        for p in people:
+            l, t, r, b = p['bbox']
+            label = f"ID: {p['id']} | {p['emotion']}"
+            color = (0, 255, 0)
+            if p['emotion'] in ['bored', 'sad']:
+                color = (0, 0, 255)
+            cv2.rectangle(frame, (l, t), (r, b), color, 2)
+            cv2.putText(frame, label, (l, t-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+    def _record(self, frame, detections_raw, now, frame_size=None):
+        if self.recorder is None:
+            w, h = frame_size or ((frame.shape[1], frame.shape[0]) if frame is not None else (0, 0))
+            path = os.path.join(self.record_dir, f"session_{self.active_session_id}.rec")
+            try:
+                self.recorder = SessionRecorder(path, w, h, landmarks=self.record_landmarks)
+            except Exception as e:
+                print(f"Recording disabled: {e}")
+                self.record_dir = None
+                return
+        self.recorder.write(now, detections_raw)
+
+    def person_summaries(self, end=None):
+        """
+        Per-student aggregates of the in-memory history (what stop_session
+        persists). Tracks the presence engine merged count as one student;
+        time_present is the visible time, not first-to-last sighting.
+        """
+        presence = self.presence.summaries(end)
+        grouped = {}
+        for pid, data in self.person_history.items():
+            grouped.setdefault(self.presence.identity_of(pid), []).append(data)
+
+        people = []
+        for identity, histories in grouped.items():
+            attention_values = [a for data in histories for a in data['attention']]
+            avg_att = np.mean(attention_values) if attention_values else 0
+            
+            # Determine dominant emotion
+            emotions = [e['label'] for data in histories for e in data['emotions']]
+            if emotions:
+                dom = max(set(emotions), key=emotions.count)
+            else:
+                dom = "neutral"
+
+            p = presence.get(identity) or {
+                'time_present': 0.0, 'first_seen': 0.0, 'last_seen': 0.0,
+                'status': 'absent', 'tracks': [identity], 'intervals': []
+            }
+            people.append({
+                'person_id': str(identity),
+                'avg_attention': float(avg_att),
+                'time_present': p['time_present'],
+                'dominant_emotion': dom,
+                'status': p['status'],
+                'first_seen': p['first_seen'],
+                'tracks': [str(t) for t in p['tracks']],
+                'intervals': p['intervals']
+            })
+        return people
+
+    @staticmethod
+    def _attendance_counts(people):
+        counts = {'present': 0, 'late': 0, 'partial': 0, 'absent': 0}
+        for p in people:
+            counts[p['status']] += 1
+        return counts
+
+    def _flush_metrics(self, people_count, now):
+        db_metrics, self.pending_metrics = self.pending_metrics, []
+        db = SessionLocal()
+        try:
+            db.add_all(db_metrics)
+            
+            # Update session count
+            sess = db.query(SessionModel).get(self.active_session_id)
+            if sess:
+                sess.people_count = people_count
+            
+            db.commit()
+            DB_FLUSH_ROWS.observe(len(db_metrics))
+            self.last_db_update = now
+        finally:
+            db.close()
+
+    def add_audio(self, now, windows):
+        """
+        This room's analyzed microphone windows as [(clock time, metrics)].
+        They join the video on the fusion clock; every AUDIO_LOG_SECONDS
+        returns (session_id, summary) of the windows since the last row,
+        for log_audio, otherwise None.
+        """
+        for t, metrics in windows:
+            self.fusion.add_audio(t, metrics['noise_db'], metrics['speech_ratio'], metrics['activity_type'])
+        if not windows or not self.active_session_id or now - self.audio_logged <= AUDIO_LOG_SECONDS:
+            return None
+        summary = self.fusion.audio_summary(self.audio_logged, now)
+        self.audio_logged = now
+        return (self.active_session_id, summary) if summary else None
+
+    @staticmethod
+    def log_audio(session_id, now, summary):
+        """Stores one audio_metrics row (blocking; run it off the event loop)."""
+        db = SessionLocal()
+        try:
+            db.add(AudioMetric(session_id=session_id, timestamp=datetime.utcfromtimestamp(now), **summary))
+            db.commit()
+        finally:
+            db.close()
+
     def get_status(self):
         return {
             "active": self.active_session_id is not None,
             "session_id": self.active_session_id,
             "people_count": len(self.person_history), # Total unique people seen
-            "duration": time.time() - self.start_time if self.start_time else 0
+            "duration": clock() - self.start_time if self.start_time else 0
         }
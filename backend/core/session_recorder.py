@@ -0,0 +1,299 @@
+"""
+Append-only binary log of per-frame detector output, and a replay driver
+that pushes it back through tracking, attention scoring, gamification and
+recommendations without running the face model.
+
+File layout (little-endian):
+    header   FILE_HEADER: magic, version, width, height, landmark count,
+             blendshape count (v2), then uint16[landmark count] mesh
+             indices that were kept
+    frames   FRAME_DTYPE (timestamp, face count) followed by that many
+             face records of face_dtype(landmark count, blendshape count)
+
+Records are fixed-size, so a reader can np.memmap the file and slice faces
+without copying. A record cut short by a crash is ignored.
+"""
+import os
+import struct
+import time
+from collections import Counter
+
+import numpy as np
+
+from .emotion_detector_v2 import EmotionResult
+from .blendshape_emotion import BLENDSHAPE_NAMES
+
+MAGIC = b"ATTNREC\x00"
+VERSION = 2
+FILE_HEADER = struct.Struct("<8sHHHHH")
+FILE_HEADER_V1 = struct.Struct("<8sHHHH")  # no blendshapes
+FRAME_DTYPE = np.dtype([('ts', '<f8'), ('n', '<u4')])
+
+# Stored as a single byte; labels outside the table replay as 'unknown'
+EMOTION_LABELS = ['neutral', 'happy', 'engaged', 'bored', 'surprised', 'confused', 'sad',
+                  'distracted', 'angry', 'fear', 'disgust', 'surprise']
+EMOTION_INDEX = {label: i for i, label in enumerate(EMOTION_LABELS)}
+UNKNOWN_EMOTION = 255
+
+# FaceLandmarker mesh points worth keeping: face oval, eye contours, lips,
+# nose bridge and irises. Covers the emotion heuristics and head pose at
+# ~5% of the full mesh's size.
+KEY_LANDMARKS = (
+    10, 338, 297, 332, 284, 251, 389, 356, 454, 323, 361, 288, 397, 365, 379, 378, 400, 377,
+    152, 148, 176, 149, 150, 136, 172, 58, 132, 93, 234, 127, 162, 21, 54, 103, 67, 109,
+    33, 7, 163, 144, 145, 153, 154, 155, 133, 173, 157, 158, 159, 160, 161, 246,
+    362, 382, 381, 380, 374, 373, 390, 249, 263, 466, 388, 387, 386, 385, 384, 398,
+    0, 13, 14, 17, 61, 78, 291, 308,
+    1, 4, 5, 6, 168, 195, 197,
+    468, 469, 470, 471, 472, 473, 474, 475, 476, 477,
+)
+MESH_SIZE = 478
+LANDMARK_SETS = {'all': tuple(range(MESH_SIZE)), 'key': KEY_LANDMARKS, 'none': ()}
+
+def face_dtype(n_landmarks, n_blendshapes=0):
+    # Landmarks are relative to the face's bbox (0-1), so float16 keeps sub-pixel precision
+    fields = [('bbox', '<i4', (4,)), ('emotion', 'u1'), ('confidence', '<f4')]
+    if n_landmarks:
+        fields.append(('landmarks', '<f2', (n_landmarks, 2)))
+    if n_blendshapes:
+        fields.append(('blendshapes', '<f2', (n_blendshapes,)))
+    return np.dtype(fields)
+
+def geometry_embeddings(detections_raw):
+    """
+    Appearance-free re-id features for DeepSort when no frame is available:
+    the key landmarks normalized to the face box, centered and L2-normalized.
+    Detections without landmarks get a constant vector, which leaves
+    matching to the motion model.
+    """
+    dim = len(KEY_LANDMARKS) * 2
+    embeds = []
+    for det in detections_raw:
+        points = det.get('landmarks')
+        vec = None
+        if points is not None and len(points) == MESH_SIZE:
+            x, y, w, h = det['bbox']
+            rel = (np.asarray(points, dtype=np.float32)[list(KEY_LANDMARKS)] - (x, y)) / (max(w, 1), max(h, 1))
+            vec = np.nan_to_num(rel.ravel() - rel.mean())
+        if vec is None or not vec.any():
+            vec = np.ones(dim, dtype=np.float32)
+        embeds.append(vec / np.linalg.norm(vec))
+    return embeds
+
+class SessionRecorder:
+    """
+    Appends detector output frame by frame. Writes go through the file
+    buffer and are flushed every `flush_interval` seconds and on close.
+    """
+    def __init__(self, path, width, height, landmarks="key", blendshapes=True, flush_interval=1.0):
+        self.path = path
+        self.indices = np.array(LANDMARK_SETS[landmarks], dtype=np.uint16)
+        self.n_blendshapes = len(BLENDSHAPE_NAMES) if blendshapes else 0
+        self.dtype = face_dtype(len(self.indices), self.n_blendshapes)
+        self.flush_interval = flush_interval
+        self._last_flush = None  # ts of the last flush, on the caller's clock
+        self.frames = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION, width, height, len(self.indices), self.n_blendshapes))
+            self._file.write(self.indices.astype('<u2').tobytes())
+        else:
+            # Appending to an earlier recording: it must use the same layout
+            log = SessionLog(path)
+            if log.dtype != self.dtype or not np.array_equal(log.indices, self.indices):
+                self._file.close()
+                raise ValueError(f"{path} was recorded with a different layout")
+            # Drop a partial record left by a crash before appending
+            self._file.truncate(log.end)
+
+    def write(self, ts, detections_raw):
+        faces = np.zeros(len(detections_raw), dtype=self.dtype)
+        if detections_raw:
+            boxes = np.array([d['bbox'] for d in detections_raw], dtype=np.int32).reshape(-1, 4)
+            faces['bbox'] = boxes
+            faces['emotion'] = [EMOTION_INDEX.get(d['emotion'].emotion, UNKNOWN_EMOTION) for d in detections_raw]
+            faces['confidence'] = [d['emotion'].confidence for d in detections_raw]
+            if len(self.indices):
+                origin = boxes[:, None, :2]
+                scale = np.maximum(boxes[:, None, 2:], 1)
+                for i, det in enumerate(detections_raw):
+                    points = det.get('landmarks')
+                    if points is None:
+                        faces['landmarks'][i] = np.nan
+                    else:
+                        faces['landmarks'][i] = (np.asarray(points, dtype=np.float32)[self.indices] - origin[i]) / scale[i]
+            if self.n_blendshapes:
+                for i, det in enumerate(detections_raw):
+                    scores = det.get('blendshapes')
+                    faces['blendshapes'][i] = np.nan if scores is None else scores
+
+        header = np.array([(ts, len(faces))], dtype=FRAME_DTYPE)
+        self._file.write(header.tobytes())
+        self._file.write(faces.tobytes())
+        self.frames += 1
+        if self._last_flush is None:
+            # Callers pass wall-clock or video time; measure the interval on theirs
+            self._last_flush = ts
+        elif ts - self._last_flush > self.flush_interval:
+            self._file.flush()
+            self._last_flush = ts
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+class SessionLog:
+    """
+    Memory-mapped reader. Indexing the file is one pass over the frame
+    headers; face records are read as views into the map.
+    """
+    def __init__(self, path):
+        self.path = path
+        if os.path.getsize(path) < FILE_HEADER_V1.size:
+            raise ValueError(f"{path} is not a session recording")
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version = struct.unpack_from("<8sH", self._map, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f"{path} is not a session recording (v1-v{VERSION})")
+        if version == 1:
+            _, _, self.width, self.height, n = FILE_HEADER_V1.unpack_from(self._map, 0)
+            self.n_blendshapes = 0
+            pos = FILE_HEADER_V1.size
+        else:
+            _, _, self.width, self.height, n, self.n_blendshapes = FILE_HEADER.unpack_from(self._map, 0)
+            pos = FILE_HEADER.size
+        self.indices = np.frombuffer(self._map, dtype='<u2', count=n, offset=pos).copy()
+        self.dtype = face_dtype(n, self.n_blendshapes)
+        pos += 2 * n
+
+        offsets, stamps, counts = [], [], []
+        size = len(self._map)
+        while pos + FRAME_DTYPE.itemsize <= size:
+            ts, count = np.frombuffer(self._map, dtype=FRAME_DTYPE, count=1, offset=pos)[0]
+            end = pos + FRAME_DTYPE.itemsize + int(count) * self.dtype.itemsize
+            if end > size:
+                break  # truncated tail
+            offsets.append(pos + FRAME_DTYPE.itemsize)
+            stamps.append(ts)
+            counts.append(int(count))
+            pos = end
+        self.end = pos
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.timestamps = np.array(stamps, dtype=np.float64)
+        self.counts = np.array(counts, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def duration(self):
+        return float(self.timestamps[-1] - self.timestamps[0]) if len(self) > 1 else 0.0
+
+    def faces(self, i):
+        """Structured array view of frame i's face records."""
+        return np.frombuffer(self._map, dtype=self.dtype, count=int(self.counts[i]), offset=int(self.offsets[i]))
+
+    def detections(self, i):
+        """Frame i in MediaPipeEmotionDetector.detect() format (landmarks in pixels, NaN where not kept)."""
+        out = []
+        for face in self.faces(i):
+            x, y, w, h = (int(v) for v in face['bbox'])
+            points = None
+            if len(self.indices):
+                points = np.full((MESH_SIZE, 2), np.nan, dtype=np.float32)
+                points[self.indices] = face['landmarks'].astype(np.float32) * (max(w, 1), max(h, 1)) + (x, y)
+            label = EMOTION_LABELS[face['emotion']] if face['emotion'] < len(EMOTION_LABELS) else 'unknown'
+            det = {
+                'bbox': [x, y, w, h],
+                'emotion': EmotionResult(emotion=label, confidence=round(float(face['confidence']), 4), explanation='replay'),
+                'landmarks': points
+            }
+            if self.n_blendshapes and not np.isnan(face['blendshapes'][0]):
+                det['blendshapes'] = face['blendshapes'].astype(np.float32)
+            out.append(det)
+        return out
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield float(self.timestamps[i]), self.detections(i)
+
+class _NullDetector:
+    def detect(self, frame):
+        return []
+
+def replay(path, speed=None, reclassify=None, weights=None, on_frame=None):
+    """
+    Feed a recording through the downstream pipeline on its own recorded
+    clock. speed=None runs as fast as possible, otherwise paces playback at
+    speed x real time. on_frame(ts, metrics) sees every processed frame.
+    Nothing is written to the database.
+
+    reclassify re-labels faces instead of using the recorded labels: with
+    the blendshape classifier (`weights`, default emotion_weights.json)
+    when blendshapes were recorded, else with the landmark heuristics. It
+    defaults to on for recordings with blendshapes, which also restores the
+    per-track probability smoothing of a live run.
+
+    Tracking uses landmark-geometry embeddings instead of the CNN embedder,
+    so track ids can differ from the live run, but are identical between
+    replays of the same file.
+    """
+    from deep_sort_realtime.deepsort_tracker import DeepSort
+    from .session_manager import SessionManager
+    from .gamification_engine import GamificationEngine
+    from .recommendations_engine import RecommendationsEngine
+    from .emotion_detector_v2 import MediaPipeEmotionDetector
+    from .blendshape_emotion import BlendshapeEmotionClassifier, DEFAULT_WEIGHTS
+
+    log = SessionLog(path)
+    manager = SessionManager(
+        emotion_detector=_NullDetector(),
+        tracker=DeepSort(max_age=60, n_init=3, embedder=None)
+    )
+    gamification = GamificationEngine()
+    recommendations = RecommendationsEngine()
+    if reclassify is None:
+        reclassify = log.n_blendshapes > 0
+    classifier = None
+    if reclassify:
+        # Model-less detector instance: only its classification step is used
+        classifier = MediaPipeEmotionDetector.__new__(MediaPipeEmotionDetector)
+        classifier.classifier = BlendshapeEmotionClassifier(weights or DEFAULT_WEIGHTS) if log.n_blendshapes else None
+    rec_counts = Counter()
+    faces = 0
+
+    t_wall = time.perf_counter()
+    t_first = float(log.timestamps[0]) if len(log) else 0.0
+    for ts, detections in log:
+        if classifier is not None:
+            relabel = [d for d in detections if 'blendshapes' in d or d['landmarks'] is not None]
+            for det in relabel:
+                del det['emotion']
+            classifier._classify(relabel)
+        if speed:
+            delay = (ts - t_first) / speed - (time.perf_counter() - t_wall)
+            if delay > 0:
+                time.sleep(delay)
+
+        _, metrics = manager.process_detections(None, detections, annotate=False, now=ts)
+        metrics['leaderboard'] = gamification.process_frame_points(metrics, now=ts)
+        recommendations.process_frame(metrics, now=ts)
+        rec_counts.update(a['rule'] for a in metrics['alerts']['raised'])
+        faces += len(detections)
+        if on_frame:
+            on_frame(ts, metrics)
+
+    wall = time.perf_counter() - t_wall
+    return {
+        'path': path,
+        'frames': len(log),
+        'faces': faces,
+        'footage_seconds': round(log.duration, 2),
+        'wall_seconds': round(wall, 3),
+        'speedup': round(log.duration / wall, 1) if wall > 0 else None,
+        'people': manager.person_summaries(),
+        'leaderboard': gamification.get_leaderboard(),
+        'recommendations': dict(rec_counts.most_common()),
+    }
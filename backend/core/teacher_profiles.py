@@ -1,39 +1,270 @@
 from sqlalchemy.orm import Session
-from .database import SessionLocal, Session as SessionModel
-import random
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+import math
+import threading
+from .database import SessionLocal, Session as SessionModel, SessionPerson, TeacherProfile, TeacherStudentStat
+
+HISTORY_LENGTH = 5
+STUDENT_TRENDS_LENGTH = 3
+# Smoothing for the session-over-session improvement trend
+TREND_ALPHA = 0.3
+# A student "retained" a session if present for at least this share of it
+RETENTION_PRESENCE = 0.5
 
 class TeacherProfileService:
+    """
+    Teacher aggregates are folded in once per completed session
+    (update_effectiveness), so building a profile never touches
+    person_metrics and costs the same for 5 sessions or 5000.
+    Cached profiles are checked against the stored session count, since
+    with several API workers the update may happen in another process.
+    Reads never write: history from before the aggregate table is folded
+    in by backfill() at startup, or by the teacher's next update.
+    """
+    def __init__(self):
+        self._cache = {} # teacher_id -> profile dict
+        self._lock = threading.Lock()
+
     def get_profile(self, teacher_id: str):
-        # Mock calculation - in production, aggregate real session data
-        # Real logic: fetch average attention from all sessions by this teacher
-        
+        db = SessionLocal()
+        try:
+            cached = self._cache.get(teacher_id)
+            if cached is not None:
+                stored = db.query(TeacherProfile.total_sessions)\
+                    .filter(TeacherProfile.teacher_id == teacher_id).scalar()
+                if (stored or 0) == cached["total_sessions"]:
+                    return cached
+
+            row = db.query(TeacherProfile).get(teacher_id)
+            if row is None:
+                row = self._empty_row(teacher_id)  # never added to the session
+            profile = self._build_profile(db, teacher_id, row)
+        finally:
+            db.close()
+
+        with self._lock:
+            self._cache[teacher_id] = profile
+        return profile
+
+    def update_effectiveness(self, teacher_id: str, session_data: dict):
+        """
+        Fold one completed session into the teacher's running aggregates.
+        Algorithm: 40% AvgEngagement + 20% Improvement + 20% Diversity + 20% Retention
+        session_data: { 'avg_attention': float, 'duration': s,
+                        'people': [ { 'person_id', 'avg_attention', 'time_present', 'dominant_emotion' } ] }
+        """
+        if not teacher_id or not session_data.get('people'):
+            return
+        for attempt in range(2):
+            db = SessionLocal()
+            try:
+                row = db.query(TeacherProfile).get(teacher_id)
+                if row is None:
+                    row = self._rebuild_from_history(db, teacher_id, exclude_session_id=session_data.get('session_id'))
+                db.add(row)
+                self._apply_session(db, row, session_data)
+                db.commit()
+                break
+            except IntegrityError as e:
+                # Another worker inserted the teacher's rows first: re-read them and apply on top
+                db.rollback()
+                if attempt:
+                    print(f"Teacher profile update error: {e}")
+            except Exception as e:
+                print(f"Teacher profile update error: {e}")
+                db.rollback()
+                break
+            finally:
+                db.close()
+
+        with self._lock:
+            self._cache.pop(teacher_id, None)
+
+    def _apply_session(self, db, row, session_data):
+        people = session_data['people']
+        avg_att = session_data.get('avg_attention')
+        if avg_att is None:
+            avg_att = sum(p['avg_attention'] for p in people) / len(people)
+
+        n = row.total_sessions or 0
+        prev_avg = row.avg_engagement if n else avg_att
+        change = avg_att - prev_avg
+
+        # Session sub-scores, all 0-100
+        improvement = min(100.0, max(0.0, 50.0 + change))
+        diversity = self._emotion_diversity([p.get('dominant_emotion') for p in people]) * 100
+        duration = session_data.get('duration') or 0
+        if duration > 0:
+            retained = sum(1 for p in people if p.get('time_present', 0) >= RETENTION_PRESENCE * duration)
+            retention = retained / len(people) * 100
+        else:
+            retention = 0.0
+        session_score = 0.4 * avg_att + 0.2 * improvement + 0.2 * diversity + 0.2 * retention
+
+        # Running means over sessions
+        row.avg_engagement = (prev_avg * n + avg_att) / (n + 1) if n else avg_att
+        row.effectiveness_score = ((row.effectiveness_score or 0.0) * n + session_score) / (n + 1)
+        row.improvement_trend = change if n == 0 else (1 - TREND_ALPHA) * (row.improvement_trend or 0.0) + TREND_ALPHA * change
+        row.total_sessions = n + 1
+
+        # Per-student running stats for this teacher
+        existing = {
+            s.person_id: s for s in db.query(TeacherStudentStat)
+                .filter(TeacherStudentStat.teacher_id == row.teacher_id,
+                        TeacherStudentStat.person_id.in_([str(p['person_id']) for p in people]))
+        }
+        for p in people:
+            pid = str(p['person_id'])
+            att = float(p['avg_attention'])
+            stat = existing.get(pid)
+            if stat is None:
+                db.add(TeacherStudentStat(teacher_id=row.teacher_id, person_id=pid,
+                                          sessions=1, avg_attention=att, last_attention=att, last_change=0.0))
+                continue
+            stat.last_change = att - stat.avg_attention
+            stat.avg_attention = (stat.avg_attention * stat.sessions + att) / (stat.sessions + 1)
+            stat.last_attention = att
+            stat.sessions += 1
+
+    def backfill(self):
+        """
+        One-time migration, run at startup: aggregate rows for teachers whose
+        completed sessions predate the teacher_profiles table.
+        """
+        db = SessionLocal()
+        try:
+            done = db.query(TeacherProfile.teacher_id)
+            missing = [t for (t,) in db.query(SessionModel.teacher_id).distinct()
+                       .filter(SessionModel.status == "completed", SessionModel.teacher_id.isnot(None),
+                               ~SessionModel.teacher_id.in_(done))]
+        finally:
+            db.close()
+
+        for teacher_id in missing:
+            db = SessionLocal()
+            try:
+                db.add(self._rebuild_from_history(db, teacher_id))
+                db.commit()
+            except IntegrityError:
+                db.rollback()  # another worker backfilled this teacher first
+            except Exception as e:
+                print(f"Teacher profile backfill error ({teacher_id}): {e}")
+                db.rollback()
+            finally:
+                db.close()
+        if missing:
+            print(f"Backfilled teacher profiles for {len(missing)} teacher(s)")
+
+    @staticmethod
+    def _empty_row(teacher_id):
+        return TeacherProfile(teacher_id=teacher_id, effectiveness_score=0.0, total_sessions=0,
+                              avg_engagement=0.0, improvement_trend=0.0)
+
+    def _rebuild_from_history(self, db, teacher_id, exclude_session_id=None):
+        """
+        Aggregates for a teacher whose sessions predate the aggregate table,
+        from per-student session summaries, not raw metrics. The caller
+        commits (only on write paths: backfill and update_effectiveness).
+        """
+        row = self._empty_row(teacher_id)
+
+        q = db.query(SessionModel)\
+            .filter(SessionModel.teacher_id == teacher_id, SessionModel.status == "completed")
+        if exclude_session_id:
+            q = q.filter(SessionModel.id != exclude_session_id)
+        for s in q.order_by(SessionModel.start_time.asc()):
+            people = db.query(SessionPerson).filter(SessionPerson.session_id == s.id).all()
+            if not people:
+                continue
+            summaries = [{
+                'person_id': p.person_id,
+                'avg_attention': p.avg_attention or 0.0,
+                'time_present': p.total_time_present or 0.0,
+                'dominant_emotion': p.dominant_emotion
+            } for p in people]
+            if not s.total_attention_avg:
+                # Older sessions never stored their class average
+                s.total_attention_avg = sum(p['avg_attention'] for p in summaries) / len(summaries)
+            db.add(row)
+            self._apply_session(db, row, {
+                'duration': (s.end_time - s.start_time).total_seconds() if s.end_time else 0,
+                'people': summaries
+            })
+            db.flush()
+        return row
+
+    def _build_profile(self, db, teacher_id, row):
+        # Indexed, LIMITed reads only
+        recent = db.query(SessionModel)\
+            .filter(SessionModel.teacher_id == teacher_id, SessionModel.status == "completed")\
+            .order_by(SessionModel.start_time.desc())\
+            .limit(HISTORY_LENGTH)\
+            .all()
+        movers = db.query(TeacherStudentStat)\
+            .filter(TeacherStudentStat.teacher_id == teacher_id, TeacherStudentStat.sessions > 1)\
+            .order_by(func.abs(TeacherStudentStat.last_change).desc())\
+            .limit(STUDENT_TRENDS_LENGTH)\
+            .all()
+
+        score = round(row.effectiveness_score or 0.0, 1)
+        engagement = row.avg_engagement or 0.0
+        trend = round(row.improvement_trend or 0.0, 1)
+
         return {
             "teacher_id": teacher_id,
-            "effectiveness_score": 87.5,
-            "trend": 12.0, # +12%
-            "class_history": [
-                {"name": "CS101 (Today)", "engagement": 85},
-                {"name": "CS101 (Yesterday)", "engagement": 78},
-                {"name": "Math Workshop", "engagement": 92}
-            ],
-            "student_trends": [
-                {"name": "Priya", "change": 15, "status": "improved"},
-                {"name": "Kumar", "change": 8, "status": "improved"},
-                {"name": "Asha", "change": -5, "status": "declining"}
-            ],
-            "strengths": [
-                "High engagement sessions (85%+)",
-                "Emotion diversity management"
-            ],
-            "weaknesses": [
-                "Declining attention detection (12min avg)"
-            ],
-            "recommended_actions": [
-                "Try interactive polls (boost +18%)",
-                "Short video breaks (+25% re-engagement)"
-            ]
+            "effectiveness_score": score,
+            "trend": trend,
+            "total_sessions": row.total_sessions or 0,
+            "avg_engagement": round(engagement, 1),
+            "class_history": [{
+                "name": f"{s.class_id} ({s.start_time.strftime('%b %d')})",
+                "engagement": round(s.total_attention_avg or 0.0)
+            } for s in recent],
+            "student_trends": [{
+                "name": f"Student {m.person_id}",
+                "change": round(m.last_change),
+                "status": "improved" if m.last_change >= 0 else "declining"
+            } for m in movers],
+            "strengths": self._strengths(engagement, trend, row),
+            "weaknesses": self._weaknesses(engagement, trend, row),
+            "recommended_actions": self._actions(engagement, trend)
         }
-    
-    def update_effectiveness(self, teacher_id: str, session_data: dict):
-        # Algorithm: 40% AvgEngagement + 20% Improvement + 20% Diversity + 20% Retention
-        pass
+
+    @staticmethod
+    def _emotion_diversity(emotions):
+        # Normalized Shannon entropy of dominant emotions (0 = one shared emotion, 1 = even mix)
+        counts = {}
+        for e in emotions:
+            if e:
+                counts[e] = counts.get(e, 0) + 1
+        total = sum(counts.values())
+        if total == 0 or len(counts) < 2:
+            return 0.0
+        entropy = -sum((c / total) * math.log(c / total) for c in counts.values())
+        return entropy / math.log(len(counts))
+
+    def _strengths(self, engagement, trend, row):
+        out = []
+        if engagement >= 80:
+            out.append(f"High engagement sessions ({engagement:.0f}% avg)")
+        if trend > 2:
+            out.append(f"Engagement improving (+{trend:.1f}% per session)")
+        if (row.total_sessions or 0) >= 10:
+            out.append(f"Consistent teaching record ({row.total_sessions} sessions)")
+        return out or ["Building session history"]
+
+    def _weaknesses(self, engagement, trend, row):
+        out = []
+        if row.total_sessions and engagement < 60:
+            out.append(f"Average engagement below 60% ({engagement:.0f}%)")
+        if trend < -2:
+            out.append(f"Engagement declining ({trend:.1f}% per session)")
+        return out
+
+    def _actions(self, engagement, trend):
+        if engagement < 60:
+            return ["Try interactive polls every 10 minutes", "Insert short activity breaks"]
+        if trend < -2:
+            return ["Revisit formats from your highest-engagement sessions", "Check in with declining students"]
+        return ["Challenge students with harder problems", "Gamify the next segment"]
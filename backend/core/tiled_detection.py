@@ -0,0 +1,169 @@
+"""
+Tiled face detection for rooms with more (and smaller) faces than one
+landmarker pass handles: MediaPipe finds at most MAX_FACES per image and
+shrinks the whole frame to its input size, so the back rows of a lecture
+hall come out a few pixels wide or not at all.
+
+The frame is split into an overlapping grid of tiles, optionally with a
+denser grid over its top part (the back of the room, seen from the front),
+and each tile goes through its own landmarker in a small thread pool
+(MediaPipe releases the GIL while it runs). Landmarks are shifted back to
+frame coordinates and the duplicates of faces seen by several tiles are
+merged: greedy NMS on intersection over the smaller box, preferring boxes
+that a tile edge did not cut. Emotions are then classified once for all
+faces. Enabled with DETECTION_TILES, e.g. "2x3" (rows x columns); see
+core/detectors.py.
+"""
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+from .metrics import stage, DETECTOR_ERRORS
+
+# DETECTION_TILES="RxC" turns tiling on; DETECTION_BACK_TILES adds a denser grid over the back of the room
+DETECTION_TILES = os.environ.get("DETECTION_TILES", "")
+DETECTION_BACK_TILES = os.environ.get("DETECTION_BACK_TILES", "")
+# Share of the frame height (from the top) the back grid covers
+BACK_FRACTION = 0.5
+# Overlap between neighbouring tiles, as a fraction of the tile size
+TILE_OVERLAP = 0.2
+# Faces per tile
+TILE_MAX_FACES = 20
+# Parallel landmarkers
+TILE_WORKERS = int(os.environ.get("DETECTION_TILE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Two boxes are the same face when this much of the smaller one overlaps the other
+MERGE_OVERLAP = 0.5
+
+def parse_grid(spec):
+    """'2x3' -> (2, 3); empty -> None."""
+    if not spec:
+        return None
+    rows, cols = (int(n) for n in spec.lower().split("x"))
+    if rows < 1 or cols < 1:
+        raise ValueError(f"Invalid tile grid '{spec}'")
+    return rows, cols
+
+def make_tiles(width, height, grid, overlap=TILE_OVERLAP, back_grid=None, back_fraction=BACK_FRACTION):
+    """
+    Tiles as (x0, y0, x1, y1): a rows x cols grid over the frame, each tile
+    grown by `overlap` of its size into its neighbours, plus back_grid over
+    the top back_fraction of the frame.
+    """
+    def grid_tiles(rows, cols, x_span, y_span):
+        tw, th = x_span / cols, y_span / rows
+        pad_x, pad_y = tw * overlap / 2, th * overlap / 2
+        tiles = []
+        for r in range(rows):
+            for c in range(cols):
+                x0 = max(0, int(c * tw - pad_x))
+                y0 = max(0, int(r * th - pad_y))
+                x1 = min(width, int((c + 1) * tw + pad_x))
+                y1 = min(y_span, int((r + 1) * th + pad_y))
+                tiles.append((x0, y0, x1, y1))
+        return tiles
+
+    tiles = grid_tiles(grid[0], grid[1], width, height)
+    if back_grid:
+        tiles += grid_tiles(back_grid[0], back_grid[1], width, int(height * back_fraction))
+    return tiles
+
+def merge_faces(boxes, scores, threshold=MERGE_OVERLAP):
+    """
+    Greedy NMS over [x, y, w, h] boxes using intersection over the smaller
+    area (a face cut by a tile edge sits inside its complete box, so plain
+    IoU would keep both). Returns the kept indices, best score first.
+    """
+    if not len(boxes):
+        return []
+    boxes = np.asarray(boxes, dtype=np.float64)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    area = np.maximum(boxes[:, 2] * boxes[:, 3], 1.0)
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+    keep = []
+    while len(order):
+        i, rest = order[0], order[1:]
+        keep.append(int(i))
+        iw = np.clip(np.minimum(x1[i], x1[rest]) - np.maximum(x0[i], x0[rest]), 0, None)
+        ih = np.clip(np.minimum(y1[i], y1[rest]) - np.maximum(y0[i], y0[rest]), 0, None)
+        overlap = iw * ih / np.minimum(area[i], area[rest])
+        order = rest[overlap <= threshold]
+    return keep
+
+class TiledDetector:
+    """
+    Drop-in for MediaPipeEmotionDetector (same detect() output) that runs
+    the landmarker on overlapping tiles.
+    """
+    def __init__(self, grid=(2, 3), back_grid=None, overlap=TILE_OVERLAP,
+                 workers=TILE_WORKERS, max_faces=TILE_MAX_FACES):
+        from .emotion_detector_v2 import MediaPipeEmotionDetector
+        self.grid = grid
+        self.back_grid = back_grid
+        self.overlap = overlap
+        self._tiles = {}  # frame (w, h) -> tiles
+        # MediaPipe landmarkers aren't safe to share between threads: one per worker
+        self.landmarkers = [MediaPipeEmotionDetector(num_faces=max_faces) for _ in range(max(1, workers))]
+        # Same attributes callers read on the wrapped class (detector is None when the model is missing)
+        self.detector = self.landmarkers[0].detector
+        self.classifier = self.landmarkers[0].classifier
+        self.last_error = None
+        self._free = queue.Queue()
+        for landmarker in self.landmarkers:
+            self._free.put(landmarker)
+        self._executor = ThreadPoolExecutor(len(self.landmarkers), thread_name_prefix="tile")
+
+    def tiles_for(self, width, height):
+        key = (width, height)
+        if key not in self._tiles:
+            self._tiles[key] = make_tiles(width, height, self.grid, self.overlap, self.back_grid)
+        return self._tiles[key]
+
+    def _detect_tile(self, frame, tile):
+        x0, y0, x1, y1 = tile
+        landmarker = self._free.get()
+        try:
+            faces = landmarker.detect_faces(np.ascontiguousarray(frame[y0:y1, x0:x1]))
+        finally:
+            self._free.put(landmarker)
+        for det in faces:
+            det['landmarks'] = det['landmarks'] + (x0, y0)
+        return faces
+
+    def detect(self, frame) -> List[Dict]:
+        if self.detector is None:
+            return []
+        h, w = frame.shape[:2]
+        tiles = self.tiles_for(w, h)
+        try:
+            with stage("tiled_detect"):
+                per_tile = list(self._executor.map(lambda t: self._detect_tile(frame, t), tiles))
+        except Exception as e:
+            DETECTOR_ERRORS.labels("mediapipe_tiled").inc()
+            self.last_error = str(e)
+            return []
+
+        with stage("tile_merge"):
+            faces, scores = [], []
+            for (x0, y0, x1, y1), found in zip(tiles, per_tile):
+                for det in found:
+                    points = det['landmarks']
+                    det['bbox'] = self.landmarkers[0].face_box(points, w, h)
+                    # Landmarks past the tile's inner edges mean the tile cut the face off
+                    inside = ((points[:, 0] >= x0) | (x0 == 0)) & ((points[:, 0] < x1) | (x1 == w)) \
+                        & ((points[:, 1] >= y0) | (y0 == 0)) & ((points[:, 1] < y1) | (y1 == h))
+                    faces.append(det)
+                    scores.append(det['bbox'][2] * det['bbox'][3] * inside.mean())
+            faces = [faces[i] for i in merge_faces([f['bbox'] for f in faces], scores)]
+        if faces:
+            with stage("emotion_classify"):
+                self.landmarkers[0]._classify(faces)
+        return faces
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for landmarker in self.landmarkers:
+            landmarker.close()
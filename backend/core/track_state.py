@@ -0,0 +1,131 @@
+"""
+Per-track temporal state: smoothed attention and emotion probabilities,
+and a hysteresis filter that only changes a track's emotion once a new
+label holds most of a short window. Updates are O(1) and return change
+events, so storage and recommendations can react to stable transitions
+instead of every frame.
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+from .attention import ATTENTION_TAU
+from .blendshape_emotion import EMOTION_TAU
+
+# A new emotion must hold this share of the last EMOTION_WINDOW frames to replace the current one
+EMOTION_WINDOW = 8
+EMOTION_SWITCH_RATIO = 0.6
+
+# Attention bands (upper bounds); a band change needs to clear the boundary by ATTENTION_MARGIN
+ATTENTION_BANDS = ((40.0, 'low'), (70.0, 'medium'), (float('inf'), 'high'))
+ATTENTION_MARGIN = 5.0
+
+# A track not updated for this long is reported lost and forgotten
+TRACK_LOST_SECONDS = 5.0
+
+def ema(prev, value, dt, tau):
+    """Exponential moving average on a real clock; works for scalars and arrays."""
+    alpha = 1.0 - math.exp(-max(dt, 0.0) / tau)
+    return prev + alpha * (value - prev)
+
+def attention_band(value):
+    for upper, name in ATTENTION_BANDS:
+        if value < upper:
+            return name
+    return ATTENTION_BANDS[-1][1]
+
+class TrackState:
+    __slots__ = ('track_id', 'attention', 'band', 'probs', 'emotion', 'confidence',
+                 'window', 'counts', 'first_seen', 'last_seen', 'last_logged')
+
+    def __init__(self, track_id, now):
+        self.track_id = track_id
+        self.attention = None
+        self.band = None
+        self.probs = None
+        self.emotion = None
+        self.confidence = 0.0
+        self.window = deque()
+        self.counts = {}
+        self.first_seen = now
+        self.last_seen = now
+        self.last_logged = None
+
+    def _push_label(self, label):
+        self.window.append(label)
+        self.counts[label] = self.counts.get(label, 0) + 1
+        if len(self.window) > EMOTION_WINDOW:
+            old = self.window.popleft()
+            self.counts[old] -= 1
+
+    def to_dict(self):
+        return {'id': self.track_id, 'emotion': self.emotion, 'attention': round(self.attention, 1),
+                'band': self.band}
+
+class TrackStates:
+    """All live tracks of one session/room."""
+    def __init__(self, attention_tau=ATTENTION_TAU, emotion_tau=EMOTION_TAU, lost_after=TRACK_LOST_SECONDS):
+        self.attention_tau = attention_tau
+        self.emotion_tau = emotion_tau
+        self.lost_after = lost_after
+        self.states = {}
+
+    def update(self, track_id, label, confidence, attention, now, probs=None, labels=None):
+        """
+        Fold one frame's observation into the track. probs/labels are the
+        classifier's per-class probabilities, when it provides them.
+        Returns (state, events).
+        """
+        events = []
+        state = self.states.get(track_id)
+        if state is None:
+            state = self.states[track_id] = TrackState(track_id, now)
+        dt = now - state.last_seen
+        state.last_seen = now
+
+        # Attention: EMA, then banded with hysteresis
+        state.attention = attention if state.attention is None else ema(state.attention, attention, dt, self.attention_tau)
+        band = attention_band(state.attention)
+        if state.band is None:
+            state.band = band
+        elif band != state.band:
+            crossed = attention_band(state.attention + ATTENTION_MARGIN) == attention_band(state.attention - ATTENTION_MARGIN)
+            if crossed:
+                events.append({'type': 'attention_change', 'id': track_id, 'from': state.band, 'to': band,
+                               'attention': round(state.attention, 1), 'ts': now})
+                state.band = band
+
+        # Emotion: smoothed probabilities give the frame label, the window decides the stable one
+        if probs is not None:
+            state.probs = probs.copy() if state.probs is None else ema(state.probs, probs, dt, self.emotion_tau)
+            k = int(np.argmax(state.probs))
+            label, confidence = labels[k], float(state.probs[k])
+        state._push_label(label)
+
+        if state.emotion is None:
+            state.emotion, state.confidence = label, confidence
+            events.append({'type': 'track_new', 'id': track_id, 'emotion': label,
+                           'attention': round(state.attention, 1), 'band': state.band, 'ts': now})
+        elif label != state.emotion and state.counts[label] >= EMOTION_SWITCH_RATIO * EMOTION_WINDOW:
+            events.append({'type': 'emotion_change', 'id': track_id, 'from': state.emotion, 'to': label, 'ts': now})
+            state.emotion, state.confidence = label, confidence
+        elif label == state.emotion:
+            state.confidence = confidence
+        elif probs is not None and state.emotion in labels:
+            # Holding the current label: report its own smoothed probability
+            state.confidence = float(state.probs[list(labels).index(state.emotion)])
+        return state, events
+
+    def expire(self, now):
+        """Forget tracks idle for longer than lost_after; returns 'track_lost' events."""
+        lost = [s for s in self.states.values() if now - s.last_seen > self.lost_after]
+        events = []
+        for s in lost:
+            del self.states[s.track_id]
+            events.append({'type': 'track_lost', 'id': s.track_id, 'emotion': s.emotion,
+                           'present': round(s.last_seen - s.first_seen, 1), 'ts': now})
+        return events
+
+    def reset(self):
+        self.states = {}
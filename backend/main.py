@@ -1,27 +1,77 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Response
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
-import cv2
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
 import asyncio
 import json
-import numpy as np
-import time
+import os
 from sqlalchemy.orm import Session
 from datetime import datetime
+from typing import Optional
 from pydantic import BaseModel
 
-from core.camera_service import CameraService
-from core.audio_analysis import AudioAnalyzer
-from core.database import init_db, get_db, SessionLocal
-from core.session_manager import SessionManager
-from core.llm_insights import InsightGenerator
-from core.analytics_service import AnalyticsService
-from core.report_generator import ReportGenerator
-from core.recommendations_engine import RecommendationsEngine
-from core.teacher_profiles import TeacherProfileService
-from core.gamification_engine import GamificationEngine
-from core.ai_suggestions import AISuggestionEngine
+from core.database import init_db, get_db
+from core.service_registry import ServiceRegistry
+from core.metrics import registry as metrics_registry, stage, FRAMES_PROCESSED, FRAMES_DROPPED
+from core.fusion import clock
+from core.engine import register_live_services, EngineUnavailable
 
-app = FastAPI(title="Multimodal Attendance & Attention Tracking Agent")
+# ENGINE_SOCKET=path: the camera and live sessions belong to a separate engine process
+# (python -m core.engine) reached over that Unix socket, so uvicorn can run several workers
+ENGINE_SOCKET = os.environ.get("ENGINE_SOCKET")
+# INFERENCE_WORKERS=N moves detection and tracking into N worker processes (0: in-process)
+INFERENCE_WORKERS = 0 if ENGINE_SOCKET else int(os.environ.get("INFERENCE_WORKERS", "0"))
+
+# Services (built lazily on first use; see ServiceRegistry)
+# Registration order is warm-up order: the video pipeline comes first.
+services = ServiceRegistry()
+if ENGINE_SOCKET:
+    services.register("live", "core.engine:EngineClient", ENGINE_SOCKET)
+else:
+    register_live_services(services, INFERENCE_WORKERS)
+    services.register("live", "core.engine:LiveEngine", services)
+services.register("audio_analyzer", "core.audio_analysis:AudioAnalyzer")
+services.register("analytics_service", "core.analytics_service:AnalyticsService")
+services.register("report_generator", "core.report_generator:ReportGenerator")
+services.register("teacher_profile_service", "core.teacher_profiles:TeacherProfileService")
+services.register("insight_generator", "core.llm_insights:InsightGenerator")
+services.register("ai_suggestion_engine", "core.ai_suggestions:AISuggestionEngine")
+services.register("maintenance", "core.maintenance:MetricsMaintenance")
+
+# Set WARM_UP_SERVICES=0 to build services only when a request needs them
+WARM_UP_SERVICES = os.environ.get("WARM_UP_SERVICES", "1") != "0"
+# Hours between metrics retention/compaction runs (0 disables; see core/maintenance.py)
+MAINTENANCE_INTERVAL_HOURS = float(os.environ.get("MAINTENANCE_INTERVAL_HOURS", "24"))
+# This process's open /ws/ingest rooms by room id, so /ws/audio can feed their sessions
+ingest_rooms = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(init_db)
+    # Teachers whose sessions predate the aggregate table (profile reads never write)
+    teacher_profile_service = await services.aget("teacher_profile_service")
+    await asyncio.to_thread(teacher_profile_service.backfill)
+    if WARM_UP_SERVICES:
+        # Runs after startup completes, so the server accepts requests meanwhile
+        asyncio.get_running_loop().run_in_executor(None, services.warm_up)
+    maintenance_task = None
+    # With an engine process, it runs the periodic jobs once for all workers
+    if MAINTENANCE_INTERVAL_HOURS > 0 and not ENGINE_SOCKET:
+        maintenance = await services.aget("maintenance")
+        maintenance_task = asyncio.create_task(maintenance.run_periodically(MAINTENANCE_INTERVAL_HOURS))
+    yield
+    if maintenance_task:
+        maintenance_task.cancel()
+    if ENGINE_SOCKET and services.is_ready("live"):
+        services.get("live").close()
+    if services.is_ready("inference_pool"):
+        services.get("inference_pool").close()
+
+app = FastAPI(title="Multimodal Attendance & Attention Tracking Agent", lifespan=lifespan)
+
+@app.exception_handler(EngineUnavailable)
+async def engine_unavailable(request: Request, exc: EngineUnavailable):
+    return JSONResponse({"detail": str(exc)}, status_code=503)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,20 +81,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Services
-camera = CameraService()
-audio_analyzer = AudioAnalyzer()
-session_manager = SessionManager()
-insight_generator = InsightGenerator()
-analytics_service = AnalyticsService()
-report_generator = ReportGenerator()
-recommendations_engine = RecommendationsEngine()
-teacher_profile_service = TeacherProfileService()
-gamification_engine = GamificationEngine()
-ai_suggestion_engine = AISuggestionEngine()
-
-init_db()
-
 class SessionStartRequest(BaseModel):
     teacher_id: str
     class_id: str
@@ -53,67 +89,114 @@ class SessionStartRequest(BaseModel):
 async def root():
     return {"message": "System is running", "status": "online"}
 
+@app.get("/metrics")
+async def get_metrics():
+    if not ENGINE_SOCKET:
+        return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+    # Capture, detection, tracking and DB flushes are timed in the engine process: add its series
+    try:
+        live = await services.aget("live")
+        engine = await live.metrics()
+    except EngineUnavailable:
+        engine = None
+    return PlainTextResponse(metrics_registry.render("api", engine), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/ready")
+async def health_ready():
+    status = services.status()
+    if ENGINE_SOCKET:
+        live = await services.aget("live")
+        try:
+            status['engine'] = await live.services_status()
+        except EngineUnavailable as e:
+            status['engine'] = {'ready': False, 'error': str(e)}
+        status['ready'] = status['ready'] and status['engine']['ready']
+    return JSONResponse(status, status_code=200 if status['ready'] else 503)
+
 # Phase 4: Teacher & Gamification Endpoints
 @app.get("/api/teacher/profile/{teacher_id}")
 async def get_teacher_profile(teacher_id: str):
-    return teacher_profile_service.get_profile(teacher_id)
+    teacher_profile_service = await services.aget("teacher_profile_service")
+    return await asyncio.to_thread(teacher_profile_service.get_profile, teacher_id)
 
 @app.get("/api/gamification/leaderboard")
 async def get_leaderboard():
-    return gamification_engine.get_leaderboard()
+    live = await services.aget("live")
+    return await live.leaderboard()
 
 @app.get("/api/suggestions/current")
 async def get_ai_suggestions():
+    live = await services.aget("live")
     # Generate based on current active session status
-    if not session_manager.active_session_id:
+    status = await live.status()
+    if not status['active']:
         return []
     
-    status = session_manager.get_status()
     # Adding mock aggregate metrics
     data = {
         'total_people': status['people_count'],
         'avg_attention': 75, # Mock, should calculate from GamificationEngine history or SessionManager
         'dominant_emotion': 'neutral'
     }
+    ai_suggestion_engine = await services.aget("ai_suggestion_engine")
     return ai_suggestion_engine.generate_suggestions(data)
 
 # Session Endpoints
 @app.post("/api/session/start")
 async def start_session(req: SessionStartRequest):
-    result = session_manager.start_session(req.teacher_id, req.class_id)
+    live = await services.aget("live")
+    result = await live.start_session(req.teacher_id, req.class_id)
     if result.get("status") == "error":
         raise HTTPException(status_code=500, detail=result.get("message"))
     return result
 
 @app.post("/api/session/stop")
 async def stop_session():
-    return session_manager.stop_session()
+    live = await services.aget("live")
+    result = await live.stop_session()
+    summary = result.get("summary")
+    if summary:
+        teacher_profile_service = await services.aget("teacher_profile_service")
+        await asyncio.to_thread(teacher_profile_service.update_effectiveness, summary["teacher_id"], summary)
+    if result.get("session_id"):
+        # Completed sessions never change; render the report now, off the loop
+        report_generator = await services.aget("report_generator")
+        report_generator.schedule_pdf(result["session_id"])
+    return result
 
 @app.get("/api/session/status")
 async def get_session_status():
-    return session_manager.get_status()
+    live = await services.aget("live")
+    return await live.status()
+
+@app.get("/api/camera/status")
+async def get_camera_status():
+    # Capture profile as applied by the driver, and recent capture latency
+    live = await services.aget("live")
+    return await live.camera_status()
 
 # Insights & Analytics Endpoints
 @app.get("/api/insights/student/{student_id}")
 async def get_student_insight(student_id: str):
-    if session_manager.active_session_id:
-        data = session_manager.person_history.get(student_id)
-        if data:
-            emotions = [e['label'] for e in data['emotions'][-10:]]
-            summary = {
-                "name": f"Student {student_id}",
-                "emotion_history": emotions,
-                "attention_scores": data['attention'][-10:]
-            }
-            return {"insight": insight_generator.generate_classroom_insight(summary)} # Reusing generic
+    live = await services.aget("live")
+    data = await live.person(student_id)
+    if data:
+        summary = {
+            "name": f"Student {student_id}",
+            "emotion_history": data['emotions'],
+            "attention_scores": data['attention']
+        }
+        insight_generator = await services.aget("insight_generator")
+        return {"insight": insight_generator.generate_classroom_insight(summary)} # Reusing generic
     return {"insight": "Student not found."}
 
 @app.get("/api/insights/classroom")
 async def get_classroom_insight():
-    if not session_manager.active_session_id:
+    live = await services.aget("live")
+    status = await live.status()
+    if not status['active']:
         return {"insight": "No active session."}
     
-    status = session_manager.get_status()
     # Mock aggregation for now (real aggregation in future)
     summary = {
         "total_people": status['people_count'],
@@ -121,89 +204,335 @@ async def get_classroom_insight():
         "avg_attention": 75,
         "audio_db": 45
     }
+    insight_generator = await services.aget("insight_generator")
     return insight_generator.generate_classroom_insight(summary)
 
 @app.get("/api/analytics/trends/{session_id}")
 async def get_trends(session_id: int):
+    analytics_service = await services.aget("analytics_service")
     return analytics_service.get_session_trends(session_id)
 
+@app.get("/api/analytics/fused/{session_id}")
+async def get_fused_timeline(session_id: int, bucket_seconds: int = 10):
+    # Attention joined with room audio per bucket, with the combined engagement score
+    if bucket_seconds <= 0:
+        raise HTTPException(status_code=400, detail="bucket_seconds must be positive")
+    analytics_service = await services.aget("analytics_service")
+    return await asyncio.to_thread(analytics_service.get_fused_timeline, session_id, bucket_seconds)
+
+@app.get("/api/analytics/heatmap/{session_id}")
+async def get_engagement_heatmap(session_id: int):
+    # Attention per region of the frame (row 0 = back of the room): live for the active session, else as saved
+    live = await services.aget("live")
+    heatmap = await live.heatmap(session_id)
+    if heatmap is None:
+        analytics_service = await services.aget("analytics_service")
+        heatmap = await asyncio.to_thread(analytics_service.get_engagement_heatmap, session_id)
+        if heatmap is None:
+            raise HTTPException(status_code=404, detail="No heatmap for this session")
+        return {'session_id': session_id, 'live': False, **heatmap}
+    return {'session_id': session_id, 'live': True, **heatmap}
+
+@app.get("/api/analytics/history")
+async def get_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    student_id: Optional[str] = None,
+    session_ids: Optional[str] = None
+):
+    # Per-session attention/emotion stats across live and archived sessions
+    ids = None
+    if session_ids:
+        try:
+            ids = [int(x) for x in session_ids.split(",") if x.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="session_ids must be a comma-separated list of integers")
+    analytics_service = await services.aget("analytics_service")
+    return await asyncio.to_thread(analytics_service.get_history, start, end, student_id, ids)
+
+@app.post("/api/archive/run")
+async def run_archive(older_than_days: int = 7):
+    # Moves metrics of completed sessions older than this out of SQLite (see core/archive.py)
+    analytics_service = await services.aget("analytics_service")
+    archived = await asyncio.to_thread(analytics_service.archive.archive_completed, older_than_days)
+    return {"archived": archived}
+
+@app.post("/api/maintenance/run")
+async def run_maintenance(full_vacuum: bool = False):
+    # Compacts old metrics into 10 s / 1 min buckets, then vacuums; full_vacuum rewrites the DB file once
+    maintenance = await services.aget("maintenance")
+    report = await asyncio.to_thread(maintenance.run, None, full_vacuum)
+    if report is None:
+        raise HTTPException(status_code=409, detail="Maintenance is already running")
+    return report
+
+@app.get("/api/maintenance/status")
+async def maintenance_status():
+    maintenance = await services.aget("maintenance")
+    return {'running': maintenance.lock.locked(), 'last_report': maintenance.last_report}
+
 @app.get("/api/reports/export/{session_id}/pdf")
-async def export_pdf(session_id: int):
-    pdf_buffer = report_generator.generate_pdf_report(session_id)
-    if not pdf_buffer:
+async def export_pdf(session_id: int, request: Request):
+    report_generator = await services.aget("report_generator")
+    report = await asyncio.wrap_future(report_generator.submit_pdf(session_id))
+    if not report:
         raise HTTPException(status_code=404, detail="Session not found")
-    return Response(content=pdf_buffer.read(), media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename=report_{session_id}.pdf"})
 
-@app.get("/api/reports/export/{session_id}/csv")
-async def export_csv(session_id: int):
-    csv_data = report_generator.generate_csv_export(session_id)
-    if not csv_data:
-        raise HTTPException(status_code=404, detail="Session not found")
-    return Response(content=csv_data, media_type="text/csv", headers={"Content-Disposition": f"attachment; filename=report_{session_id}.csv"})
+    etag = f'"{report.etag}"'
+    headers = {"ETag": etag, "Content-Disposition": f"attachment; filename=report_{session_id}.pdf"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    if report.path:
+        return FileResponse(report.path, media_type="application/pdf", headers=headers)
+    headers["Cache-Control"] = "no-cache"
+    return Response(content=report.content, media_type="application/pdf", headers=headers)
+
+async def _streaming_export(fmt: str, filename: str, session_ids=None, start=None, end=None):
+    report_generator = await services.aget("report_generator")
+    if fmt not in report_generator.export_formats:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{fmt}'")
+    if not await asyncio.to_thread(report_generator.has_metrics, session_ids, start, end):
+        raise HTTPException(status_code=404, detail="No metrics found")
+    media_type, ext = report_generator.export_formats[fmt]
+    return StreamingResponse(
+        report_generator.iter_export(fmt, session_ids, start, end),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}.{ext}"}
+    )
+
+@app.get("/api/reports/export/{session_id}/{fmt}")
+async def export_session(session_id: int, fmt: str):
+    return await _streaming_export(fmt, f"report_{session_id}", session_ids=[session_id])
+
+@app.get("/api/reports/export")
+async def export_range(
+    format: str = "csv",
+    session_ids: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    # Multi-session / date-range export, e.g. ?session_ids=3,4,7 or ?start=2026-01-01&end=2026-02-01
+    ids = None
+    if session_ids:
+        try:
+            ids = [int(x) for x in session_ids.split(",") if x.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="session_ids must be a comma-separated list of integers")
+    if not ids and not start and not end:
+        raise HTTPException(status_code=400, detail="Provide session_ids or a start/end range")
+    return await _streaming_export(format, "report_export", session_ids=ids, start=start, end=end)
 
 # WebSockets
 @app.websocket("/ws/video")
 async def video_endpoint(websocket: WebSocket):
+    # Frames are processed once by the live engine and shared by every viewer
+    await websocket.accept()
+    live = await services.aget("live")
+    frames = live.frames()
+    try:
+        async for jpeg, text in frames:
+            with stage("send"):
+                await websocket.send_bytes(jpeg)
+                await websocket.send_text(text)
+    except WebSocketDisconnect:
+        print("Video Client disconnected")
+    except Exception as e:
+        print(f"Video Error: {e}")
+    finally:
+        await frames.aclose()
+
+@app.websocket("/ws/ingest/{room_id}")
+async def ingest_endpoint(websocket: WebSocket, room_id: str):
+    """
+    Push-based feed: the client sends frames (or detections) and gets the
+    room's metrics back. Each connection gets its own tracker and session.
+    """
     await websocket.accept()
+    from core.ingest import IngestRoom
+    live = await services.aget("live")
     try:
-        camera.start()
-    except:
-        pass 
+        config = json.loads(await websocket.receive_text())
+        pool = await services.aget("inference_pool") if INFERENCE_WORKERS else None
+        room = await asyncio.to_thread(IngestRoom, room_id, config, pool)
+    except Exception as e:
+        await websocket.close(code=1003, reason=str(e)[:120])
+        return
+    ingest_rooms[room_id] = room
+
+    # Single-slot mailbox: if processing falls behind, stale frames are dropped
+    latest = {}
+    ready = asyncio.Event()
+    state = {'dropped': 0, 'closed': False}
+
+    async def receiver():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                seq, payload = room.decode(message)
+                if 'payload' in latest:
+                    state['dropped'] += 1
+                    FRAMES_DROPPED.labels("stale").inc()
+                latest['seq'], latest['payload'] = seq, payload
+                ready.set()
+        except Exception as e:
+            print(f"Ingest receive error ({room_id}): {e}")
+        finally:
+            state['closed'] = True
+            ready.set()
 
+    recv_task = asyncio.create_task(receiver())
     try:
         while True:
-            frame = camera.get_frame()
-            if frame is None:
-                await asyncio.sleep(0.1)
+            await ready.wait()
+            ready.clear()
+            if state['closed']:
+                break
+            if 'payload' not in latest:
                 continue
-            
-            processed_frame, metrics = session_manager.process_frame(frame)
-            
-            # Phase 4: Gamification & Suggestions Real-time
-            leaderboard = gamification_engine.process_frame_points(metrics)
-            metrics['leaderboard'] = leaderboard[:5] # Top 5
-            
-            # Generate Recommendations
-            recs = recommendations_engine.generate_realtime_recommendations(metrics)
-            metrics['recommendations'] = recs
-            
-            _, buffer = cv2.imencode('.jpg', processed_frame)
-            await websocket.send_bytes(buffer.tobytes())
+            seq, payload = latest['seq'], latest.pop('payload')
+            with stage("ingest_frame"):
+                if room.pool:
+                    metrics = await room.process_pooled(payload)
+                else:
+                    metrics = await asyncio.to_thread(room.process, payload)
+            FRAMES_PROCESSED.inc()
+            await live.publish(room.session_manager.active_session_id, metrics,
+                               {'people_count': len(room.session_manager.person_history)})
+            metrics['seq'] = seq
+            metrics['dropped'] = state['dropped']
             await websocket.send_text(json.dumps(metrics))
-            await asyncio.sleep(0.033)
-            
     except WebSocketDisconnect:
-        print("Video Client disconnected")
+        pass
     except Exception as e:
-        print(f"Video Error: {e}")
+        print(f"Ingest Error ({room_id}): {e}")
+    finally:
+        recv_task.cancel()
+        if ingest_rooms.get(room_id) is room:
+            del ingest_rooms[room_id]
+        session_id = room.session_manager.active_session_id
+        await asyncio.to_thread(room.close)
+        if session_id:
+            await live.end_analytics(session_id)
+
+@app.websocket("/ws/analytics/{session_id}")
+async def analytics_endpoint(websocket: WebSocket, session_id: int):
+    """
+    Pushes a session's analytics: a snapshot on connect, then each closed
+    time bucket and status change as it happens (see core/analytics_hub.py).
+    Sessions that aren't live get a single snapshot from storage.
+    """
+    await websocket.accept()
+    live = await services.aget("live")
+    feed = await live.analytics(session_id)
+    if feed is None:
+        analytics_service = await services.aget("analytics_service")
+        trends = await asyncio.to_thread(analytics_service.get_session_trends, session_id)
+        await websocket.send_text(json.dumps({'type': 'snapshot', 'session_id': session_id, 'live': False,
+                                              'buckets': trends, 'status': {}}))
+        await websocket.close()
+        return
+
+    async def receiver():
+        # Dashboards don't send anything; this only notices the disconnect
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    recv_task = asyncio.create_task(receiver())
+    try:
+        while True:
+            get_task = asyncio.ensure_future(anext(feed, ('end', None)))
+            done, _ = await asyncio.wait({get_task, recv_task}, return_when=asyncio.FIRST_COMPLETED)
+            if get_task not in done:
+                get_task.cancel()
+                # Let the feed unwind before it is closed below
+                await asyncio.wait({get_task})
+                break
+            kind, text = get_task.result()
+            if text is not None:
+                await websocket.send_text(text)
+            if kind == 'end':
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Analytics feed error ({session_id}): {e}")
+    finally:
+        recv_task.cancel()
+        await feed.aclose()
 
 @app.websocket("/ws/audio")
 async def audio_endpoint(websocket: WebSocket):
+    """
+    Microphone feed. An optional first text message declares the format
+    (see core/audio_ingest.py); binary without one is float32 at 16 kHz.
+    A "room_id" in that message binds the stream to an open /ws/ingest
+    room's session instead of the camera's. Rooms live in the worker that
+    accepted their feed, so with several uvicorn workers the audio has to
+    reach the same worker (e.g. sticky routing by room id).
+    """
     await websocket.accept()
-    db = SessionLocal()
-    last_db_log = 0
+    from core.audio_ingest import AudioStream, negotiate, LEGACY_FORMAT, WINDOW_SECONDS
+    audio_analyzer = await services.aget("audio_analyzer")
+    live = await services.aget("live")
+
+    first = await websocket.receive()
+    if first["type"] == "websocket.disconnect":
+        return
     try:
+        text = first.get("text")
+        config = json.loads(text) if text is not None else {}
+        fmt = negotiate(config) if text is not None else dict(LEGACY_FORMAT)
+        room_id = config.get("room_id")
+        if room_id is not None:
+            room_id = str(room_id)
+            if room_id not in ingest_rooms:
+                raise ValueError(f"Unknown room: {room_id}")
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        await websocket.close(code=1003, reason=str(e)[:120])
+        return
+    stream = AudioStream(fmt, audio_analyzer.sample_rate)
+    if first.get("text") is not None:
+        await websocket.send_json({'type': 'format', **fmt, 'analysis_rate': audio_analyzer.sample_rate})
+
+    try:
+        data = first.get("bytes")
         while True:
-            data = await websocket.receive_bytes()
-            audio_array = np.frombuffer(data, dtype=np.float32)
-            metrics = audio_analyzer.analyze_audio_chunk(audio_array)
-            if metrics:
+            if data is None:
+                data = await websocket.receive_bytes()
+            now = clock()
+            with stage("audio_decode"):
+                windows = stream.feed(data)
+            data = None
+            if not windows:
+                continue
+            # One thread hop per message: the analysis is numpy work that would stall the loop
+            results = await asyncio.to_thread(
+                lambda: [audio_analyzer.analyze_audio_chunk(window) for window, _ in windows]
+            )
+            analyzed = []
+            for (_, lag), metrics in zip(windows, results):
+                if not metrics:
+                    continue
                 await websocket.send_json(metrics)
-                if session_manager.active_session_id and (time.time() - last_db_log > 5.0):
-                    from core.database import AudioMetric
-                    db_metric = AudioMetric(
-                        session_id=str(session_manager.active_session_id),
-                        noise_db=metrics['noise_db'],
-                        speech_ratio=0.0, 
-                        activity_type=metrics['activity_type']
-                    )
-                    db.add(db_metric)
-                    db.commit()
-                    last_db_log = time.time()
+                # Stamped at the window's midpoint on the clock video frames use
+                analyzed.append((now - lag - WINDOW_SECONDS / 2, metrics))
+            # Joined with the room's video, and logged per 5 s while its session is active
+            if not analyzed:
+                continue
+            if room_id is None:
+                await live.add_audio(now, analyzed)
+            elif room_id in ingest_rooms:
+                session_manager = ingest_rooms[room_id].session_manager
+                due = session_manager.add_audio(now, analyzed)
+                if due:
+                    await asyncio.to_thread(session_manager.log_audio, due[0], now, due[1])
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         print(f"Audio Error: {e}")
-    finally:
-        db.close()
 
 if __name__ == "__main__":
     import uvicorn
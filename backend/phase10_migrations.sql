@@ -0,0 +1,11 @@
+-- Per-session attention grid over the camera frame, saved when a session stops (see core/heatmap.py)
+CREATE TABLE IF NOT EXISTS session_heatmaps (
+    session_id INTEGER PRIMARY KEY REFERENCES sessions(id),
+    rows INTEGER,
+    cols INTEGER,
+    frame_width INTEGER,
+    frame_height INTEGER,
+    attention_sum TEXT,
+    engagement_sum TEXT,
+    counts TEXT
+);
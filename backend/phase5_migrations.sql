@@ -0,0 +1,18 @@
+-- Index for streaming per-session / multi-session exports
+CREATE INDEX IF NOT EXISTS ix_person_metrics_session_id ON person_metrics(session_id);
+CREATE INDEX IF NOT EXISTS ix_student_points_session_id ON student_points(session_id);
+
+-- Teacher profile aggregates (maintained per completed session)
+CREATE INDEX IF NOT EXISTS ix_sessions_teacher_id ON sessions(teacher_id);
+
+CREATE TABLE IF NOT EXISTS teacher_student_stats (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    teacher_id VARCHAR(50),
+    person_id VARCHAR,
+    sessions INTEGER DEFAULT 0,
+    avg_attention FLOAT DEFAULT 0.0,
+    last_attention FLOAT DEFAULT 0.0,
+    last_change FLOAT DEFAULT 0.0
+);
+CREATE INDEX IF NOT EXISTS ix_teacher_student_stats_teacher_id ON teacher_student_stats(teacher_id);
+CREATE INDEX IF NOT EXISTS ix_teacher_student_stats_person_id ON teacher_student_stats(person_id);
@@ -0,0 +1,12 @@
+-- Presence intervals and attendance status per student (see core/presence.py)
+CREATE TABLE IF NOT EXISTS session_presence (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER,
+    person_id VARCHAR,
+    status VARCHAR,
+    first_seen FLOAT DEFAULT 0.0,
+    intervals TEXT,
+    track_ids VARCHAR
+);
+CREATE INDEX IF NOT EXISTS ix_session_presence_session_id ON session_presence(session_id);
+CREATE INDEX IF NOT EXISTS ix_session_presence_person_id ON session_presence(person_id);
@@ -0,0 +1,8 @@
+-- Sessions whose person/audio metrics moved to the columnar archive (see core/archive.py)
+CREATE TABLE IF NOT EXISTS archived_sessions (
+    session_id INTEGER PRIMARY KEY,
+    day VARCHAR(10),
+    person_rows INTEGER DEFAULT 0,
+    audio_rows INTEGER DEFAULT 0,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,15 @@
+-- Retention tiers for the metrics tables (see core/maintenance.py)
+CREATE TABLE IF NOT EXISTS maintenance_watermarks (
+    table_name VARCHAR(50) NOT NULL,
+    bucket_seconds INTEGER NOT NULL,
+    done_until DATETIME,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, bucket_seconds)
+);
+-- Compaction selects rows by time window
+CREATE INDEX IF NOT EXISTS ix_person_metrics_timestamp ON person_metrics(timestamp);
+CREATE INDEX IF NOT EXISTS ix_audio_metrics_timestamp ON audio_metrics(timestamp);
+CREATE INDEX IF NOT EXISTS ix_emotion_metrics_timestamp ON emotion_metrics(timestamp);
+-- Lets maintenance release free pages incrementally; takes effect after one VACUUM
+PRAGMA auto_vacuum = INCREMENTAL;
+VACUUM;
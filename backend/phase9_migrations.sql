@@ -0,0 +1,23 @@
+-- audio_metrics.session_id becomes an INTEGER key like person_metrics.session_id (see core/fusion.py).
+-- SQLite can't change a column type in place, so the table is rebuilt; rows logged
+-- under a non-numeric session key (e.g. 'live_session') get a NULL session_id.
+CREATE TABLE audio_metrics_new (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER REFERENCES sessions(id),
+    noise_db FLOAT,
+    speech_ratio FLOAT,
+    activity_type VARCHAR,
+    timestamp DATETIME
+);
+INSERT INTO audio_metrics_new (id, session_id, noise_db, speech_ratio, activity_type, timestamp)
+SELECT id,
+       CASE WHEN session_id GLOB '[0-9]*' AND session_id NOT GLOB '*[^0-9]*' THEN CAST(session_id AS INTEGER) END,
+       noise_db, speech_ratio, activity_type, timestamp
+FROM audio_metrics;
+DROP TABLE audio_metrics;
+ALTER TABLE audio_metrics_new RENAME TO audio_metrics;
+CREATE INDEX IF NOT EXISTS ix_audio_metrics_id ON audio_metrics(id);
+CREATE INDEX IF NOT EXISTS ix_audio_metrics_session_id ON audio_metrics(session_id);
+CREATE INDEX IF NOT EXISTS ix_audio_metrics_timestamp ON audio_metrics(timestamp);
+CREATE INDEX IF NOT EXISTS ix_audio_metrics_session_time ON audio_metrics(session_id, timestamp);
+CREATE INDEX IF NOT EXISTS ix_person_metrics_session_time ON person_metrics(session_id, timestamp);